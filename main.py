@@ -5,6 +5,7 @@ if __name__ == "__main__":
     # Get host and port from environment or use defaults
     host = os.getenv("HOST", "localhost")
     port = int(os.getenv("PORT", 8000))
+    workers = int(os.getenv("WORKERS", 4))
     
     # Run with production settings
     app.run(
@@ -12,5 +13,5 @@ if __name__ == "__main__":
         port=port,
         debug=False,
         access_log=True,
-        workers=4
+        workers=workers
     )
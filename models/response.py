@@ -1,4 +1,27 @@
+import json
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
+from sanic import Request
 from sanic.response import JSONResponse
+from utils.compression import add_vary
+from utils.listing import InvalidQueryParameter
+from utils.metrics import stage
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is optional
+    msgpack = None
+
+
+JSON_MIME = "application/json"
+MSGPACK_MIMES = ("application/msgpack", "application/x-msgpack")
+NDJSON_MIME = "application/x-ndjson"
+_STREAM_FORMATS = ("ndjson", "json")
+
+
+def _msgpack_dumps(body: dict) -> bytes:
+    # Anything msgpack can't represent natively (dates, enums) falls back to its string form
+    return msgpack.packb(body, default=str, use_bin_type=True)
 
 
 class Response(JSONResponse):
@@ -7,8 +30,101 @@ class Response(JSONResponse):
         ok: bool = False,
         data: dict = None,
         status: int = 200,
+        max_age: int = None,
+        error: str = None,
+        next_cursor: str = None,
+        version: int = None,
     ):
-        super().__init__({
+        body = {
             "ok": ok,
             "data": data,
-        }, status=status)
+        }
+        if error is not None:
+            body["error"] = error
+        if next_cursor is not None:
+            body["next_cursor"] = next_cursor
+        if version is not None:
+            body["version"] = version
+        with stage("serialize", format="json"):
+            super().__init__(body, status=status)
+        # How long clients and CDNs may reuse a successful response without revalidating
+        self.max_age = max_age if ok else None
+
+    def negotiate(self: "Response", request: Request) -> "Response":
+        """Re-encode the envelope in the format preferred by the client's Accept header
+
+        JSON stays the default; MessagePack is only used when the client asks for it
+        (and prefers it over JSON) and msgpack is installed.
+        """
+        # Shared caches must key on the Accept header since the body depends on it
+        add_vary(self.headers, "Accept")
+        if msgpack is None:
+            return self
+
+        mime = request.accept.match(JSON_MIME, *MSGPACK_MIMES)
+        if str(mime) in MSGPACK_MIMES:
+            with stage("serialize", format="msgpack"):
+                self.set_body(self.raw_body, dumps=_msgpack_dumps)
+            self.content_type = str(mime)
+        return self
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def stream_format(request: Request) -> Optional[str]:
+    """How the client asked for a list to be streamed, if at all
+
+    `?stream=ndjson` (or an Accept header preferring application/x-ndjson) gets one
+    object per line, `?stream=json` gets the usual envelope sent piece by piece.
+    """
+    requested = request.args.get("stream")
+    if requested is not None:
+        if requested not in _STREAM_FORMATS:
+            raise InvalidQueryParameter("Invalid stream, expected ndjson or json")
+        return requested
+    if str(request.accept.match(JSON_MIME, NDJSON_MIME)) == NDJSON_MIME:
+        return "ndjson"
+    return None
+
+
+async def send_stream(request: Request, rows: AsyncIterator[dict], format: str = "json") -> None:
+    """Send `rows` to the client as they are produced instead of building the whole body
+
+    Nothing is sent until the first row is in, so a request that fails outright still
+    gets a proper error status. Once streaming has started a failure can only be
+    reported in the body: as a final `{"ok": false, "error": ...}` line for NDJSON, or
+    in the envelope, which is written with `data` first so `ok` can come last.
+    """
+    async with aclosing(rows):
+        row = await anext(rows, None)
+        response = await request.respond(
+            content_type=NDJSON_MIME if format == "ndjson" else JSON_MIME,
+            headers={"vary": "Accept"},
+        )
+        if format == "json":
+            await response.send('{"data":[')
+
+        count = 0
+        error = None
+        while row is not None:
+            if format == "ndjson":
+                await response.send(_dumps(row) + "\n")
+            else:
+                await response.send(("," if count else "") + _dumps(row))
+            count += 1
+            try:
+                row = await anext(rows, None)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                break
+
+        if format == "ndjson":
+            if error is not None:
+                await response.send(_dumps({"ok": False, "error": error}) + "\n")
+        elif error is not None:
+            await response.send("]," + _dumps({"ok": False, "error": error})[1:])
+        else:
+            await response.send('],"ok":true}')
+        await response.eof()
@@ -1,3 +1,4 @@
+import re
 from typing import Optional
 from dataclasses import dataclass
 from datetime import date
@@ -29,17 +30,20 @@ class EventType(Enum):
     
     @classmethod
     def from_id(cls, id: int) -> "EventType":
-        for event_type in cls:
-            if event_type.value == id:
-                return event_type
-        raise ValueError(f"Invalid event type ID: {id}")
+        event_type = _EVENT_TYPES_BY_ID.get(id)
+        if event_type is None:
+            raise ValueError(f"Invalid event type ID: {id}")
+        return event_type
     
     @classmethod
     def from_alias(cls, alias: str) -> "EventType":
-        for event_type in cls:
-            if event_type.alias == alias:
-                return event_type
-        raise ValueError(f"Invalid event type alias: {alias}")
+        event_type = _EVENT_TYPES_BY_ALIAS.get(alias)
+        if event_type is None:
+            raise ValueError(f"Invalid event type alias: {alias}")
+        return event_type
+
+_EVENT_TYPES_BY_ID = {event_type.value: event_type for event_type in EventType}
+_EVENT_TYPES_BY_ALIAS = {event_type.alias: event_type for event_type in EventType}
 
 Status = Literal["in_progress", "on_deck", "in_hole"]
 
@@ -101,6 +105,56 @@ class Tournament(BaseClass):
         }
     
 
+def _normalize_text(value: Optional[str]) -> str:
+    return " ".join(value.split()) if value else ""
+
+
+_SEARCH_TEXT_FIELDS = ("name", "state", "city", "team_name", "last_name", "first_name")
+
+
+@dataclass(frozen=True, eq=False)
+class TournamentSearch(BaseClass):
+    """A tournament search on Login.jsp, equal to any other differing only in case or whitespace
+
+    Text is sent upstream as typed, with whitespace collapsed; case is only folded to
+    compare and hash searches, so equivalent ones share a cache entry.
+    """
+    name: str = ""
+    state: str = ""
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    city: str = ""
+    team_name: str = ""
+    last_name: str = ""
+    first_name: str = ""
+
+    def __post_init__(self: "TournamentSearch"):
+        for field in _SEARCH_TEXT_FIELDS:
+            object.__setattr__(self, field, _normalize_text(getattr(self, field)))
+
+    @property
+    def key(self: "TournamentSearch") -> tuple:
+        return (*(getattr(self, field).casefold() for field in _SEARCH_TEXT_FIELDS), self.start_date, self.end_date)
+
+    def __eq__(self: "TournamentSearch", other: object) -> bool:
+        return isinstance(other, TournamentSearch) and self.key == other.key
+
+    def __hash__(self: "TournamentSearch") -> int:
+        return hash(self.key)
+
+    def as_params(self: "TournamentSearch") -> dict:
+        return {
+            "tName": self.name,
+            "state": self.state,
+            "sDate": self.start_date.strftime("%m/%d/%Y") if self.start_date else "",
+            "eDate": self.end_date.strftime("%m/%d/%Y") if self.end_date else "",
+            "lastName": self.last_name,
+            "firstName": self.first_name,
+            "teamName": self.team_name,
+            "city": self.city,
+        }
+    
+
 # BRACKETS
 # @dataclass
 # class Weight(BaseClass):
@@ -165,4 +219,43 @@ class BracketData(BaseClass):
     templates: List[Template]
     bracket_types: List[BracketType]
 
+@dataclass
+class BoutResult(BaseClass):
+    round: str
+    winner: str
+    winner_team: str
+    loser: str
+    loser_team: str
+    win_type: str
+    score: str
+
+    @property
+    def consolation(self) -> bool:
+        return self.round.lower().startswith("cons")
+
+    @property
+    def place(self) -> Optional[int]:
+        """The place the winner takes if this is a placement match"""
+        found = re.match(r"(\d+)(?:st|nd|rd|th) Place", self.round)
+        return int(found.group(1)) if found else None
+
+@dataclass
+class Placement(BaseClass):
+    place: int
+    wrestler: str
+    team: str
 
+@dataclass
+class BracketResults(BaseClass):
+    weight_id: int
+    bouts: List[BoutResult]
+
+    @property
+    def placements(self) -> List[Placement]:
+        """Places decided so far, both wrestlers of a placement match having placed"""
+        found = []
+        for bout in self.bouts:
+            if bout.place is not None:
+                found.append(Placement(bout.place, bout.winner, bout.winner_team))
+                found.append(Placement(bout.place + 1, bout.loser, bout.loser_team))
+        return sorted(found, key=lambda p: p.place)
@@ -1,10 +1,81 @@
+import os
 import re
+import asyncio
+from itertools import islice
+from contextlib import aclosing
 from bs4 import BeautifulSoup
-from typing import List, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from utils import _get_timestamp
+from utils.cache import LRUCache
 from datetime import datetime, date
-from models.ttypes import Tournament, Wrestler, Match, Team, EventType, Status, Template, Weight, BracketType, BracketPage, BracketData, Division
+from models.ttypes import Tournament, TournamentSearch, Wrestler, Match, Team, EventType, Status, Template, Weight, BracketType, BracketPage, BracketData, Division, BoutResult, BracketResults
 from utils.session_manager import session_manager
+from utils.bracket_versions import bracket_versions
+from utils.archive import archives, bracket_member, BRACKET_VIEWER, HUB, MAT_BOARD
+from utils.upstream import upstream, UpstreamUnavailable, BASE_URL
+from utils.scheduler import Priority, current_priority, priority
+from utils.metrics import stage
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 300))
+_search_cache = LRUCache(max_entries=512, ttl=SEARCH_CACHE_TTL, name="search")
+
+# Seconds a tournament upstream reported as missing is answered as such without asking again
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", 60))
+_missing_tournaments = LRUCache(max_entries=4096, ttl=NEGATIVE_CACHE_TTL, name="missing_tournaments")
+# Latest hub info of tournaments upstream has, so other pages only check an id once
+_found_tournaments = LRUCache(max_entries=4096, name="found_tournaments")
+# Hub fetches checking an id, shared by everyone waiting on the same one
+_checking: Dict[Tuple[EventType, int], asyncio.Future] = {}
+
+# BeautifulSoup tree builder, e.g. lxml; check it with tools/differential.py before switching
+HTML_PARSER = os.getenv("HTML_PARSER", "html.parser")
+
+# Brackets fetched at once per bulk export
+BRACKET_EXPORT_CONCURRENCY = int(os.getenv("BRACKET_EXPORT_CONCURRENCY", 4))
+
+
+class TournamentNotFound(Exception):
+    def __init__(self, tournament_type: EventType, tournament_id: int):
+        super().__init__(f"Tournament {tournament_type.alias}/{tournament_id} not found")
+        self.tournament_type = tournament_type
+        self.tournament_id = tournament_id
+
+
+class TournamentNotFinished(Exception):
+    def __init__(self, tournament_type: EventType, tournament_id: int):
+        super().__init__(f"Tournament {tournament_type.alias}/{tournament_id} hasn't finished yet")
+        self.tournament_type = tournament_type
+        self.tournament_id = tournament_id
+
+
+def _check_not_missing(tournament_type: EventType, tournament_id: int) -> None:
+    if (tournament_type, tournament_id) in _missing_tournaments:
+        raise TournamentNotFound(tournament_type, tournament_id)
+
+async def _check_exists(tournament_type: EventType, tournament_id: int) -> None:
+    """Make sure upstream has the tournament before asking for anything but its hub
+
+    The hub is the only page that tells a missing tournament apart, so it is
+    fetched once per id; concurrent callers wait on the same fetch.
+    """
+    _check_not_missing(tournament_type, tournament_id)
+    key = (tournament_type, tournament_id)
+    if _found_tournaments.get_stale(key) is not None:
+        return
+    checking = _checking.get(key)
+    if checking is None:
+        checking = _checking[key] = asyncio.ensure_future(get_tournament_info(tournament_type, tournament_id))
+        checking.add_done_callback(lambda task: _checking.pop(key, None) and (task.cancelled() or task.exception()))
+    # A waiter going away doesn't call the check off for the others
+    await asyncio.shield(checking)
+
+def found_tournament(tournament_id: int) -> Optional[Tournament]:
+    """The tournament's hub info as last fetched by this worker, whatever its type, if it was"""
+    for tournament_type in EventType:
+        tournament = _found_tournaments.get_stale((tournament_type, tournament_id))
+        if tournament is not None:
+            return tournament
+    return None
 
 def _parse_date_range(date_str: str) -> tuple[date, date | None]:
     parts = date_str.split(" - ")
@@ -42,71 +113,148 @@ def _parse_venue_address(address_text: str) -> tuple[str, str, str, str, str]:
     return venue_name, street, city, state, zip_code
 
 
-def _parse_tournaments(html_content: str) -> List[Tournament]:
-    soup = BeautifulSoup(html_content, "html.parser")
-    tournaments = []
+def _parse_tournament_item(item) -> Optional[Tournament]:
+    anchor = item.select_one('a[href*="eventSelected"]')
+    onclick = anchor.get("href", "")
+    event_info = re.search(r"eventSelected\((.*?)\)", onclick)
+    if not event_info:
+        return None
 
-    tournament_items = soup.select(".tournament-ul > li")
+    params = event_info.group(1).split(",")
+    tournament_id = int(params[0])
+    name = params[1].strip("'")
+    event_type = EventType.from_id(int(params[2]))
+    logo_url = params[3].strip(" '")
 
-    for item in tournament_items:
-        try:
-            anchor = item.select_one('a[href*="eventSelected"]')
-            onclick = anchor.get("href", "")
-            event_info = re.search(r"eventSelected\((.*?)\)", onclick)
-            if not event_info:
-                continue
+    date_span = item.select_one(":scope > div:nth-child(2) span:nth-child(2)")
+    if not date_span:
+        return None
+    start_date, end_date = _parse_date_range(date_span.text.strip())
 
-            params = event_info.group(1).split(",")
-            tournament_id = int(params[0])
-            name = params[1].strip("'")
-            event_type = EventType.from_id(int(params[2]))
-            logo_url = params[3].strip(" '")
+    venue_div = item.select_one(":scope > div:nth-child(3) span")
+    venue_name = _ = city = state = zip_code = None
+    if venue_div:
+        venue_name, _, city, state, zip_code = _parse_venue_address(
+            venue_div.get_text("\n")
+        )
+
+    links_div = item.select_one(":scope > div:nth-child(4)")
+    event_flyer_url = website_url = None
+    if links_div:
+        flyer_link = links_div.select_one('a[href*="uploads"]')
+        website_link = links_div.select_one('a[href*="Website"]')
+        if flyer_link:
+            event_flyer_url = flyer_link["href"]
+        if website_link:
+            website_url = website_link["href"]
+
+    return Tournament(
+        id=tournament_id,
+        name=name,
+        event_type=event_type,
+        start_date=start_date,
+        end_date=end_date,
+        venue_name=venue_name,
+        # venue_address=street,
+        venue_city=city,
+        venue_state=state,
+        venue_zip=zip_code,
+        logo_url=logo_url if logo_url != "null" else None,
+        event_flyer_url=event_flyer_url,
+        website_url=website_url,
+    )
 
-            date_span = item.select_one("div:nth-child(2) span:nth-child(2)")
-            if not date_span:
-                continue
-            start_date, end_date = _parse_date_range(date_span.text.strip())
-
-            venue_div = item.select_one("div:nth-child(3) span")
-            venue_name = _ = city = state = zip_code = None
-            if venue_div:
-                venue_name, _, city, state, zip_code = _parse_venue_address(
-                    venue_div.text
-                )
-
-            links_div = item.select_one("div:nth-child(4)")
-            event_flyer_url = website_url = None
-            if links_div:
-                flyer_link = links_div.select_one('a[href*="uploads"]')
-                website_link = links_div.select_one('a[href*="Website"]')
-                if flyer_link:
-                    event_flyer_url = flyer_link["href"]
-                if website_link:
-                    website_url = website_link["href"]
-
-            tournament = Tournament(
-                id=tournament_id,
-                name=name,
-                event_type=event_type,
-                start_date=start_date,
-                end_date=end_date,
-                venue_name=venue_name,
-                # venue_address=street,
-                venue_city=city,
-                venue_state=state,
-                venue_zip=zip_code,
-                logo_url=logo_url if logo_url != "null" else None,
-                event_flyer_url=event_flyer_url,
-                website_url=website_url,
-            )
-            tournaments.append(tournament)
 
+def _parse_tournament_items(items) -> List[Tournament]:
+    tournaments = []
+    for item in items:
+        try:
+            tournament = _parse_tournament_item(item)
         except Exception:
             continue
-
+        if tournament is not None:
+            tournaments.append(tournament)
     return tournaments
 
 
+def _parse_tournaments(html_content: str) -> List[Tournament]:
+    soup = BeautifulSoup(html_content, HTML_PARSER)
+    return _parse_tournament_items(soup.select(".tournament-ul > li"))
+
+
+class _TournamentListParser:
+    """Incremental parser for Login.jsp search results
+
+    Fed the page as it arrives, it cuts out each `.tournament-ul > li` as soon as the
+    item's closing tag is in, so results are parsed while the rest is still loading
+    and only the item in progress is ever buffered.
+    """
+
+    _LIST_START = re.compile(r"<ul\b[^>]*class=['\"]tournament-ul['\"][^>]*>")
+    _TAG = re.compile(r"<(/?)(li|ul)\b[^>]*>", re.IGNORECASE)
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.in_list = False
+        self.done = False
+        self.depth = 0
+        self.item_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Tournament]:
+        """Add the next piece of the page, returning the results it completed"""
+        if self.done:
+            return []
+        self.buffer += text
+        if not self.in_list:
+            start = self._LIST_START.search(self.buffer)
+            if not start:
+                # Keep enough to match the list's opening tag once the rest of it arrives
+                self.buffer = self.buffer[-256:]
+                return []
+            self.in_list = True
+            self.buffer = self.buffer[start.end():]
+
+        items = []
+        for tag in self._TAG.finditer(self.buffer, self.position):
+            self.position = tag.end()
+            closing, name = tag.group(1), tag.group(2).lower()
+            if name == "ul":
+                if closing and self.depth == 0:
+                    self.done = True
+                    break
+                continue
+            if not closing:
+                if self.depth == 0:
+                    self.item_start = tag.start()
+                self.depth += 1
+            elif self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    items.append(self.buffer[self.item_start:tag.end()])
+                    self.item_start = None
+
+        # Drop everything before the item in progress
+        keep_from = self.position if self.item_start is None else self.item_start
+        self.buffer = self.buffer[keep_from:]
+        self.position -= keep_from
+        if self.item_start is not None:
+            self.item_start = 0
+
+        if not items:
+            return []
+        soup = BeautifulSoup("".join(items), HTML_PARSER)
+        return _parse_tournament_items(soup.find_all("li", recursive=False))
+
+    def close(self) -> List[Tournament]:
+        """Flush an item left open by a page that ended early or omitted its closing tag"""
+        if self.item_start is None:
+            return []
+        soup = BeautifulSoup(self.buffer[self.item_start:], HTML_PARSER)
+        self.item_start = None
+        return _parse_tournament_items(soup.find_all("li", recursive=False))
+
+
 def _parse_wrestler_data(wrestler_element) -> Wrestler:
     wrestler_id = wrestler_element.get("data-wrestler-id", "")
     team_id = wrestler_element.get("data-team-id", "")
@@ -224,7 +372,7 @@ def _parse_match_data(match_row) -> Match:
 
 
 def _parse_tournament_matches(html: str) -> List[Match]:
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, HTML_PARSER)
     match_rows = [
         tr
         for tr in soup.find_all("tr")
@@ -233,36 +381,108 @@ def _parse_tournament_matches(html: str) -> List[Match]:
     return [_parse_match_data(row) for row in match_rows]
 
 
-async def search_tournaments(query: str = None) -> List[Tournament]:
+async def search_tournaments(
+    query: str = None,
+    state: str = None,
+    start_date: date = None,
+    end_date: date = None,
+    city: str = None,
+    team_name: str = None,
+    last_name: str = None,
+    first_name: str = None,
+) -> List[Tournament]:
     """Search for tournaments by query
 
+    Searches differing only in case or whitespace are treated as one, and results are
+    cached for SEARCH_CACHE_TTL seconds so equivalent searches share one request.
+
     Args:
         query (str, optional): Search query. Defaults to None.
+        state (str, optional): State code the tournament is held in. Defaults to None.
+        start_date (date, optional): Earliest tournament date. Defaults to None.
+        end_date (date, optional): Latest tournament date. Defaults to None.
+        city (str, optional): City the tournament is held in. Defaults to None.
+        team_name (str, optional): Name of a participating team. Defaults to None.
+        last_name (str, optional): Last name of a participating wrestler. Defaults to None.
+        first_name (str, optional): First name of a participating wrestler. Defaults to None.
 
     Returns:
         List[Tournament]: A list of Tournament objects representing the search results
     """
+    results = iter_search_tournaments(
+        query, state, start_date, end_date, city, team_name, last_name, first_name
+    )
+    async with aclosing(results):
+        return [tournament async for tournament in results]
+
+
+async def iter_search_tournaments(
+    query: str = None,
+    state: str = None,
+    start_date: date = None,
+    end_date: date = None,
+    city: str = None,
+    team_name: str = None,
+    last_name: str = None,
+    first_name: str = None,
+) -> AsyncIterator[Tournament]:
+    """Search for tournaments, yielding each result as soon as it has been parsed
+
+    Takes the same arguments as search_tournaments. The page is parsed while it is
+    still being downloaded, and a complete result list is cached once it is in.
+    """
+    search = TournamentSearch(
+        name=query,
+        state=state,
+        start_date=start_date,
+        end_date=end_date,
+        city=city,
+        team_name=team_name,
+        last_name=last_name,
+        first_name=first_name,
+    )
+    cached = _search_cache.get(search)
+    if cached is not None:
+        for tournament in cached:
+            yield tournament
+        return
+
+    tournaments = []
+    parser = _TournamentListParser()
     async with session_manager.get_session() as session:
-        async with session.get(
-            "https://www.trackwrestling.com/Login.jsp",
+        chunks = upstream.stream_text(
+            session,
+            "Login.jsp",
             params={
                 "TIM": _get_timestamp(),
                 "twSessionId": "zyxwvutsrq",
-                "tName": query or "",
-                "state": "",
-                "sDate": "",
-                "eDate": "",
-                "lastName": "",
-                "firstName": "",
-                "teamName": "",
+                **search.as_params(),
                 "sfvString": "",
-                "city": "",
                 "gbId": "",
                 "camps": "false",
             },
-        ) as response:
-            html_content = await response.text()
-            return _parse_tournaments(html_content)
+        )
+        try:
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    with stage("parse", parser="tournaments"):
+                        parsed = parser.feed(chunk)
+                    for tournament in parsed:
+                        tournaments.append(tournament)
+                        yield tournament
+        except UpstreamUnavailable:
+            # Nothing fresh to be had, an expired answer to the same search beats none
+            stale = _search_cache.get_stale(search) if not tournaments else None
+            if stale is None:
+                raise
+            for tournament in stale:
+                yield tournament
+            return
+
+    for tournament in parser.close():
+        tournaments.append(tournament)
+        yield tournament
+    _search_cache.set(search, tournaments)
 
 
 async def get_mat_assignment(
@@ -278,92 +498,121 @@ async def get_mat_assignment(
         List[Match]: A list of Match objects representing the mat assignments
     """
     # return _parse_tournament_matches(open("htmls/mat-schedule.html", "r").read())
-    async with session_manager.get_session(tournament_id) as session:
-        async with session.get(
-            f"https://www.trackwrestling.com/{tournament_type.tournament_type}/MB_MatAssignmentDisplay.jsp",
+    archive = archives.get(tournament_id, tournament_type)
+    if archive is not None:
+        return archive.parse(MAT_BOARD, _parse_tournament_matches)
+    html = await _fetch_tournament_page(tournament_type, tournament_id, "MB_MatAssignmentDisplay.jsp")
+    with stage("parse", parser="matches"):
+        return _parse_tournament_matches(html)
+
+
+async def _fetch_tournament_page(tournament_type: EventType, tournament_id: int, page: str) -> str:
+    if page == "TournamentHub.jsp":
+        _check_not_missing(tournament_type, tournament_id)
+    else:
+        await _check_exists(tournament_type, tournament_id)
+    async with session_manager.get_session(tournament_id, tournament_type) as session:
+        return await upstream.fetch_text(
+            session,
+            f"{tournament_type.tournament_type}/{page}",
             params={
                 "TIM": _get_timestamp(),
                 "twSessionId": "zyxwvutsrq",
                 "tournamentId": tournament_id,
             },
-        ) as response:
-            html = await response.text()
-            return _parse_tournament_matches(html)
+        )
 
 
 async def get_tournament_info(
     tournament_type: EventType, tournament_id: int
 ) -> Tournament:
-    async with session_manager.get_session(tournament_id, tournament_type) as session:
-        async with session.get(
-            f"https://www.trackwrestling.com/{tournament_type.tournament_type}/TournamentHub.jsp",
-            params={
-                "TIM": _get_timestamp(),
-                "twSessionId": "zyxwvutsrq",
-                "tournamentId": str(tournament_id),
-            },
-        ) as response:
-            html = await response.text()
-            soup = BeautifulSoup(html, "html.parser")
-
-            # Find the info content section
-            content_div = soup.select_one(".hub-nav > ul > li:first-child .content")
-            if not content_div:
-                return None
-
-            # Get tournament name
-            name_elem = content_div.select_one("h3")
-            name = name_elem.text.strip() if name_elem else ""
-
-            # Get logo URL
-            logo_img = content_div.select_one(".logo-icon img")
-            logo_url = logo_img["src"] if logo_img else None
-
-            # Parse date information
-            date_p = content_div.select("p")[0]
-            date_text = date_p.text.strip()
-            dates = date_text.split(" - ") if " - " in date_text else [date_text]
-
-            start_date = parse_date(dates[0])
-            end_date = parse_date(dates[1]) if len(dates) > 1 else None
-
-            # Parse venue information
-            address_p = (
-                content_div.select("p")[1] if len(content_div.select("p")) > 1 else None
-            )
-            venue_info = parse_venue_info(address_p.text) if address_p else {}
-
-            # Look for URLs in the nav sections
-            flyer_link = soup.select_one('a[href*="event_flyer"]')
-            event_flyer_url = flyer_link["href"] if flyer_link else None
-
-            website_link = soup.select_one('a[href*="website"]')
-            website_url = website_link["href"] if website_link else None
-
-            # Determine event type from the badge/class
-            event_type_elem = soup.select_one(
-                '[class*="bg-purple-"], [class*="bg-green-"], [class*="bg-blue-"], [class*="bg-orange-"], [class*="bg-pink-"]'
-            )
-            event_type = (
-                EventType.from_id(determine_event_type(event_type_elem))
-                if event_type_elem
-                else tournament_type
-            )  # Default to Predefined
-
-            return Tournament(
-                id=tournament_id,
-                name=name,
-                event_type=event_type,
-                start_date=start_date,
-                end_date=end_date,
-                venue_name=venue_info.get("name"),
-                venue_city=venue_info.get("city"),
-                venue_state=venue_info.get("state"),
-                venue_zip=venue_info.get("zip"),
-                logo_url=logo_url,
-                event_flyer_url=event_flyer_url,
-                website_url=website_url,
-            )
+    """Get the hub information of a tournament
+
+    Raises:
+        TournamentNotFound: If upstream has no tournament with this type and id
+    """
+    archive = archives.get(tournament_id, tournament_type)
+    if archive is not None:
+        tournament = archive.parse(HUB, lambda html: _parse_tournament_info(html, tournament_type, tournament_id))
+    else:
+        html = await _fetch_tournament_page(tournament_type, tournament_id, "TournamentHub.jsp")
+        with stage("parse", parser="tournament_info"):
+            tournament = _parse_tournament_info(html, tournament_type, tournament_id)
+    await _remember_tournament(tournament_type, tournament_id, tournament)
+    return tournament
+
+async def _remember_tournament(tournament_type: EventType, tournament_id: int, tournament: Optional[Tournament]) -> None:
+    if tournament is None:
+        _missing_tournaments.set((tournament_type, tournament_id), True)
+        # Don't keep a session around for every bogus id we are asked about
+        await session_manager.discard(tournament_id)
+        raise TournamentNotFound(tournament_type, tournament_id)
+    _found_tournaments.set((tournament_type, tournament_id), tournament)
+
+
+def _parse_tournament_info(
+    html: str, tournament_type: EventType, tournament_id: int
+) -> Tournament:
+    soup = BeautifulSoup(html, HTML_PARSER)
+
+    # Find the info content section
+    content_div = soup.select_one(".hub-nav > ul > li:first-child .content")
+    if not content_div:
+        return None
+
+    # Get tournament name
+    name_elem = content_div.select_one("h3")
+    name = name_elem.text.strip() if name_elem else ""
+
+    # Get logo URL
+    logo_img = content_div.select_one(".logo-icon img")
+    logo_url = logo_img["src"] if logo_img else None
+
+    # Parse date information
+    date_p = content_div.select("p")[0]
+    date_text = date_p.text.strip()
+    dates = date_text.split(" - ") if " - " in date_text else [date_text]
+
+    start_date = parse_date(dates[0])
+    end_date = parse_date(dates[1]) if len(dates) > 1 else None
+
+    # Parse venue information
+    address_p = (
+        content_div.select("p")[1] if len(content_div.select("p")) > 1 else None
+    )
+    venue_info = parse_venue_info(address_p.text) if address_p else {}
+
+    # Look for URLs in the nav sections
+    flyer_link = soup.select_one('a[href*="event_flyer"]')
+    event_flyer_url = flyer_link["href"] if flyer_link else None
+
+    website_link = soup.select_one('a[href*="website"]')
+    website_url = website_link["href"] if website_link else None
+
+    # Determine event type from the badge/class
+    event_type_elem = soup.select_one(
+        '[class*="bg-purple-"], [class*="bg-green-"], [class*="bg-blue-"], [class*="bg-orange-"], [class*="bg-pink-"]'
+    )
+    event_type = (
+        EventType.from_id(determine_event_type(event_type_elem))
+        if event_type_elem
+        else tournament_type
+    )  # Default to Predefined
+
+    return Tournament(
+        id=tournament_id,
+        name=name,
+        event_type=event_type,
+        start_date=start_date,
+        end_date=end_date,
+        venue_name=venue_info.get("name"),
+        venue_city=venue_info.get("city"),
+        venue_state=venue_info.get("state"),
+        venue_zip=venue_info.get("zip"),
+        logo_url=logo_url,
+        event_flyer_url=event_flyer_url,
+        website_url=website_url,
+    )
 
 
 def parse_date(date_str: str) -> datetime:
@@ -398,19 +647,13 @@ def parse_venue_info(address_text: str) -> dict:
     return venue_info
 
 async def get_brackets(tournament_type: EventType, tournament_id: int) -> BracketData:
-    async with session_manager.get_session(tournament_id, tournament_type) as session:
-        async with session.get(
-            f"https://www.trackwrestling.com/{tournament_type.tournament_type}/BracketViewer.jsp",
-            params={
-                "TIM": _get_timestamp(),
-                "twSessionId": "zyxwvutsrq",
-                "tournamentId": tournament_id,
-            },
-        ) as response:
-            html = await response.text()
-            # open("yeah.html", "w").write(html)
-            # print("Got url " + response.url.__str__())
-            return parse_bracket_data(html)    
+    archive = archives.get(tournament_id, tournament_type)
+    if archive is not None:
+        return archive.parse(BRACKET_VIEWER, parse_bracket_data)
+    html = await _fetch_tournament_page(tournament_type, tournament_id, "BracketViewer.jsp")
+    # open("yeah.html", "w").write(html)
+    with stage("parse", parser="brackets"):
+        return parse_bracket_data(html)
 
 def parse_bracket_data(html_content: str) -> BracketData:
     """
@@ -422,7 +665,7 @@ def parse_bracket_data(html_content: str) -> BracketData:
     Returns:
         Tuple of (weights, templates, bracket_types) lists
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
+    soup = BeautifulSoup(html_content, HTML_PARSER)
     
     # Find the script containing the data
     script_content = None
@@ -547,13 +790,24 @@ def generate_bracket_url(
     
     # Combine into final URL
     # base_url: str = "https://www.trackwrestling.com/teamtournaments/"
-    return f"https://www.trackwrestling.com/{tournament_type.tournament_type}/Bracket.jsp?{query}"
+    return f"{BASE_URL}/{tournament_type.tournament_type}/Bracket.jsp?{query}"
 
 
 async def get_bracket_data_html(tournament_type: EventType, tournament_id: int, group_id: int, pages: Tuple[int] = None) -> str:
+    archive = archives.get(tournament_id, tournament_type)
+    html = archive.page(bracket_member(group_id, pages)) if archive is not None else None
+    if html is None:
+        html = await _fetch_bracket(tournament_type, tournament_id, group_id, pages)
+    # Every fetch, whoever asked for it, is a chance to notice the bracket changed
+    await bracket_versions.observe(tournament_id, group_id, pages, html)
+    return html
+
+async def _fetch_bracket(tournament_type: EventType, tournament_id: int, group_id: int, pages: Tuple[int] = None) -> str:
+    await _check_exists(tournament_type, tournament_id)
     async with session_manager.get_session(tournament_id, tournament_type) as session:
-        async with session.get(
-            f"https://www.trackwrestling.com/{tournament_type.tournament_type}/AjaxFunctions.jsp",
+        return await upstream.fetch_text(
+            session,
+            f"{tournament_type.tournament_type}/AjaxFunctions.jsp",
             params={
                 "TIM": 1734309820692,
                 "twSessionId": "zyxwvutsrq",
@@ -568,8 +822,128 @@ async def get_bracket_data_html(tournament_type: EventType, tournament_id: int,
                 # "includePages": "5",
                 "templateId": 0,
             },
-        ) as response:
-            return await response.text()
+        )
+
+async def iter_bracket_data_html(
+    tournament_type: EventType,
+    tournament_id: int,
+    weights: List[Weight],
+    pages: Tuple[int] = None,
+    concurrency: int = BRACKET_EXPORT_CONCURRENCY,
+) -> AsyncIterator[Tuple[Weight, str]]:
+    """Fetch the bracket of every weight in `weights`, yielding each as soon as it arrives
+
+    At most `concurrency` brackets are requested at once, at refresh priority so a
+    bulk export never crowds out live requests, or at the caller's own priority if
+    that is lower already.
+    """
+    remaining = iter(weights)
+    pending = {}
+    try:
+        while True:
+            with priority(max(current_priority(), Priority.REFRESH)):
+                for weight in islice(remaining, concurrency - len(pending)):
+                    task = asyncio.ensure_future(
+                        get_bracket_data_html(tournament_type, tournament_id, weight.weight_id, pages)
+                    )
+                    pending[task] = weight
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                weight = pending.pop(task)
+                yield weight, task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+# A decided bout as TrackWrestling words it, e.g.
+# "Cons. Round 2 - Logan Dunn (Liberty) 12-4 won by major decision over Eli Ellis (Ballard) 3-9 (MD 12-3)"
+_BOUT_RESULT = re.compile(
+    r"^(?P<round>.+?) - (?P<winner>.+?) \((?P<winner_team>[^()]+)\)(?: \d+-\d+)?"
+    r" won (?:by|in) (?P<win_type>.+?) over (?P<loser>.+?) \((?P<loser_team>[^()]+)\)(?: \d+-\d+)?"
+    r"(?: \((?P<score>[^()]*)\))?$"
+)
+
+_INLINE_TAGS = ["a", "b", "em", "font", "i", "span", "strong", "u"]
+
+def parse_bracket_results(html: str, weight_id: int) -> BracketResults:
+    """Decided bouts of a getBracket answer, read off its text so layout changes don't matter
+
+    Byes and bouts still to be wrestled have no result line and are left out.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    # Names and teams are often styled apart; join them back into the line they belong to
+    for tag in soup.find_all(_INLINE_TAGS):
+        tag.unwrap()
+    soup.smooth()
+    bouts = []
+    for line in soup.get_text("\n").splitlines():
+        found = _BOUT_RESULT.match(" ".join(line.split()))
+        if found:
+            bouts.append(BoutResult(
+                round=found["round"],
+                winner=found["winner"],
+                winner_team=found["winner_team"],
+                loser=found["loser"],
+                loser_team=found["loser_team"],
+                win_type=found["win_type"].lower(),
+                score=found["score"] or "",
+            ))
+    return BracketResults(weight_id=weight_id, bouts=bouts)
+
+async def archive_tournament(
+    tournament_type: EventType,
+    tournament_id: int,
+    concurrency: int = BRACKET_EXPORT_CONCURRENCY,
+    force: bool = False,
+) -> dict:
+    """Crawl a finished tournament into its archive, returning the archive's manifest
+
+    The hub, the bracket viewer, every weight's bracket and the last mat board are
+    fetched from upstream, even if an older archive exists, and written as they
+    arrive. Once it is in place, the tournament is served from the archive alone.
+    The crawl runs at background priority, behind everything users are waiting on.
+
+    Raises:
+        TournamentNotFinished: If its last day isn't over yet, unless `force` is set
+    """
+    with archives.bypassed(), priority(Priority.BACKGROUND):
+        hub = await _fetch_tournament_page(tournament_type, tournament_id, "TournamentHub.jsp")
+        tournament = _parse_tournament_info(hub, tournament_type, tournament_id)
+        await _remember_tournament(tournament_type, tournament_id, tournament)
+        last_day = tournament.end_date or tournament.start_date
+        # The hub parse gives datetimes
+        if isinstance(last_day, datetime):
+            last_day = last_day.date()
+        if not force and (last_day is None or last_day >= date.today()):
+            raise TournamentNotFinished(tournament_type, tournament_id)
+
+        writer = archives.writer(tournament_id)
+        try:
+            writer.add(HUB, hub)
+            viewer = await _fetch_tournament_page(tournament_type, tournament_id, "BracketViewer.jsp")
+            writer.add(BRACKET_VIEWER, viewer)
+            weights = []
+            found = iter_bracket_data_html(tournament_type, tournament_id, parse_bracket_data(viewer).weights, concurrency=concurrency)
+            async with aclosing(found):
+                async for weight, html in found:
+                    member = bracket_member(weight.weight_id)
+                    writer.add(member, html)
+                    weights.append({"weight_id": weight.weight_id, "weight_name": weight.weight_name, "member": member})
+            writer.add(MAT_BOARD, await _fetch_tournament_page(tournament_type, tournament_id, "MB_MatAssignmentDisplay.jsp"))
+        except BaseException:
+            writer.abort()
+            raise
+    # Nothing about this tournament needs upstream any more
+    await session_manager.discard(tournament_id)
+    return writer.commit({
+        "tournament_id": tournament_id,
+        "tournament_type": tournament_type.alias,
+        "archived_at": datetime.now().astimezone().isoformat(),
+        "tournament": tournament.as_dict(),
+        "weights": sorted(weights, key=lambda w: w["weight_id"]),
+    })
 
 def determine_event_type(element) -> int:
     """Determine event type based on CSS classes"""
@@ -1,61 +1,554 @@
+import os
+import hmac
+import time
+from functools import wraps
+from contextlib import aclosing
 from sanic_ext import Extend
-from typing import Dict, List
 from sanic import Sanic, Request
-from models.response import Response
-from models.ttypes import EventType, Match
-from parsers.tournaments import search_tournaments, get_tournament_info, get_mat_assignment, get_brackets, get_bracket_data_html
+from sanic.response import empty, file, text
+from sanic.exceptions import NotFound
+from models.response import Response, send_stream, stream_format
+from utils.compression import compressor
+from utils.conditional import resource_versions
+from utils.match_index import match_indexes, MatchIndex
+from utils.mat_history import mat_history
+from utils.standings import standings
+from utils.bracket_versions import bracket_versions
+from utils.archive import InvalidArchive, archives
+from utils.memory import LIVE_WINDOW, SESSION_BYTES, memory
+from utils.cassettes import RequestKey
+from utils.search_index import search_index
+from utils.upstream import upstream, UpstreamUnavailable
+from utils.metrics import metrics, stage
+from utils.tracing import SERVER_TIMING, begin_trace, current_trace
+from utils.profiling import ADMIN_TOKEN, MEMORY_WATCHED_FILES, PROFILE_MAX_SECONDS, ProfilerBusy, profiler
+from utils.scheduler import Priority, priority, scheduler
+from utils.session_manager import session_manager
+from utils.listing import InvalidQueryParameter, SortKey, paginate, parse_date, parse_list, select_fields
+from datetime import date, datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+from models.ttypes import BracketResults, EventType, Match, Tournament, Weight
+from parsers.tournaments import TournamentNotFinished, TournamentNotFound, archive_tournament, found_tournament, search_tournaments, iter_search_tournaments, get_tournament_info, get_mat_assignment, get_brackets, get_bracket_data_html, iter_bracket_data_html, parse_bracket_results
 
 
 app = Sanic("trackwrestling-parser")
 app.config.CORS_ORIGINS = "*"
 Extend(app)
 
+# Only known tournament types are routed, anything else is a 404 before any handler runs
+_TOURNAMENT_TYPES = "|".join(event_type.alias for event_type in EventType)
 
-match_states: Dict[str, List[Match]] = {}
+# Shorter suggestion queries are answered from the local index alone
+SUGGEST_UPSTREAM_MIN_LENGTH = 3
+
+_http_requests = metrics.counter("http_requests_total", "Requests served by route and status")
+_http_seconds = metrics.histogram("http_request_seconds", "Time to produce a response, by route")
+metrics.gauge(
+    "upstream_in_flight",
+    "Upstream requests holding a connection slot, by priority",
+    lambda: {(("priority", p.name.lower()),): n for p, n in scheduler.in_flight.items()},
+)
+metrics.gauge(
+    "upstream_queued",
+    "Upstream requests waiting for a connection slot",
+    lambda: sum(1 for *_, future in scheduler.waiters if not future.done()),
+)
+metrics.gauge("sessions", "Open TrackWrestling sessions", lambda: len(session_manager.sessions))
+metrics.gauge("search_index_tournaments", "Tournaments in the search index", lambda: len(search_index))
+metrics.gauge("match_indexes", "Tournaments with an indexed mat board", lambda: len(match_indexes.indexes))
+metrics.gauge("standings", "Tournaments with team standings in memory", lambda: len(standings.tournaments))
+metrics.gauge(
+    "bracket_followers",
+    "Open bracket update streams",
+    lambda: sum(len(brackets.subscribers) for brackets in bracket_versions.tournaments.values()),
+)
+metrics.gauge("memory_accounted_bytes", "Approximate bytes held for tournaments, as last measured", lambda: memory.total)
+
+
+def _stale_owner(key: RequestKey, weights: Dict[int, int]) -> Optional[int]:
+    params = dict(key[1])
+    if params.get("tournamentId", "").isdigit():
+        return int(params["tournamentId"])
+    # Brackets are asked for by weight alone
+    if params.get("groupId", "").isdigit():
+        return weights.get(int(params["groupId"]))
+    return None
+
+def _stale_pages() -> Dict[int, Dict[RequestKey, str]]:
+    weights = {
+        weight_id: tournament_id
+        for tournament_id, brackets in bracket_versions.tournaments.items()
+        for weight_id, _ in brackets.versions
+    }
+    pages: Dict[int, Dict[RequestKey, str]] = {}
+    for key, body in upstream.stale.items():
+        owner = _stale_owner(key, weights)
+        if owner is not None:
+            pages.setdefault(owner, {})[key] = body
+    return pages
+
+def _discard_stale_pages(tournament_id: int) -> None:
+    for key in _stale_pages().get(tournament_id, {}):
+        upstream.stale.pop(key)
+
+def _is_live(tournament_id: int) -> bool:
+    if archives.get(tournament_id) is not None:
+        return False
+    brackets = bracket_versions.tournaments.get(tournament_id)
+    if brackets is not None and brackets.subscribers:
+        return True
+    stats = mat_history.tournaments.get(tournament_id)
+    if stats is not None and stats.last_seen is not None and time.time() - stats.last_seen < LIVE_WINDOW:
+        return True
+    # Reached by id, a tournament may never have turned up in a search
+    tournament = found_tournament(tournament_id) or search_index.tournaments.get(tournament_id)
+    if tournament is not None and tournament.start_date is not None:
+        today = date.today()
+        first_day = tournament.start_date
+        last_day = tournament.end_date or first_day
+        return _as_date(first_day) <= today <= _as_date(last_day)
+    return False
+
+def _as_date(value: date) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+memory.track("sessions", lambda: session_manager.sessions, session_manager.discard, size=lambda _: SESSION_BYTES)
+memory.track("upstream_pages", _stale_pages, _discard_stale_pages)
+memory.track("match_index", lambda: match_indexes.indexes, match_indexes.discard)
+memory.track("mat_history", lambda: mat_history.tournaments, mat_history.discard)
+memory.track("standings", lambda: standings.tournaments, standings.discard)
+memory.track("bracket_versions", lambda: bracket_versions.tournaments, bracket_versions.discard)
+memory.track("archive", lambda: archives.opened, archives.discard)
+memory.protect(_is_live)
+
+
+def _route_name(request: Request) -> str:
+    return request.route.name.rsplit(".", 1)[-1] if request.route else "unmatched"
+
+
+@app.before_server_start
+async def load_search_index(app: Sanic) -> None:
+    search_index.load()
+    app.add_task(search_index.persist_periodically(), name="persist_search_index")
+
+@app.after_server_stop
+async def save_search_index(_: Sanic) -> None:
+    search_index.save()
+
+@app.before_server_start
+async def start_metrics(app: Sanic) -> None:
+    app.add_task(metrics.flush_periodically(), name="flush_metrics")
+    app.add_task(metrics.watch_loop_lag(), name="watch_loop_lag")
+
+@app.after_server_stop
+async def remove_metrics(_: Sanic) -> None:
+    metrics.remove()
+
+@app.before_server_start
+async def start_memory_accounting(app: Sanic) -> None:
+    app.add_task(memory.enforce_periodically(), name="enforce_memory_budget")
+
+@app.after_server_stop
+async def close_sessions(_: Sanic) -> None:
+    await session_manager.cleanup()
+
+
+@app.on_request
+async def start_timer(request: Request) -> None:
+    request.ctx.started = time.perf_counter()
+    begin_trace(f"{request.method} {_route_name(request)}")
+    tournament_id = request.match_info.get("tournament_id")
+    if tournament_id is not None:
+        request.ctx.in_flight = (int(tournament_id), memory.begin(int(tournament_id)))
+
+
+@app.on_response
+async def finalize_response(request: Request, response) -> None:
+    if hasattr(request.ctx, "in_flight"):
+        # Streamed responses get here once they start; their handlers keep the tournament themselves
+        memory.end(*request.ctx.in_flight)
+    # Order matters: the body has to be in its final format before it is compressed
+    size = None
+    if isinstance(response, Response):
+        response.negotiate(request)
+        # What a 304 stands in for decides its ETag's encoding suffix
+        size = len(response.body or b"")
+        with stage("cache"):
+            resource_versions.apply(request, response, response.max_age)
+    with stage("compress"):
+        compressor.apply(request, response, size)
+
+    route = _route_name(request)
+    _http_requests.inc(route=route, status=response.status)
+    if hasattr(request.ctx, "started"):
+        _http_seconds.observe(time.perf_counter() - request.ctx.started, route=route)
+
+    trace = current_trace()
+    if trace is not None:
+        if SERVER_TIMING:
+            response.headers["server-timing"] = trace.server_timing()
+        trace.finish(
+            {"http.request.method": request.method, "http.route": route, "url.path": request.path,
+             "http.response.status_code": response.status},
+            error=response.status >= 500,
+        )
+
+
+async def _current_matches(tourney_type: EventType, tournament_id: int) -> MatchIndex:
+    return await match_indexes.current(
+        tournament_id, lambda: get_mat_assignment(tourney_type, tournament_id)
+    )
+
+
+def _list_response(request: Request, items: List, key: Callable[..., SortKey], max_age: int) -> Response:
+    page, next_cursor = paginate(items, key, request.args.get("cursor"), request.args.get("limit"))
+    fields = parse_list(request.args.get("fields"))
+    with stage("as_dict"):
+        data = [select_fields(item.as_dict(), fields) for item in page]
+    return Response(ok=True, data=data, max_age=max_age, next_cursor=next_cursor)
+
+def _bracket_pages(request: Request) -> Optional[Tuple[int, ...]]:
+    pages = parse_list(request.args.get("pages"))
+    if pages and not all(page.isdigit() for page in pages):
+        raise InvalidQueryParameter("Invalid pages, expected comma separated page ids")
+    return tuple(int(page) for page in pages) if pages else None
+
+def _match_cursor_key(match: Match) -> SortKey:
+    # Wrestlers tell apart rows whose mat or bout couldn't be read
+    return (match.mat, match.bout, *(w.id or "" if w else "" for w in (match.wrestler1, match.wrestler2)))
+
+def _tournament_cursor_key(tournament: Tournament) -> SortKey:
+    return (tournament.start_date.isoformat() if tournament.start_date else "", tournament.id)
+
+
+@app.exception(InvalidQueryParameter)
+async def invalid_query_parameter(request: Request, exception: InvalidQueryParameter) -> Response:
+    return Response(ok=False, error=str(exception), status=400)
+
+
+@app.exception(NotFound)
+async def not_found(request: Request, exception: NotFound) -> Response:
+    return Response(ok=False, error=str(exception), status=404)
+
+@app.exception(TournamentNotFound)
+async def tournament_not_found(request: Request, exception: TournamentNotFound) -> Response:
+    return Response(ok=False, error=str(exception), status=404)
+
+@app.exception(TournamentNotFinished)
+async def tournament_not_finished(request: Request, exception: TournamentNotFinished) -> Response:
+    return Response(ok=False, error=str(exception), status=409)
+
+@app.exception(InvalidArchive)
+async def invalid_archive(request: Request, exception: InvalidArchive) -> Response:
+    return Response(ok=False, error=str(exception), status=400)
+
+@app.exception(ProfilerBusy)
+async def profiler_busy(request: Request, exception: ProfilerBusy) -> Response:
+    return Response(ok=False, error=str(exception), status=409)
+
+@app.exception(UpstreamUnavailable)
+async def upstream_unavailable(request: Request, exception: UpstreamUnavailable) -> Response:
+    response = Response(ok=False, error=str(exception), status=503)
+    response.headers["retry-after"] = str(max(1, round(exception.retry_after)))
+    return response
 
 
 @app.get("/")
 async def index(_: Request) -> Response:
     return Response(ok=True)
 
+@app.get("/status/upstream")
+async def upstream_status(_: Request) -> Response:
+    return Response(ok=True, data=upstream.stats())
+
+@app.get("/status/memory")
+async def memory_status(_: Request) -> Response:
+    # Measuring walks every structure on the event loop, so only the periodic check does it
+    return Response(ok=True, data=memory.breakdown())
+
+@app.get("/metrics")
+async def prometheus_metrics(_: Request):
+    # Every worker's latest flush plus this worker's live numbers
+    return text(metrics.render(metrics.collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _tournament_filter(
+    states: Optional[Set[str]], start_date: Optional[date], end_date: Optional[date]
+) -> Callable[[Tournament], bool]:
+    def matches(tournament: Tournament) -> bool:
+        if states and (not tournament.venue_state or tournament.venue_state.upper() not in states):
+            return False
+        # Re-applied here since upstream's own date matching isn't documented
+        last_day = tournament.end_date or tournament.start_date
+        if start_date and not (last_day and last_day >= start_date):
+            return False
+        if end_date and not (tournament.start_date and tournament.start_date <= end_date):
+            return False
+        return True
+    return matches
+
 @app.get("/tournaments")
 async def tournaments(request: Request) -> Response:
-    parsed = await search_tournaments(request.args.get("query"))
-    return Response(ok=True, data=[t.as_dict() for t in parsed])
+    states = parse_list(request.args.get("state"))
+    start_date = parse_date(request.args.get("start_date"), "start_date")
+    end_date = parse_date(request.args.get("end_date"), "end_date")
+    search = dict(
+        query=request.args.get("query"),
+        # Upstream takes a single state; several are filtered for here instead
+        state=states[0] if states and len(states) == 1 else None,
+        start_date=start_date,
+        end_date=end_date,
+        city=request.args.get("city"),
+        team_name=request.args.get("team_name"),
+        last_name=request.args.get("last_name"),
+        first_name=request.args.get("first_name"),
+    )
+    wanted = _tournament_filter(
+        {state.upper() for state in states} if states and len(states) > 1 else None, start_date, end_date
+    )
+
+    streamed = stream_format(request)
+    if streamed:
+        fields = parse_list(request.args.get("fields"))
+
+        async def rows() -> AsyncIterator[dict]:
+            found = iter_search_tournaments(**search)
+            async with aclosing(found):
+                async for tournament in found:
+                    search_index.add([tournament])
+                    if wanted(tournament):
+                        yield select_fields(tournament.as_dict(), fields)
+
+        return await send_stream(request, rows(), streamed)
 
-@app.get("/tournaments/<tournament_type:str>/<tournament_id:int>")
+    parsed = await search_tournaments(**search)
+    search_index.add(parsed)
+    return _list_response(request, [t for t in parsed if wanted(t)], _tournament_cursor_key, max_age=60)
+
+@app.get("/tournaments/suggest")
+async def suggest_tournaments(request: Request) -> Response:
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", "10")
+    limit = min(int(limit), 50) if limit.isdigit() else 10
+    suggestions = search_index.suggest(query, limit)
+    # Only ask upstream when nothing we have seen so far resembles the query
+    if not suggestions and len(query.strip()) >= SUGGEST_UPSTREAM_MIN_LENGTH:
+        search_index.add(await search_tournaments(query))
+        suggestions = search_index.suggest(query, limit)
+    with stage("as_dict"):
+        data = [t.as_dict() for t in suggestions]
+    return Response(ok=True, data=data, max_age=60)
+
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>")
 async def tournament(request: Request, tournament_type: str, tournament_id: int) -> Response:
     tourney_type: EventType = EventType.from_alias(tournament_type)
-    if not tourney_type:
-        return Response(ok=False, error="Invalid tournament type")
     parsed = await get_tournament_info(tourney_type, tournament_id)
-    return Response(ok=True, data=parsed.as_dict())
+    search_index.add([parsed])
+    with stage("as_dict"):
+        data = parsed.as_dict()
+    return Response(ok=True, data=data, max_age=300)
 
-@app.get("/tournaments/<tournament_type:str>/<tournament_id:int>/matches")
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>/matches")
 async def matches(request: Request, tournament_type: str, tournament_id: int) -> Response:
     tourney_type: EventType = EventType.from_alias(tournament_type)
-    if not tourney_type:
-        return Response(ok=False, error="Invalid tournament type")
-    parsed = await get_mat_assignment(tourney_type, tournament_id)
-    return Response(ok=True, data=[m.as_dict() for m in parsed])
+    index = await _current_matches(tourney_type, tournament_id)
+    mats = parse_list(request.args.get("mat"))
+    found = index.filter(
+        mat=[int(m) if m.isdigit() else m for m in mats] if mats is not None else None,
+        status=parse_list(request.args.get("status")),
+        weight_class=parse_list(request.args.get("weight_class")),
+        team=parse_list(request.args.get("team")),
+    )
+    return _list_response(request, found, _match_cursor_key, max_age=5)
+
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>/wrestlers/<wrestler_id:str>/matches")
+async def wrestler_matches(request: Request, tournament_type: str, tournament_id: int, wrestler_id: str) -> Response:
+    tourney_type: EventType = EventType.from_alias(tournament_type)
+    index = await _current_matches(tourney_type, tournament_id)
+    return _list_response(request, index.for_wrestler(wrestler_id), _match_cursor_key, max_age=5)
+
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>/teams/<team_id:str>/matches")
+async def team_matches(request: Request, tournament_type: str, tournament_id: int, team_id: str) -> Response:
+    tourney_type: EventType = EventType.from_alias(tournament_type)
+    index = await _current_matches(tourney_type, tournament_id)
+    return _list_response(request, index.for_team(team_id), _match_cursor_key, max_age=5)
+
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>/mats/stats")
+async def mat_stats(request: Request, tournament_type: str, tournament_id: int) -> Response:
+    tourney_type: EventType = EventType.from_alias(tournament_type)
+    # Refreshing the board is what feeds the history
+    await _current_matches(tourney_type, tournament_id)
+    return Response(ok=True, data=mat_history.get(tournament_id).as_dict(time.time()), max_age=5)
+
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>/standings")
+async def team_standings(request: Request, tournament_type: str, tournament_id: int) -> Response:
+    tourney_type: EventType = EventType.from_alias(tournament_type)
 
-@app.get("/tournaments/<tournament_type:str>/<tournament_id:int>/brackets")
+    async def weights() -> List[Weight]:
+        return (await get_brackets(tourney_type, tournament_id)).weights
+
+    def fetch(weights: List[Weight]) -> AsyncIterator[Tuple[Weight, str]]:
+        return iter_bracket_data_html(tourney_type, tournament_id, weights)
+
+    def parse(html: str, weight_id: int) -> BracketResults:
+        with stage("parse", parser="bracket_results"):
+            return parse_bracket_results(html, weight_id)
+
+    current = await standings.current(tournament_id, weights, fetch, parse)
+    return Response(ok=True, data=current.as_dict(), max_age=15)
+
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>/brackets")
 async def brackets(request: Request, tournament_type: str, tournament_id: int) -> Response:
     tourney_type: EventType = EventType.from_alias(tournament_type)
-    if not tourney_type:
-        return Response(ok=False, error="Invalid tournament type")
     parsed = await get_brackets(tourney_type, tournament_id)
-    return Response(ok=True, data=parsed.as_dict())
+    with stage("as_dict"):
+        data = parsed.as_dict()
+    return Response(ok=True, data=data, max_age=60)
+
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>/brackets/export")
+async def export_brackets(request: Request, tournament_type: str, tournament_id: int) -> None:
+    tourney_type: EventType = EventType.from_alias(tournament_type)
+    pages = _bracket_pages(request)
+    weight_ids = parse_list(request.args.get("weight"))
+    parsed = await get_brackets(tourney_type, tournament_id)
+    weights = [w for w in parsed.weights if weight_ids is None or str(w.weight_id) in weight_ids]
+
+    async def rows() -> AsyncIterator[dict]:
+        found = iter_bracket_data_html(tourney_type, tournament_id, weights, pages)
+        with memory.in_use(tournament_id):
+            async with aclosing(found):
+                async for weight, html in found:
+                    yield {**weight.as_dict(), "html": html}
+
+    return await send_stream(request, rows(), stream_format(request) or "json")
+
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>/brackets/updates")
+async def bracket_updates(request: Request, tournament_type: str, tournament_id: int) -> None:
+    tourney_type: EventType = EventType.from_alias(tournament_type)
+    weight_ids = parse_list(request.args.get("weight"))
+    if weight_ids and not all(weight_id.isdigit() for weight_id in weight_ids):
+        raise InvalidQueryParameter("Invalid weight, expected comma separated weight ids")
+    # Fails with a proper status for a missing tournament or weight, rather than a stream that never says anything
+    parsed = await get_brackets(tourney_type, tournament_id)
+    unknown = set(weight_ids or ()) - {str(w.weight_id) for w in parsed.weights}
+    if unknown:
+        raise InvalidQueryParameter(f"Unknown weight {', '.join(sorted(unknown))}")
+
+    async def refresh() -> None:
+        # Nobody waits on a poll, so it mustn't crowd out requests someone is waiting on
+        with priority(Priority.REFRESH):
+            parsed = await get_brackets(tourney_type, tournament_id)
+            found = iter_bracket_data_html(tourney_type, tournament_id, parsed.weights)
+            async with aclosing(found):
+                async for _ in found:
+                    pass
 
-@app.get("/tournaments/<tournament_type:str>/<tournament_id:int>/brackets/<weight_class_id:int>")
+    events = bracket_versions.follow(
+        tournament_id, refresh, {int(weight_id) for weight_id in weight_ids} if weight_ids else None
+    )
+    # The stream never ends, so it is always sent a line per event, starting with a heartbeat
+    return await send_stream(request, events, "ndjson")
+
+@app.get(f"/tournaments/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>/brackets/<weight_class_id:int>")
 async def bracket(request: Request, tournament_type: str, tournament_id: int, weight_class_id: str) -> Response:
     tourney_type: EventType = EventType.from_alias(tournament_type)
-    if not tourney_type:
-        return Response(ok=False, error="Invalid tournament type")
-    _pages: str | None = request.args.get("pages", None)
-    pages = (int(i) for i in _pages.split(",")) if _pages else None
+    pages = _bracket_pages(request)
+    since = request.args.get("since")
+    if since is not None and not since.isdigit():
+        raise InvalidQueryParameter("Invalid since, expected a bracket version")
+
+    # A client already holding a version confirmed moments ago doesn't need upstream asked again
+    known = bracket_versions.known(tournament_id, weight_class_id, pages)
+    if since is not None and known is not None and known.is_fresh and known.version == int(since):
+        return empty(status=304, headers={"bracket-version": str(known.version)})
     parsed = await get_bracket_data_html(tourney_type, tournament_id, weight_class_id, pages)
-    return Response(ok=True, data=parsed)
+    version = bracket_versions.known(tournament_id, weight_class_id, pages).version
+    if since is not None and version == int(since):
+        return empty(status=304, headers={"bracket-version": str(version)})
+    response = Response(ok=True, data=parsed, max_age=15, version=version)
+    response.headers["bracket-version"] = str(version)
+    return response
+
+def _admin_only(handler):
+    @wraps(handler)
+    async def guarded(request: Request, *args, **kwargs):
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return Response(ok=False, error="Unauthorized", status=401)
+        return await handler(request, *args, **kwargs)
+    return guarded
+
+# Without a token the admin endpoints aren't routed at all
+if ADMIN_TOKEN:
+    @app.get("/admin/profile")
+    @_admin_only
+    async def profile(request: Request):
+        try:
+            seconds = float(request.args.get("seconds", "10"))
+        except ValueError:
+            raise InvalidQueryParameter("Invalid seconds")
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            raise InvalidQueryParameter(f"Invalid seconds, expected at most {PROFILE_MAX_SECONDS:g}")
+
+        mode = request.args.get("mode", "sample")
+        if mode == "sample":
+            # Collapsed stacks, ready for flamegraph.pl or speedscope
+            body, extension = await profiler.sample(seconds), "collapsed"
+        elif mode == "cprofile":
+            body, extension = await profiler.trace_calls(seconds), "txt"
+        else:
+            raise InvalidQueryParameter("Invalid mode, expected sample or cprofile")
+        filename = f"profile-{os.getpid()}-{int(time.time())}.{extension}"
+        return text(body, headers={"content-disposition": f'attachment; filename="{filename}"'})
+
+    @app.post("/admin/memory")
+    @_admin_only
+    async def start_memory_tracing(_: Request) -> Response:
+        profiler.start_memory()
+        return Response(ok=True, data={"pid": os.getpid()})
+
+    @app.get("/admin/memory")
+    @_admin_only
+    async def memory_diff(request: Request) -> Response:
+        if profiler.baseline is None:
+            return Response(ok=False, error="Memory tracing isn't running, POST /admin/memory first", status=409)
+        files = parse_list(request.args.get("files"))
+        limit = request.args.get("limit", "20")
+        return Response(
+            ok=True,
+            data=profiler.memory_diff(
+                tuple(files) if files else MEMORY_WATCHED_FILES, int(limit) if limit.isdigit() else 20
+            ),
+        )
+
+    @app.delete("/admin/memory")
+    @_admin_only
+    async def stop_memory_tracing(_: Request) -> Response:
+        profiler.stop_memory()
+        return Response(ok=True)
+
+    @app.get("/admin/archives")
+    @_admin_only
+    async def list_archives(_: Request) -> Response:
+        return Response(ok=True, data=archives.manifests())
+
+    @app.post(f"/admin/archives/<tournament_type:{_TOURNAMENT_TYPES}>/<tournament_id:int>")
+    @_admin_only
+    async def create_archive(request: Request, tournament_type: str, tournament_id: int) -> Response:
+        force = request.args.get("force", "false").lower() in ("1", "true", "yes")
+        manifest = await archive_tournament(EventType.from_alias(tournament_type), tournament_id, force=force)
+        return Response(ok=True, data=manifest)
+
+    @app.get("/admin/archives/<tournament_id:int>")
+    @_admin_only
+    async def download_archive(_: Request, tournament_id: int):
+        if archives.get(tournament_id) is None:
+            raise NotFound(f"Tournament {tournament_id} isn't archived")
+        return await file(archives.path(tournament_id), filename=f"{tournament_id}.zip", mime_type="application/zip")
+
+    @app.put("/admin/archives")
+    @_admin_only
+    async def import_archive(request: Request) -> Response:
+        return Response(ok=True, data=archives.import_bytes(request.body))
 
 if __name__ == "__main__":
     app.run(host="localhost", port=8000, debug=True, dev=True)
\ No newline at end of file
@@ -0,0 +1,19 @@
+import asyncio
+from utils.bracket_versions import TournamentBrackets, bracket_key
+
+KEY = bracket_key(101)
+
+
+def test_workers_sharing_a_log_number_versions_alike(tmp_path):
+    async def run():
+        path = str(tmp_path / "866546132.log")
+        first, second = TournamentBrackets(path), TournamentBrackets(path)
+        assert (await first.observe(KEY, "<div>A</div>")).version == 1
+        # The other worker sees the same content second, and takes the version already logged
+        assert (await second.observe(KEY, "<div>A</div>")).version == 1
+        assert (await second.observe(KEY, "<div>B</div>")).version == 2
+        assert (await first.observe(KEY, "<div>B</div>")).version == 2
+        assert (await asyncio.gather(first.observe(KEY, "<div>C</div>"), first.observe(KEY, "<div>C</div>")))[0].version == 3
+        assert TournamentBrackets(path).versions[KEY].version == 3
+
+    asyncio.run(run())
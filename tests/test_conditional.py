@@ -0,0 +1,25 @@
+import time
+from types import SimpleNamespace
+from email.utils import parsedate_to_datetime
+from utils.conditional import _ResourceVersions
+
+
+def _exchange(body: bytes, if_none_match: str = None):
+    request = SimpleNamespace(path="/tournaments", query_string="", headers={"if-none-match": if_none_match} if if_none_match else {})
+    response = SimpleNamespace(status=200, body=body, content_type="application/json", headers={})
+    return request, response
+
+
+def test_versions_within_one_second_differ_by_etag_not_by_a_future_stamp():
+    versions = _ResourceVersions()
+    stamps, etags = [], []
+    for body in (b"[1]", b"[2]", b"[3]"):
+        request, response = _exchange(body)
+        assert not versions.apply(request, response)
+        stamps.append(parsedate_to_datetime(response.headers["last-modified"]).timestamp())
+        etags.append(response.headers["etag"])
+    assert max(stamps) <= time.time()
+    assert len(set(etags)) == 3
+    request, response = _exchange(b"[3]", etags[-1])
+    assert versions.apply(request, response)
+    assert response.status == 304 and response.headers["etag"] == etags[-1]
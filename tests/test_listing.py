@@ -0,0 +1,59 @@
+import base64
+import pytest
+from utils.listing import InvalidQueryParameter, _encode_cursor, paginate
+
+ITEMS = [{"date": "2025-01-0%d" % (i // 2 + 1), "id": i} for i in range(10)]
+
+
+def _key(item: dict) -> tuple:
+    return item["date"], item["id"]
+
+
+def _ids(page):
+    return [item["id"] for item in page]
+
+
+def test_pages_follow_each_other_and_the_last_has_no_cursor():
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = paginate(list(reversed(ITEMS)), _key, cursor, "3")
+        seen.extend(_ids(page))
+        if cursor is None:
+            break
+    assert seen == list(range(10))
+    # A page ending exactly at the last item doesn't hand out a cursor to an empty page either
+    page, cursor = paginate(ITEMS, _key, None, "10")
+    assert len(page) == 10 and cursor is None
+
+
+def test_cursor_seeks_by_sort_position():
+    page, cursor = paginate(ITEMS, _key, None, "4")
+    assert _ids(page) == [0, 1, 2, 3]
+    # The last item of the page is gone and a new one sorts just before it; neither shifts the next page
+    changed = [item for item in ITEMS if item["id"] != 3] + [{"date": "2025-01-02", "id": -1}]
+    page, _ = paginate(changed, _key, cursor, "2")
+    assert _ids(page) == [4, 5]
+
+
+def test_stale_cursor_past_every_item_gives_an_empty_last_page():
+    page, cursor = paginate(ITEMS, _key, _encode_cursor(("2030-01-01", 0)), "5")
+    assert page == [] and cursor is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b'{"date": 1}').decode(),
+    base64.urlsafe_b64encode(b"[1.5]").decode(),
+    # Decodes fine but belongs to a listing keyed differently
+    _encode_cursor((7, 3)),
+])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidQueryParameter, match="Invalid cursor"):
+        paginate(ITEMS, _key, cursor, "3")
+
+
+@pytest.mark.parametrize("limit", ["0", "-1", "ten"])
+def test_invalid_limit_is_rejected(limit):
+    with pytest.raises(InvalidQueryParameter, match="Invalid limit"):
+        paginate(ITEMS, _key, None, limit)
@@ -0,0 +1,20 @@
+import asyncio
+from types import SimpleNamespace
+from utils.mat_history import MatStats, _Log
+
+
+def _board(*rows):
+    return [SimpleNamespace(mat=mat, bout=bout, status=status) for mat, bout, status in rows]
+
+
+def test_transitions_logged_off_the_loop_are_replayed_by_another_worker(tmp_path):
+    async def run():
+        stats = MatStats(_Log(str(tmp_path)))
+        await stats.observe(_board((1, 101, "in_progress"), (1, 102, "on_deck")), 1000.0)
+        await stats.observe(_board((1, 102, "in_progress"), (2, 201, "in_hole")), 1300.0)
+        other = MatStats(_Log(str(tmp_path)))
+        other.replay()
+        assert other.transitions == stats.transitions == 4
+        assert other.statuses == stats.statuses
+
+    asyncio.run(run())
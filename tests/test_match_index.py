@@ -0,0 +1,37 @@
+from models.ttypes import Match, Team, Wrestler
+from utils.match_index import MatchIndex, _match_key
+
+
+def _wrestler(wrestler_id: str, team_id: str = "t1") -> Wrestler:
+    return Wrestler(id=wrestler_id, first_name="First", last_name=wrestler_id, team=Team(id=team_id, name=team_id, shortName=team_id))
+
+
+def _match(mat: int, bout: int, first: str = "w1", second: str = "w2", status: str = "in_hole") -> Match:
+    return Match(
+        mat=mat, bout=bout, status=status, weight_class="120", round="Quarterfinal",
+        wrestler1=_wrestler(first), wrestler2=_wrestler(second),
+    )
+
+
+def test_rows_with_mat_and_bout_are_keyed_by_them():
+    assert _match_key(_match(3, 12)) == (3, 12)
+    assert _match_key(_match(3, 12, "w5", "w6")) == (3, 12)
+
+
+def test_rows_missing_mat_or_bout_are_told_apart_by_their_wrestlers():
+    assert _match_key(_match(0, 12, "w1", "w2")) != _match_key(_match(0, 12, "w3", "w4"))
+    assert _match_key(_match(3, 0, "w1", "w2")) != _match_key(_match(3, 0, "w3", "w4"))
+    index = MatchIndex()
+    board = [_match(0, 0, "w1", "w2"), _match(0, 0, "w3", "w4"), _match(1, 1, "w5", "w6")]
+    index.update(board)
+    assert index.all() == board
+    assert index.for_wrestler("w3") == [board[1]]
+
+
+def test_identical_rows_are_each_listed():
+    index = MatchIndex()
+    board = [_match(0, 0), _match(0, 0), _match(0, 0)]
+    index.update(board)
+    assert len(index.all()) == 3
+    index.update(board[:1])
+    assert len(index.all()) == 1 and index.for_wrestler("w1") == board[:1]
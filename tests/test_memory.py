@@ -0,0 +1,61 @@
+import time
+import asyncio
+from datetime import date, timedelta
+from types import SimpleNamespace
+import server
+from utils.memory import _MemoryAccountant
+
+LIVE, BUSY, COLD, WARM = 1, 2, 3, 4
+
+
+def _accountant(held: dict, live: set) -> _MemoryAccountant:
+    accountant = _MemoryAccountant(budget=250)
+    accountant.track("pages", lambda: held, lambda tournament_id: held.pop(tournament_id, None), size=len)
+    accountant.protect(lambda tournament_id: tournament_id in live)
+    return accountant
+
+
+def test_coldest_finished_tournaments_are_evicted_first():
+    async def run():
+        held = {tournament_id: "x" * 100 for tournament_id in (LIVE, BUSY, COLD, WARM)}
+        accountant = _accountant(held, {LIVE})
+        for tournament_id in (LIVE, COLD, WARM):
+            accountant.touch(tournament_id)
+        accountant.begin(BUSY)
+        # Only two tournaments fit; the live one and the one being answered stay whatever their age
+        assert await accountant.enforce() == [COLD, WARM]
+        assert set(held) == {LIVE, BUSY}
+        assert accountant.evicted == 2
+
+    asyncio.run(run())
+
+
+def test_nothing_is_evicted_within_budget_or_when_everything_is_live():
+    async def run():
+        held = {tournament_id: "x" * 100 for tournament_id in (LIVE, COLD)}
+        assert await _accountant(held, set()).enforce() == []
+        held[WARM] = "x" * 100
+        assert await _accountant(held, {LIVE, COLD, WARM}).enforce() == []
+        assert len(held) == 3
+
+    asyncio.run(run())
+
+
+def test_tournament_is_live_while_followed_wrestled_or_under_way(monkeypatch):
+    assert not server._is_live(LIVE)
+    monkeypatch.setitem(server.bracket_versions.tournaments, LIVE, SimpleNamespace(subscribers={object()}))
+    assert server._is_live(LIVE)
+
+    monkeypatch.setitem(server.mat_history.tournaments, COLD, SimpleNamespace(last_seen=time.time() - 60))
+    assert server._is_live(COLD)
+    monkeypatch.setitem(server.mat_history.tournaments, COLD, SimpleNamespace(last_seen=time.time() - server.LIVE_WINDOW - 60))
+    assert not server._is_live(COLD)
+
+    today = date.today()
+    monkeypatch.setitem(server.search_index.tournaments, WARM, SimpleNamespace(start_date=today - timedelta(days=1), end_date=today))
+    assert server._is_live(WARM)
+    monkeypatch.setitem(server.search_index.tournaments, WARM, SimpleNamespace(start_date=today - timedelta(days=3), end_date=today - timedelta(days=1)))
+    assert not server._is_live(WARM)
+    # An archived tournament is over whatever else says so
+    monkeypatch.setattr(server.archives, "get", lambda tournament_id, *args: object() if tournament_id == LIVE else None)
+    assert not server._is_live(LIVE)
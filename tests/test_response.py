@@ -0,0 +1,35 @@
+import json
+from types import SimpleNamespace
+import msgpack
+import pytest
+from sanic.headers import parse_accept
+from models.response import Response
+
+DATA = {"tournament_id": 866546132, "start_date": "2025-01-04", "weights": [120, 126]}
+
+
+def _negotiated(accept):
+    return Response(ok=True, data=DATA).negotiate(SimpleNamespace(accept=parse_accept(accept)))
+
+
+@pytest.mark.parametrize("accept", [None, "*/*", "application/json", "application/json, application/msgpack;q=0.5", "text/html"])
+def test_json_unless_msgpack_is_preferred(accept):
+    response = _negotiated(accept)
+    assert response.content_type == "application/json"
+    assert json.loads(response.body) == {"ok": True, "data": DATA}
+    assert "Accept" in response.headers["vary"]
+
+
+@pytest.mark.parametrize("accept", ["application/msgpack", "application/x-msgpack", "application/json;q=0.5, application/msgpack"])
+def test_msgpack_when_preferred(accept):
+    response = _negotiated(accept)
+    assert response.content_type == accept.split(",")[-1].strip()
+    assert msgpack.unpackb(response.body) == {"ok": True, "data": DATA}
+    assert "Accept" in response.headers["vary"]
+
+
+def test_json_when_msgpack_is_not_installed(monkeypatch):
+    monkeypatch.setattr("models.response.msgpack", None)
+    response = _negotiated("application/msgpack")
+    assert response.content_type == "application/json"
+    assert json.loads(response.body)["data"]["tournament_id"] == 866546132
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from utils.scheduler import Priority, _PriorityScheduler
+
+
+async def _hold(scheduler: _PriorityScheduler, level: Priority, started: list, release: asyncio.Event):
+    async with scheduler.slot(level):
+        started.append(level)
+        await release.wait()
+
+
+def test_waiters_are_served_most_urgent_first():
+    async def run():
+        scheduler = _PriorityScheduler(concurrency=1)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(scheduler, Priority.LIVE, [], release))
+        await asyncio.sleep(0)
+        order = []
+        waiters = [
+            asyncio.ensure_future(_hold(scheduler, level, order, release))
+            for level in (Priority.BACKGROUND, Priority.REFRESH, Priority.LIVE, Priority.REFRESH)
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["refresh"]["queued"] == 2
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        assert order == [Priority.LIVE, Priority.REFRESH, Priority.REFRESH, Priority.BACKGROUND]
+
+    asyncio.run(run())
+
+
+def test_lower_classes_only_fill_their_share_of_the_pool():
+    async def run():
+        scheduler = _PriorityScheduler(concurrency=4)
+        started, release = [], asyncio.Event()
+        background = [asyncio.ensure_future(_hold(scheduler, Priority.BACKGROUND, started, release)) for _ in range(4)]
+        await asyncio.sleep(0)
+        # Half of the pool, the rest stays free for more urgent work
+        assert scheduler.in_flight[Priority.BACKGROUND] == 2
+        live = [asyncio.ensure_future(_hold(scheduler, Priority.LIVE, started, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert scheduler.in_flight[Priority.LIVE] == 2
+        release.set()
+        await asyncio.gather(*background, *live)
+        assert sum(scheduler.in_flight.values()) == 0
+
+    asyncio.run(run())
+
+
+def test_cancelling_a_waiter_after_its_slot_was_handed_over_frees_the_slot():
+    async def run():
+        scheduler = _PriorityScheduler(concurrency=1)
+        held, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.ensure_future(_hold(scheduler, Priority.LIVE, [], held))
+        await asyncio.sleep(0)
+        started = []
+        cancelled = asyncio.ensure_future(_hold(scheduler, Priority.LIVE, started, release))
+        following = asyncio.ensure_future(_hold(scheduler, Priority.LIVE, started, release))
+        await asyncio.sleep(0)
+        release.set()
+        held.set()
+        await asyncio.sleep(0)
+        # The holder has handed its slot to the first waiter, which hasn't resumed yet
+        assert holder.done() and scheduler.in_flight[Priority.LIVE] == 1
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await following
+        assert started == [Priority.LIVE]
+        assert sum(scheduler.in_flight.values()) == 0
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+import asyncio
+from utils import session_manager as session_module
+from utils.session_manager import _SessionManager
+from utils.upstream import UpstreamFailed
+
+
+def test_concurrent_requests_share_one_handshake(monkeypatch):
+    handshakes = []
+
+    async def fetch_text(session, path, params=None, allow_stale=True):
+        handshakes.append(path)
+        await asyncio.sleep(0.01)
+        return ""
+
+    monkeypatch.setattr(session_module.upstream, "fetch_text", fetch_text)
+
+    async def run():
+        manager = _SessionManager()
+
+        async def use():
+            async with manager.get_session(1) as session:
+                # Nobody gets the session before its handshake is done
+                assert len(handshakes) == 1 and 1 in manager.sessions
+                return session
+
+        sessions = await asyncio.gather(*(use() for _ in range(4)))
+        assert len(set(map(id, sessions))) == 1
+        await manager.cleanup()
+
+    asyncio.run(run())
+    assert len(handshakes) == 1
+
+
+def test_failed_handshake_stores_no_session(monkeypatch):
+    async def fetch_text(session, path, params=None, allow_stale=True):
+        await asyncio.sleep(0.01)
+        raise UpstreamFailed("VerifyPassword.jsp", 1)
+
+    monkeypatch.setattr(session_module.upstream, "fetch_text", fetch_text)
+
+    async def run():
+        manager = _SessionManager()
+
+        async def use():
+            async with manager.get_session(1):
+                pass
+
+        results = await asyncio.gather(*(use() for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, UpstreamFailed) for result in results)
+        assert not manager.sessions and not manager.handshakes
+
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+import os
+import asyncio
+from typing import List
+from models.ttypes import Weight
+from parsers.tournaments import parse_bracket_results
+from utils import standings as standings_module
+from utils.bracket_versions import bracket_versions
+from utils.standings import TournamentStandings
+
+TOURNAMENT_ID = 866546132
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "htmls", "bracket-results.html")
+
+
+def _weight(weight_id: int) -> Weight:
+    return Weight(weight_index=0, weight_id=weight_id, weight_name=str(weight_id), division_id=1, bracket_id=weight_id)
+
+
+class _Upstream:
+    """Hands out each weight's bracket, remembering which weights were asked for"""
+
+    def __init__(self, weights: List[Weight], html: str):
+        self.weights = weights
+        self.html = html
+        self.fetched: List[List[int]] = []
+
+    async def listed(self) -> List[Weight]:
+        return self.weights
+
+    async def fetch(self, weights: List[Weight]):
+        self.fetched.append([weight.weight_id for weight in weights])
+        for weight in weights:
+            yield weight, self.html
+
+
+def _teams(standings: TournamentStandings) -> List[tuple]:
+    return [(team["rank"], team["team"], team["points"]) for team in standings.as_dict()["teams"]]
+
+
+def _fixture() -> str:
+    with open(FIXTURE) as f:
+        return f.read()
+
+
+def _standings(monkeypatch) -> TournamentStandings:
+    monkeypatch.setattr(bracket_versions, "directory", None)
+    bracket_versions.discard(TOURNAMENT_ID)
+    return TournamentStandings(TOURNAMENT_ID)
+
+
+def test_placements_and_tied_teams(monkeypatch):
+    async def run():
+        standings = _standings(monkeypatch)
+        upstream = _Upstream([_weight(120)], _fixture())
+        await standings.refresh(upstream.listed, upstream.fetch, parse_bracket_results)
+        # Tied teams share the better rank and are listed by name
+        assert _teams(standings) == [
+            (1, "Liberty", 27.0),
+            (2, "Ballard", 23.5),
+            (2, "Kentridge", 23.5),
+            (4, "Skyline", 15.0),
+        ]
+        ballard = next(team for team in standings.as_dict()["teams"] if team["team"] == "Ballard")
+        assert [(p["place"], p["wrestler"]) for p in ballard["placers"]] == [(4, "Caleb Young"), (5, "Eli Ellis")]
+        kentridge = next(team for team in standings.as_dict()["teams"] if team["team"] == "Kentridge")
+        assert kentridge["champions"] == 1
+
+    asyncio.run(run())
+
+
+def test_unchanged_brackets_are_neither_downloaded_nor_rescored(monkeypatch):
+    async def run():
+        standings = _standings(monkeypatch)
+        upstream = _Upstream([_weight(120), _weight(126)], _fixture())
+        await standings.refresh(upstream.listed, upstream.fetch, parse_bracket_results)
+        assert standings.weights_rescored == 2
+        # Both versions were just confirmed, so nothing needs asking upstream
+        await standings.refresh(upstream.listed, upstream.fetch, parse_bracket_results)
+        assert upstream.fetched[-1] == []
+        # Once the confirmation is old, brackets are downloaded again but only rescored if they moved
+        monkeypatch.setattr(standings_module.bracket_versions, "known", lambda tournament_id, weight_id: None)
+        await standings.refresh(upstream.listed, upstream.fetch, parse_bracket_results)
+        assert upstream.fetched[-1] == [120, 126]
+        assert standings.weights_rescored == 2
+
+    asyncio.run(run())
+
+
+def test_removed_weight_takes_its_points_along(monkeypatch):
+    async def run():
+        standings = _standings(monkeypatch)
+        upstream = _Upstream([_weight(120), _weight(126)], _fixture())
+        await standings.refresh(upstream.listed, upstream.fetch, parse_bracket_results)
+        assert _teams(standings)[0] == (1, "Liberty", 54.0)
+        upstream.weights = [_weight(120)]
+        await standings.refresh(upstream.listed, upstream.fetch, parse_bracket_results)
+        assert _teams(standings)[0] == (1, "Liberty", 27.0)
+        assert standings.as_dict()["weights_scored"] == 1
+        upstream.weights = []
+        await standings.refresh(upstream.listed, upstream.fetch, parse_bracket_results)
+        assert _teams(standings) == []
+
+    asyncio.run(run())
@@ -0,0 +1,13 @@
+from datetime import date
+from models.ttypes import TournamentSearch
+
+
+def test_search_keeps_case_upstream_but_not_in_its_cache_key():
+    typed = TournamentSearch(name="  Mat  Classic ", state="wa", city="Seattle", start_date=date(2025, 1, 4))
+    assert typed.as_params()["tName"] == "Mat Classic"
+    assert typed.as_params()["state"] == "wa"
+    assert typed.as_params()["city"] == "Seattle"
+    same = TournamentSearch(name="mat classic", state="WA", city="SEATTLE", start_date=date(2025, 1, 4))
+    assert typed == same and hash(typed) == hash(same)
+    assert {typed: 1}[same] == 1
+    assert typed != TournamentSearch(name="mat classic", state="WA", city="SEATTLE")
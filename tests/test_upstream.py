@@ -0,0 +1,161 @@
+import time
+import asyncio
+import pytest
+from utils import upstream as upstream_module
+from utils.scheduler import Priority
+from utils.upstream import CircuitOpen, UpstreamBusy, _CircuitBreaker, _TokenBucket, _Upstream
+
+ENDPOINT = "TournamentHub.jsp"
+PATH = f"predefinedtournaments/{ENDPOINT}"
+
+
+class _HangingSession:
+    """Stands in for a ClientSession whose requests never come back"""
+
+    def get(self, *args, **kwargs):
+        return self
+
+    def __await__(self):
+        return asyncio.sleep(3600).__await__()
+
+    async def __aenter__(self):
+        await asyncio.sleep(3600)
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def _half_open(upstream: _Upstream) -> _CircuitBreaker:
+    breaker = upstream.breaker(ENDPOINT)
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+    return breaker
+
+
+def test_cancelled_trial_lets_the_next_one_through():
+    async def run():
+        upstream = _Upstream()
+        breaker = _half_open(upstream)
+        task = asyncio.ensure_future(upstream._fetch(_HangingSession(), ENDPOINT, PATH, None))
+        await asyncio.sleep(0.01)
+        assert breaker.trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not breaker.trial_in_flight
+        assert breaker.allow()
+
+    asyncio.run(run())
+
+
+def test_busy_trial_lets_the_next_one_through(monkeypatch):
+    monkeypatch.setattr(upstream_module, "UPSTREAM_QUEUE_TIMEOUT", 0)
+
+    async def run():
+        upstream = _Upstream()
+        breaker = _half_open(upstream)
+        bucket = upstream.buckets[ENDPOINT] = _TokenBucket(0.01, 1)
+        bucket.tokens = 0
+        with pytest.raises(UpstreamBusy):
+            await upstream._fetch(_HangingSession(), ENDPOINT, PATH, None)
+        assert breaker.allow()
+
+    asyncio.run(run())
+
+
+def test_abandoned_streaming_trial_lets_the_next_one_through():
+    async def run():
+        upstream = _Upstream()
+        breaker = _half_open(upstream)
+        stream = upstream.stream_text(_HangingSession(), PATH)
+        task = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert breaker.allow()
+
+    asyncio.run(run())
+
+
+def test_circuit_stays_open_while_a_trial_is_in_flight():
+    async def run():
+        upstream = _Upstream()
+        breaker = _half_open(upstream)
+        task = asyncio.ensure_future(upstream._fetch(_HangingSession(), ENDPOINT, PATH, None))
+        await asyncio.sleep(0.01)
+        with pytest.raises(CircuitOpen):
+            await upstream._fetch(_HangingSession(), ENDPOINT, PATH, None)
+        # Turning the second request away leaves the first one's trial in place
+        assert breaker.trial_in_flight
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+class _Content:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def iter_chunked(self, size):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class _Response:
+    status = 200
+    charset = "utf-8"
+    content_type = "text/html"
+
+    def __init__(self, chunks):
+        self.content = _Content(chunks)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class _StreamingSession:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def get(self, *args, **kwargs):
+        return _Response(self.chunks)
+
+
+def test_slow_stream_consumer_holds_no_scheduler_slot():
+    async def run():
+        upstream = _Upstream()
+        stream = upstream.stream_text(_StreamingSession([b"<html>", b"</html>"]), PATH)
+        assert await stream.__anext__() == "<html>"
+        # The consumer is busy with the first chunk; the slot must already be free
+        assert sum(upstream_module.scheduler.in_flight.values()) == 0
+        assert [text async for text in stream] == ["</html>"]
+
+    asyncio.run(run())
+
+
+def test_every_priority_can_use_a_single_token_bucket():
+    async def run():
+        for level in Priority:
+            bucket = _TokenBucket(1, 1)
+            await bucket.acquire(ENDPOINT, 0, reserve=bucket.reserve(level))
+
+    asyncio.run(run())
+
+
+def test_request_waiting_for_rate_budget_holds_no_scheduler_slot():
+    async def run():
+        upstream = _Upstream()
+        bucket = upstream.buckets[ENDPOINT] = _TokenBucket(0.01, 1)
+        bucket.tokens = 0
+        task = asyncio.ensure_future(upstream._fetch(_HangingSession(), ENDPOINT, PATH, None))
+        await asyncio.sleep(0.01)
+        assert sum(upstream_module.scheduler.in_flight.values()) == 0
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
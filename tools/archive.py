@@ -0,0 +1,71 @@
+"""Archive finished tournaments, and import archives made on other nodes
+
+    python -m tools.archive crawl predefined 866546132
+    python -m tools.archive import other-node/866546132.zip
+    python -m tools.archive list
+
+An archive is a single zip in ARCHIVE_DIR holding the tournament's hub, bracket viewer,
+final mat board and every weight's bracket as upstream returned them. Once it is there,
+the API answers for that tournament from the archive without going upstream. Copy the
+file to another node and import it there to do the same.
+"""
+import sys
+import asyncio
+import argparse
+from models.ttypes import EventType
+from parsers.tournaments import BRACKET_EXPORT_CONCURRENCY, TournamentNotFinished, archive_tournament, cleanup
+from utils.archive import InvalidArchive, archives
+
+
+async def crawl(tournament_type: EventType, tournament_id: int, concurrency: int, force: bool) -> dict:
+    try:
+        return await archive_tournament(tournament_type, tournament_id, concurrency, force)
+    finally:
+        await cleanup()
+
+
+def _summary(manifest: dict) -> str:
+    tournament = manifest.get("tournament", {})
+    size = f", {manifest['archive_bytes'] / 1024:.0f} KB" if "archive_bytes" in manifest else ""
+    return (
+        f"{manifest['tournament_type']}/{manifest['tournament_id']} {tournament.get('name', '')!r}: "
+        f"{len(manifest.get('weights', []))} weights{size}, archived {manifest.get('archived_at')}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    crawl_parser = commands.add_parser("crawl", help="archive a finished tournament from upstream")
+    crawl_parser.add_argument("tournament_type", choices=[t.alias for t in EventType])
+    crawl_parser.add_argument("tournament_id", type=int)
+    crawl_parser.add_argument("--concurrency", type=int, default=BRACKET_EXPORT_CONCURRENCY, help="brackets fetched at once")
+    crawl_parser.add_argument("--force", action="store_true", help="archive even if the tournament isn't over")
+    import_parser = commands.add_parser("import", help="put archives made elsewhere in place")
+    import_parser.add_argument("paths", nargs="+")
+    commands.add_parser("list", help="show the archived tournaments")
+    args = parser.parse_args()
+
+    if args.command == "crawl":
+        try:
+            manifest = asyncio.run(crawl(EventType.from_alias(args.tournament_type), args.tournament_id, args.concurrency, args.force))
+        except TournamentNotFinished as e:
+            sys.exit(f"{e}, use --force to archive it anyway")
+        print(f"Archived {_summary(manifest)} ({manifest['raw_bytes'] / 1024:.0f} KB of pages)")
+        print(f"Saved to {archives.path(args.tournament_id)}")
+    elif args.command == "import":
+        failed = False
+        for path in args.paths:
+            try:
+                print(f"Imported {_summary(archives.import_file(path))}")
+            except (InvalidArchive, OSError) as e:
+                print(f"FAIL {path}: {e}")
+                failed = True
+        sys.exit(1 if failed else 0)
+    else:
+        for manifest in archives.manifests():
+            print(_summary(manifest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Time the HTML parsers over synthetic pages of growing size
+
+    python -m tools.benchmark
+    python -m tools.benchmark --baseline data/benchmarks/<earlier run>.json
+
+Every parser is run over pages generated by tools/pages.py at each scale, reporting the
+best and median time of --repeat runs, how much memory one parse peaks at, and how many
+memory blocks it allocates. Results are saved as JSON; given a --baseline, any case whose
+median got slower by more than --tolerance is flagged and makes the exit status non-zero.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+from models.ttypes import EventType
+from parsers.tournaments import (
+    _TournamentListParser, _parse_tournament_info, _parse_tournament_matches, _parse_tournaments, parse_bracket_data, parse_bracket_results,
+)
+from tools import pages
+
+# Sizes each page is generated at
+MATS = (4, 16, 60)
+RESULTS = (10, 100, 1000, 5000)
+WEIGHTS = (14, 42, 140)
+
+# Bytes the streaming search parser is fed at a time, as upstream.stream_text reads them
+_CHUNK_SIZE = 64 * 1024
+
+
+def _stream_tournaments(html: str) -> list:
+    parser = _TournamentListParser()
+    found = []
+    for start in range(0, len(html), _CHUNK_SIZE):
+        found += parser.feed(html[start:start + _CHUNK_SIZE])
+    return found + parser.close()
+
+
+def cases(quick: bool = False) -> List[Tuple[str, str, Callable[[], object]]]:
+    """(parser, scale, call) for every parser at every scale"""
+    found = []
+    for mats in MATS[:2] if quick else MATS:
+        html = pages.mat_board(mats)
+        found.append(("matches", f"{mats} mats", lambda html=html: _parse_tournament_matches(html)))
+    for results in RESULTS[:3] if quick else RESULTS:
+        html = pages.search_results(results)
+        found.append(("tournaments", f"{results} results", lambda html=html: _parse_tournaments(html)))
+        found.append(("tournaments_stream", f"{results} results", lambda html=html: _stream_tournaments(html)))
+    html = pages.tournament_hub()
+    found.append(("tournament_info", "hub", lambda: _parse_tournament_info(html, EventType.PREDEFINED, 1)))
+    for weights in WEIGHTS[:2] if quick else WEIGHTS:
+        html = pages.bracket_viewer(weights)
+        found.append(("brackets", f"{weights} weights", lambda html=html: parse_bracket_data(html)))
+    for entrants in (16, 64):
+        html = pages.bracket(1, entrants)
+        found.append(("bracket_results", f"{entrants} entrants", lambda html=html: parse_bracket_results(html, 1)))
+    return found
+
+
+def measure(call: Callable[[], object], repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - started)
+
+    # Parse trees are cyclic, with the collector off every block a parse allocates is still held at the end
+    gc.collect()
+    gc.disable()
+    try:
+        blocks = sys.getallocatedblocks()
+        result = call()
+        blocks = sys.getallocatedblocks() - blocks
+    finally:
+        gc.enable()
+    del result
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "best": min(times),
+        "median": statistics.median(times),
+        "peak_bytes": peak,
+        "allocated_blocks": blocks,
+    }
+
+
+def check(results: Dict[str, dict], baseline: Optional[dict], tolerance: float) -> List[str]:
+    problems = []
+    for case, stats in results.items():
+        before = (baseline or {}).get("results", {}).get(case)
+        if before and stats["median"] > before["median"] * (1 + tolerance):
+            problems.append(f"{case}: median went from {before['median'] * 1000:.2f}ms to {stats['median'] * 1000:.2f}ms")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--quick", action="store_true", help="skip the largest pages")
+    parser.add_argument("--only", nargs="+", help="parsers to run, e.g. matches brackets")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="fraction a case may get slower by")
+    parser.add_argument("--out", help="where to save the results")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    print(f"{'parser':<20}{'scale':<15}{'best ms':>10}{'median ms':>11}{'peak KB':>10}{'blocks':>10}")
+    for name, scale, call in cases(args.quick):
+        if args.only and name not in args.only:
+            continue
+        stats = measure(call, args.repeat)
+        results[f"{name} {scale}"] = {"parser": name, "scale": scale, **stats}
+        print(
+            f"{name:<20}{scale:<15}{stats['best'] * 1000:>10.2f}{stats['median'] * 1000:>11.2f}"
+            f"{stats['peak_bytes'] / 1024:>10.0f}{stats['allocated_blocks']:>10}",
+            flush=True,
+        )
+
+    problems = check(results, baseline, args.tolerance)
+    for problem in problems:
+        print(f"FAIL {problem}")
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    path = args.out or os.path.join("data", "benchmarks", f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": commit,
+            "python": sys.version.split()[0],
+            "repeat": args.repeat,
+            "baseline": args.baseline,
+            "results": results,
+            "problems": problems,
+        }, f, indent=2)
+    print(f"Saved to {path}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Check alternative parser backends against the BeautifulSoup html.parser reference
+
+    python -m tools.differential --cassettes data/cassettes --mutations 20
+
+Every page in the corpus (recorded cassettes, the samples in htmls/, generated pages, and
+edge case and randomly mutated variants of all of them) is parsed by the reference and by
+every backend available here: each other BeautifulSoup tree builder that is installed
+(lxml, html5lib) and, for search results, the streaming parser fed in random chunks.
+Outputs are compared through as_dict(), a parse that raises only matching a reference that
+raises the same way. Divergences are reported with the first field that differs, along with
+each backend's speedup over the reference, and make the exit status non-zero.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import importlib.util
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import parsers.tournaments as tournaments
+from models.ttypes import EventType
+from tools import pages
+from utils.cassettes import load_cassettes
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REFERENCE = "html.parser"
+# BeautifulSoup tree builders and the module each needs
+_TREE_BUILDERS = {"lxml": "lxml", "html5lib": "html5lib"}
+
+Outcome = Tuple[str, object]
+
+
+def _outcome(parse: Callable[[str], object], html: str) -> Outcome:
+    try:
+        parsed = parse(html)
+    except Exception as e:
+        return "error", type(e).__name__
+    if isinstance(parsed, list):
+        return "ok", [item.as_dict() for item in parsed]
+    return "ok", parsed.as_dict() if parsed is not None else None
+
+
+def _difference(expected: object, actual: object, path: str = "") -> Optional[str]:
+    """Where `actual` first differs from `expected`, if it does"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(expected.keys() | actual.keys()):
+            found = _difference(expected.get(key), actual.get(key), f"{path}.{key}")
+            if found:
+                return found
+        return None
+    if isinstance(expected, list) and isinstance(actual, list):
+        for index, (a, b) in enumerate(zip(expected, actual)):
+            found = _difference(a, b, f"{path}[{index}]")
+            if found:
+                return found
+        if len(expected) != len(actual):
+            return f"{path or 'results'}: {len(expected)} items != {len(actual)}"
+        return None
+    if expected != actual:
+        return f"{path or 'result'}: {expected!r} != {actual!r}"
+    return None
+
+
+@contextmanager
+def _tree_builder(name: str):
+    previous = tournaments.HTML_PARSER
+    tournaments.HTML_PARSER = name
+    try:
+        yield
+    finally:
+        tournaments.HTML_PARSER = previous
+
+
+def _with_builder(parse: Callable[[str], object], name: str) -> Callable[[str], object]:
+    def run(html: str) -> object:
+        with _tree_builder(name):
+            return parse(html)
+    return run
+
+
+def _stream(seed: str) -> Callable[[str], object]:
+    """The streaming search parser, fed the page in random pieces as a slow connection would"""
+    def run(html: str) -> object:
+        rng = random.Random(seed)
+        parser = tournaments._TournamentListParser()
+        found, position = [], 0
+        while position < len(html):
+            size = rng.choice((1, 7, 64, 512, 4096, 65536))
+            found += parser.feed(html[position:position + size])
+            position += size
+        return found + parser.close()
+    return run
+
+
+# The reference parse of each kind of page
+PARSERS: Dict[str, Callable[[str], object]] = {
+    "tournaments": tournaments._parse_tournaments,
+    "matches": tournaments._parse_tournament_matches,
+    "tournament_info": lambda html: tournaments._parse_tournament_info(html, EventType.PREDEFINED, 1),
+    "brackets": tournaments.parse_bracket_data,
+}
+
+
+def backends(kind: str, case: str) -> Dict[str, Callable[[str], object]]:
+    """Every backend available here for `kind`, the reference included"""
+    found = {REFERENCE: _with_builder(PARSERS[kind], REFERENCE)}
+    for builder, module in _TREE_BUILDERS.items():
+        if importlib.util.find_spec(module) is not None:
+            found[builder] = _with_builder(PARSERS[kind], builder)
+    if kind == "tournaments":
+        found["stream"] = _stream(case)
+    return found
+
+
+def classify(html: str) -> Optional[str]:
+    """Which kind of page `html` is, going by what its parser looks for"""
+    if "tournament-ul" in html:
+        return "tournaments"
+    if "new Pile()" in html:
+        return "brackets"
+    if "hub-nav" in html:
+        return "tournament_info"
+    if "Mat Assignment Display" in html or "MB_MatAssignmentDisplay" in html:
+        return "matches"
+    return None
+
+
+# Edge cases the parsers have to get right, as rewrites of a page of the kind they apply to
+
+def _drop_date_spans(html: str) -> str:
+    return re.sub(r"<span>\s*\d+/\d+(/\d+)?( - \d+/\d+/\d+)?\s*</span>", "", html)
+
+
+def _null_logos(html: str) -> str:
+    return re.sub(r"(eventSelected\(\d+,'[^']*',\d+, )'[^']*'", r"\1'null'", html)
+
+
+def _unparseable_mats(html: str) -> str:
+    return re.sub(r"Mat \d+", "Mat TBD", html, count=max(1, html.count("Mat ") // 2))
+
+
+def _missing_bouts(html: str) -> str:
+    return re.sub(r"(Bout</div><div>)\d+", r"\1", html)
+
+
+def _three_field_weights(html: str) -> str:
+    """Weights as division-less events list them, weight id, name and bracket type"""
+    strings = re.findall(r'str = "([^"]*)";', html)
+    if len(strings) < 4:
+        return html
+    entries = strings[2].split("~")
+    three = "~".join("~".join(entries[i + 1:i + 4]) for i in range(0, len(entries) - 3, 4))
+    return html.replace(f'str = "{strings[1]}";', "", 1).replace(f'str = "{strings[2]}";', f'str = "{three}";', 1)
+
+
+def _empty_brackets(html: str) -> str:
+    return re.sub(r'str = "[^"]*";', 'str = "";', html)
+
+
+def _no_logo(html: str) -> str:
+    return re.sub(r'<div class="logo-icon"><img[^>]*></div>', "", html, count=1)
+
+
+def _single_day(html: str) -> str:
+    return re.sub(r"(\d+/\d+)( - \d+/\d+)?/(\d{4})", r"\1/\3", html)
+
+
+EDGE_CASES: Dict[str, List[Callable[[str], str]]] = {
+    "tournaments": [_drop_date_spans, _null_logos, _single_day],
+    "matches": [_unparseable_mats, _missing_bouts],
+    "tournament_info": [_no_logo, _single_day],
+    "brackets": [_three_field_weights, _empty_brackets],
+}
+
+_TAG = re.compile(r"<[^>]+>")
+
+
+def mutate(html: str, rng: random.Random) -> Tuple[str, str]:
+    """A randomly damaged copy of `html`, and what was done to it"""
+    tags = [m.span() for m in _TAG.finditer(html)]
+    if not tags:
+        return html, "unchanged"
+    kind = rng.choice(("truncate", "drop_tag", "duplicate", "upper_tags", "swap_quotes", "stray_tag", "drop_text"))
+    start, end = rng.choice(tags)
+    if kind == "truncate":
+        cut = rng.randrange(len(html))
+        return html[:cut], f"truncate at {cut}"
+    if kind == "drop_tag":
+        return html[:start] + html[end:], f"drop {html[start:end][:40]!r}"
+    if kind == "duplicate":
+        other_start, other_end = rng.choice(tags)
+        first, last = sorted((start, other_end if other_end > start else end))
+        return html[:last] + html[first:last] + html[last:], f"duplicate {first}:{last}"
+    if kind == "upper_tags":
+        return _TAG.sub(lambda m: m.group(0).upper() if not m.group(0).startswith("<!") else m.group(0), html), "upper case tags"
+    if kind == "swap_quotes":
+        return html.replace("'", '"'), "swap quotes"
+    if kind == "stray_tag":
+        stray = rng.choice(("</li>", "<li>", "</ul>", "</tr>", "<td>", "</div>"))
+        return html[:start] + stray + html[start:], f"insert {stray} at {start}"
+    # drop_text
+    following = tags[tags.index((start, end)) + 1][0] if (start, end) != tags[-1] else len(html)
+    return html[:end] + html[following:], f"drop text at {end}"
+
+
+def corpus(cassettes: Optional[str], mutations: int, seed: int) -> List[Tuple[str, str, str]]:
+    """(case, kind, html) for every page to check"""
+    pages_found: List[Tuple[str, str, str]] = []
+    if cassettes and os.path.isdir(cassettes):
+        for key, recordings in sorted(load_cassettes(cassettes).items()):
+            for index, recording in enumerate(recordings):
+                kind = classify(recording.body)
+                if kind:
+                    pages_found.append((f"cassette {key[0]} {dict(key[1])} #{index}", kind, recording.body))
+    for path in sorted(glob.glob(os.path.join(_ROOT, "htmls", "*.html"))):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            html = f.read()
+        kind = classify(html)
+        if kind:
+            pages_found.append((f"sample {os.path.basename(path)}", kind, html))
+    for mats in (4, 16):
+        pages_found.append((f"generated {mats} mats", "matches", pages.mat_board(mats, seed=seed)))
+    for results in (10, 100):
+        pages_found.append((f"generated {results} results", "tournaments", pages.search_results(results, seed)))
+    pages_found.append(("generated hub", "tournament_info", pages.tournament_hub(seed=seed)))
+    for divisions in (1, 3):
+        pages_found.append((f"generated {divisions} divisions", "brackets", pages.bracket_viewer(14, divisions, seed)))
+
+    found = list(pages_found)
+    rng = random.Random(seed)
+    for case, kind, html in pages_found:
+        for edge_case in EDGE_CASES[kind]:
+            found.append((f"{case} {edge_case.__name__.lstrip('_')}", kind, edge_case(html)))
+        for index in range(mutations):
+            mutated, description = mutate(html, rng)
+            found.append((f"{case} mutation {index} ({description})", kind, mutated))
+    return found
+
+
+def run(cases: List[Tuple[str, str, str]], save_divergent: Optional[str] = None) -> dict:
+    seconds: Dict[Tuple[str, str], float] = {}
+    counts: Dict[Tuple[str, str], int] = {}
+    divergences: List[dict] = []
+    for case, kind, html in cases:
+        outcomes: Dict[str, Outcome] = {}
+        for backend, parse in backends(kind, case).items():
+            started = time.perf_counter()
+            outcomes[backend] = _outcome(parse, html)
+            seconds[kind, backend] = seconds.get((kind, backend), 0.0) + time.perf_counter() - started
+            counts[kind, backend] = counts.get((kind, backend), 0) + 1
+
+        expected = outcomes[REFERENCE]
+        for backend, outcome in outcomes.items():
+            if backend == REFERENCE:
+                continue
+            if outcome[0] != expected[0]:
+                difference = f"reference {expected[0]} {expected[1] if expected[0] == 'error' else ''}".rstrip() + \
+                    f", backend {outcome[0]} {outcome[1] if outcome[0] == 'error' else ''}".rstrip()
+            else:
+                difference = _difference(expected[1], outcome[1])
+            if difference is None:
+                continue
+            divergence = {"kind": kind, "backend": backend, "case": case, "difference": difference}
+            if save_divergent:
+                os.makedirs(save_divergent, exist_ok=True)
+                divergence["saved_as"] = os.path.join(save_divergent, f"{len(divergences):04d}-{kind}.html")
+                with open(divergence["saved_as"], "w") as f:
+                    f.write(html)
+            divergences.append(divergence)
+
+    summary = []
+    for (kind, backend), total in sorted(seconds.items()):
+        reference = seconds[kind, REFERENCE]
+        summary.append({
+            "kind": kind,
+            "backend": backend,
+            "cases": counts[kind, backend],
+            "divergences": sum(1 for d in divergences if d["kind"] == kind and d["backend"] == backend),
+            "seconds": total,
+            "speedup": reference / total if total else None,
+        })
+    return {"backends": summary, "divergences": divergences}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cassettes", default="data/cassettes", help="recorded pages to include, if any")
+    parser.add_argument("--mutations", type=int, default=20, help="randomly damaged copies of each page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--show", type=int, default=20, help="divergences to print")
+    parser.add_argument("--save-divergent", metavar="DIR", help="write every page that diverged here")
+    parser.add_argument("--out", help="where to save the report")
+    args = parser.parse_args()
+
+    cases = corpus(args.cassettes, args.mutations, args.seed)
+    report = run(cases, args.save_divergent)
+
+    print(f"{len(cases)} pages")
+    print(f"{'kind':<17}{'backend':<13}{'cases':>7}{'diverged':>10}{'speedup':>9}")
+    for entry in report["backends"]:
+        speedup = f"{entry['speedup']:.2f}x" if entry["speedup"] else "-"
+        print(f"{entry['kind']:<17}{entry['backend']:<13}{entry['cases']:>7}{entry['divergences']:>10}{speedup:>9}")
+    for divergence in report["divergences"][:args.show]:
+        print(f"{divergence['backend']} on {divergence['case']}: {divergence['difference'][:200]}")
+    missing = [builder for builder, module in _TREE_BUILDERS.items() if importlib.util.find_spec(module) is None]
+    if missing:
+        print(f"Not installed, so not checked: {', '.join(missing)}")
+
+    path = args.out or os.path.join("data", "differential", f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "pages": len(cases), **report}, f, indent=2, default=str)
+    print(f"Saved to {path}")
+    sys.exit(1 if report["divergences"] else 0)
+
+
+if __name__ == "__main__":
+    main()
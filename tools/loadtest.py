@@ -0,0 +1,450 @@
+"""Load test the API against the upstream stand-in and compare runs
+
+Starts tools/standin.py over a cassette directory and main.py pointed at it, with one
+or more worker counts, then drives a mix of clients against the API:
+
+    python -m tools.loadtest --cassettes data/cassettes --mix event --workers 1 4 --duration 60
+
+Each run reports throughput, p50/p95/p99 latency per route, upstream requests per page
+and the server's RSS, and is saved as JSON. Given a --baseline from an earlier run, any
+route whose p95 or throughput got worse by more than --tolerance is flagged as a regression,
+and so is any route missing its p99 SLO; either makes the exit status non-zero.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, List, Optional, Tuple
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+from models.ttypes import EventType
+from utils.cassettes import load_cassettes
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# p99 latency each route is expected to stay under, in seconds
+DEFAULT_SLOS = {"matches": 0.25, "search": 1.0, "brackets": 0.5, "bracket": 0.5}
+
+_SEARCH_TERMS = ("state", "open", "invitational", "classic", "duals", "championship", "youth", "county", "memorial", "christmas")
+
+
+@dataclass
+class Mix:
+    """How many clients of each kind run at once, and how often each sends a request"""
+    pollers: int = 0
+    poll_interval: float = 5.0
+    searchers: int = 0
+    search_interval: float = 10.0
+    bracket_clients: int = 0
+    bracket_interval: float = 15.0
+
+
+MIXES = {
+    # Parents and coaches watching mat boards through an event, with some searching and bracket browsing
+    "event": Mix(pollers=2000, searchers=20, bracket_clients=100),
+    # Everyone looking for this weekend's tournaments at once
+    "search": Mix(searchers=200, search_interval=2.0),
+    # Results going up and everyone refreshing brackets
+    "brackets": Mix(pollers=200, bracket_clients=500, bracket_interval=5.0),
+}
+
+
+class Results:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.recording = False
+
+    def add(self, route: str, seconds: float, status: str) -> None:
+        if not self.recording:
+            return
+        self.latencies.setdefault(route, []).append(seconds)
+        counts = self.statuses.setdefault(route, {})
+        counts[status] = counts.get(status, 0) + 1
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    """Nearest rank percentile of sorted `values`"""
+    if not values:
+        return 0.0
+    return values[max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))]
+
+
+def _summarize(latencies: List[float], statuses: Dict[str, int], duration: float) -> dict:
+    latencies = sorted(latencies)
+    errors = sum(n for status, n in statuses.items() if not status.isdigit() or int(status) >= 400)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "throughput": len(latencies) / duration,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def _rss(pid: int) -> Tuple[int, int]:
+    """Resident bytes of a process and all of its descendants, and how many processes that is"""
+    total, processes, pending = 0, 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            processes += 1
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total, processes
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def _recorded_tournament_type(directory: str) -> Optional[str]:
+    """Alias of the tournament type most mat board recordings are of"""
+    counts: Dict[str, int] = {}
+    for path, _ in load_cassettes(directory):
+        prefix, _, page = path.rpartition("/")
+        if page == "MB_MatAssignmentDisplay.jsp":
+            counts[prefix] = counts.get(prefix, 0) + 1
+    for event_type in sorted(EventType, key=lambda t: -counts.get(t.tournament_type, 0)):
+        if counts.get(event_type.tournament_type):
+            return event_type.alias
+    return None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _wait_until_up(session: ClientSession, url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            async with session.get(url) as response:
+                if response.status < 500:
+                    return
+        except ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} didn't come up within {timeout:g} seconds")
+
+
+def _stop(process: subprocess.Popen) -> None:
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+class LoadTest:
+    def __init__(self, api_url: str, tournament_type: str, tournament_ids: List[int], mix: Mix, results: Results):
+        self.api_url = api_url
+        self.tournament_type = tournament_type
+        self.tournament_ids = tournament_ids
+        self.mix = mix
+        self.results = results
+        self.weights: Dict[int, List[int]] = {}
+
+    async def _request(self, session: ClientSession, route: str, path: str, params: dict = None) -> Optional[dict]:
+        started = time.perf_counter()
+        try:
+            async with session.get(self.api_url + path, params=params) as response:
+                body = await response.read()
+                status = str(response.status)
+        except (ClientError, asyncio.TimeoutError) as e:
+            self.results.add(route, time.perf_counter() - started, type(e).__name__)
+            return None
+        self.results.add(route, time.perf_counter() - started, status)
+        if response.status != 200:
+            return None
+        try:
+            return json.loads(body)
+        except ValueError:
+            return None
+
+    def _tournament_path(self, tournament_id: int) -> str:
+        return f"/tournaments/{self.tournament_type}/{tournament_id}"
+
+    async def _every(self, interval: float, request) -> None:
+        # Clients arrive spread over one interval rather than all at once
+        await asyncio.sleep(random.uniform(0, interval))
+        while True:
+            started = time.monotonic()
+            await request()
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    async def poller(self, session: ClientSession) -> None:
+        path = self._tournament_path(random.choice(self.tournament_ids)) + "/matches"
+        await self._every(self.mix.poll_interval, lambda: self._request(session, "matches", path))
+
+    async def searcher(self, session: ClientSession) -> None:
+        async def search():
+            query = " ".join(random.sample(_SEARCH_TERMS, random.randint(1, 2)))
+            await self._request(session, "search", "/tournaments", {"query": query})
+        await self._every(self.mix.search_interval, search)
+
+    async def bracket_client(self, session: ClientSession) -> None:
+        tournament_id = random.choice(self.tournament_ids)
+        path = self._tournament_path(tournament_id) + "/brackets"
+
+        async def browse():
+            if not self.weights.get(tournament_id):
+                found = await self._request(session, "brackets", path)
+                if found:
+                    self.weights[tournament_id] = [w["weight_id"] for w in found["data"]["weights"]]
+                return
+            await self._request(session, "bracket", f"{path}/{random.choice(self.weights[tournament_id])}")
+        await self._every(self.mix.bracket_interval, browse)
+
+    async def run(self, session: ClientSession, duration: float, warmup: float) -> float:
+        clients = (
+            [self.poller(session) for _ in range(self.mix.pollers)]
+            + [self.searcher(session) for _ in range(self.mix.searchers)]
+            + [self.bracket_client(session) for _ in range(self.mix.bracket_clients)]
+        )
+        tasks = [asyncio.ensure_future(client) for client in clients]
+        try:
+            await asyncio.sleep(warmup)
+            self.results.recording = True
+            started = time.monotonic()
+            await asyncio.sleep(duration)
+            self.results.recording = False
+            return time.monotonic() - started
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run(args: argparse.Namespace, mix: Mix, workers: int, standin_url: str, workdir: str) -> dict:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "WORKERS": str(workers),
+        "UPSTREAM_BASE_URL": standin_url,
+        "METRICS_DIR": os.path.join(workdir, f"metrics-{workers}"),
+        "SEARCH_INDEX_PATH": os.path.join(workdir, f"tournaments-{workers}.json"),
+    }
+    env.pop("UPSTREAM_RECORD_DIR", None)
+    log = open(os.path.join(workdir, f"server-{workers}.log"), "w")
+    server = subprocess.Popen([sys.executable, "main.py"], cwd=_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    api_url = f"http://localhost:{port}"
+    results = Results()
+    rss_samples: List[Tuple[int, int]] = []
+
+    async def sample_rss():
+        while True:
+            rss_samples.append(_rss(server.pid))
+            await asyncio.sleep(1)
+
+    try:
+        timeout = ClientTimeout(total=args.timeout)
+        connector = TCPConnector(limit=args.connections)
+        async with ClientSession(timeout=timeout, connector=connector) as session:
+            await _wait_until_up(session, api_url + "/", server)
+            async with session.get(standin_url + "/__standin/stats") as response:
+                upstream_before = (await response.json())["requests"]
+
+            sampler = asyncio.ensure_future(sample_rss())
+            test = LoadTest(api_url, args.tournament_type, args.tournament_ids, mix, results)
+            try:
+                duration = await test.run(session, args.duration, args.warmup)
+            finally:
+                sampler.cancel()
+
+            async with session.get(standin_url + "/__standin/stats") as response:
+                upstream_after = (await response.json())["requests"]
+    finally:
+        _stop(server)
+        log.close()
+
+    routes = {
+        route: _summarize(latencies, results.statuses[route], duration)
+        for route, latencies in sorted(results.latencies.items())
+    }
+    everything = [latency for latencies in results.latencies.values() for latency in latencies]
+    statuses: Dict[str, int] = {}
+    for counts in results.statuses.values():
+        for status, n in counts.items():
+            statuses[status] = statuses.get(status, 0) + n
+    rss = [total for total, _ in rss_samples]
+    return {
+        "workers": workers,
+        "duration": duration,
+        "routes": routes,
+        "total": _summarize(everything, statuses, duration),
+        # Includes requests made while warming up
+        "upstream": {
+            page: count - upstream_before.get(page, 0)
+            for page, count in sorted(upstream_after.items())
+            if count > upstream_before.get(page, 0)
+        },
+        "rss": {
+            "peak": max(rss, default=0),
+            "final": rss[-1] if rss else 0,
+            "processes": rss_samples[-1][1] if rss_samples else 0,
+        },
+    }
+
+
+def check(run: dict, slos: Dict[str, float], baseline: Optional[dict], tolerance: float) -> List[str]:
+    """What is wrong with a run, compared to its SLOs and to the same worker count in a baseline"""
+    problems = []
+    for route, stats in run["routes"].items():
+        if route in slos and stats["p99"] > slos[route]:
+            problems.append(f"{route}: p99 {stats['p99'] * 1000:.0f}ms misses its {slos[route] * 1000:.0f}ms SLO")
+        before = (baseline or {}).get("routes", {}).get(route)
+        if not before:
+            continue
+        if stats["p95"] > before["p95"] * (1 + tolerance):
+            problems.append(f"{route}: p95 went from {before['p95'] * 1000:.0f}ms to {stats['p95'] * 1000:.0f}ms")
+        if stats["throughput"] < before["throughput"] * (1 - tolerance):
+            problems.append(f"{route}: throughput went from {before['throughput']:.1f}/s to {stats['throughput']:.1f}/s")
+    return problems
+
+
+def report(run: dict, problems: List[str]) -> str:
+    lines = [f"{run['workers']} worker(s), {run['duration']:.0f}s"]
+    lines.append(f"  {'route':<10}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, stats in list(run["routes"].items()) + [("total", run["total"])]:
+        lines.append(
+            f"  {route:<10}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput']:>9.1f}"
+            f"{stats['p50'] * 1000:>9.1f}{stats['p95'] * 1000:>9.1f}{stats['p99'] * 1000:>9.1f}"
+        )
+    upstream = ", ".join(f"{page} {count}" for page, count in run["upstream"].items()) or "none"
+    lines.append(f"  upstream requests: {upstream}")
+    lines.append(f"  rss: peak {run['rss']['peak'] / 2**20:.0f}MB over {run['rss']['processes']} processes")
+    lines += [f"  FAIL {problem}" for problem in problems]
+    return "\n".join(lines)
+
+
+def _parse_slos(values: List[str]) -> Dict[str, float]:
+    slos = dict(DEFAULT_SLOS)
+    for value in values:
+        route, _, seconds = value.partition("=")
+        slos[route] = float(seconds)
+    return slos
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    mix = replace(MIXES[args.mix], **{
+        field: getattr(args, field) for field in asdict(Mix()) if getattr(args, field) is not None
+    })
+    slos = _parse_slos(args.slo)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix="opentw-loadtest-") as workdir:
+        standin_port = _free_port()
+        standin = subprocess.Popen(
+            [
+                sys.executable, "-m", "tools.standin", "--cassettes", args.cassettes, "--port", str(standin_port),
+                "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+                "--speed", str(args.speed), "--loop",
+            ],
+            cwd=_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        standin_url = f"http://localhost:{standin_port}"
+        runs, problems = {}, []
+        try:
+            async with ClientSession() as session:
+                await _wait_until_up(session, standin_url + "/__standin/stats", standin)
+            for workers in args.workers:
+                result = await run(args, mix, workers, standin_url, workdir)
+                found = check(result, slos, (baseline or {}).get("runs", {}).get(str(workers)), args.tolerance)
+                result["problems"] = found
+                runs[str(workers)] = result
+                problems += found
+                print(report(result, found), flush=True)
+        finally:
+            _stop(standin)
+
+    output = {
+        "name": args.name or args.mix,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "mix": {"name": args.mix, **asdict(mix)},
+        "settings": {
+            "duration": args.duration, "warmup": args.warmup, "connections": args.connections,
+            "latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+            "tournaments": len(args.tournament_ids), "slos": slos,
+        },
+        "baseline": args.baseline,
+        "runs": runs,
+    }
+    path = args.out or os.path.join("data", "loadtest", f"{time.strftime('%Y%m%d-%H%M%S')}-{args.mix}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Saved to {path}")
+    return 1 if problems else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cassettes", default="data/cassettes", help="cassettes the upstream stand-in replays")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="event")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="worker counts to run with, in turn")
+    parser.add_argument("--duration", type=float, default=60, help="seconds measured per run")
+    parser.add_argument("--warmup", type=float, default=10, help="seconds of load before measuring")
+    parser.add_argument("--connections", type=int, default=256, help="connections the clients share")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as failed")
+    parser.add_argument("--tournament-type", help="defaults to the type most mat boards were recorded for")
+    parser.add_argument("--tournament-ids", type=int, nargs="+", default=list(range(1, 11)))
+    for field, default in asdict(Mix()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), help=f"override the mix's {field}")
+    parser.add_argument("--latency", type=float, default=0.15, help="mean upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--speed", type=float, default=1.0, help="how fast recorded mat boards evolve")
+    parser.add_argument("--slo", action="append", default=[], metavar="ROUTE=SECONDS", help="p99 latency target")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="fraction a route may get worse by")
+    parser.add_argument("--name", help="label stored with the results")
+    parser.add_argument("--out", help="where to save the results")
+    args = parser.parse_args()
+
+    args.cassettes = os.path.abspath(args.cassettes)
+    if not os.path.isdir(args.cassettes):
+        parser.error(f"No cassettes in {args.cassettes}, record some with UPSTREAM_RECORD_DIR or generate them with tools.pages")
+    if args.tournament_type is None:
+        args.tournament_type = _recorded_tournament_type(args.cassettes)
+        if args.tournament_type is None:
+            parser.error("No mat boards were recorded, pass --tournament-type")
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
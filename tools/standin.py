@@ -0,0 +1,113 @@
+"""Local stand-in for www.trackwrestling.com that replays recorded cassettes
+
+Record cassettes by running the API with UPSTREAM_RECORD_DIR set, then serve them:
+
+    python -m tools.standin --cassettes data/cassettes --latency 0.1 --jitter 0.05 --error-rate 0.02
+
+and point the API at it with UPSTREAM_BASE_URL=http://localhost:8080.
+
+Requests recorded several times (a mat board polled through an event) are replayed
+on the same timeline they were recorded on, sped up by --speed, so mat boards keep
+changing. Requests with no recording of their own get a recording of the same
+endpoint, so every tournament id resolves to something.
+"""
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional
+from aiohttp import web
+from utils.cassettes import Recording, RequestKey, load_cassettes, request_key
+
+
+class StandIn:
+    def __init__(
+        self,
+        recordings: Dict[RequestKey, List[Recording]],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        speed: float = 1.0,
+        loop: bool = False,
+    ):
+        self.recordings = recordings
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.speed = speed
+        self.loop = loop
+        self.started = time.monotonic()
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.by_path: Dict[str, List[Recording]] = {}
+        for key in sorted(recordings):
+            self.by_path.setdefault(key[0], recordings[key])
+
+    def _pick(self, recordings: List[Recording]) -> Recording:
+        elapsed = (time.monotonic() - self.started) * self.speed
+        first = recordings[0].recorded_at
+        if self.loop:
+            elapsed %= recordings[-1].recorded_at - first + 1
+        current = recordings[0]
+        for recording in recordings:
+            if recording.recorded_at - first > elapsed:
+                break
+            current = recording
+        return current
+
+    def find(self, path: str, params: dict) -> Optional[Recording]:
+        key = request_key(path, params)
+        recordings = self.recordings.get(key) or self.by_path.get(key[0])
+        return self._pick(recordings) if recordings else None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        endpoint = request.path.rsplit("/", 1)[-1]
+        self.requests[endpoint] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            self.errors[endpoint] += 1
+            return web.Response(status=503, text="Service Unavailable")
+
+        recording = self.find(request.path, dict(request.query))
+        if recording is None:
+            return web.Response(status=404, text=f"No recording for {request.path}")
+        return web.Response(
+            status=recording.status,
+            body=recording.body.encode("utf-8"),
+            content_type=recording.content_type or "text/html",
+            charset="utf-8",
+        )
+
+    async def stats(self, _: web.Request) -> web.Response:
+        return web.json_response({"requests": dict(self.requests), "errors": dict(self.errors)})
+
+
+def make_app(standin: StandIn) -> web.Application:
+    app = web.Application()
+    app.router.add_get("/__standin/stats", standin.stats)
+    app.router.add_get("/{path:.*}", standin.handle)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cassettes", default="data/cassettes", help="directory recorded with UPSTREAM_RECORD_DIR")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds before answering")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument("--speed", type=float, default=1.0, help="how much faster than recorded time replays")
+    parser.add_argument("--loop", action="store_true", help="start recorded timelines over once they run out")
+    args = parser.parse_args()
+
+    recordings = load_cassettes(args.cassettes)
+    print(f"Replaying {sum(map(len, recordings.values()))} recordings of {len(recordings)} requests")
+    standin = StandIn(recordings, args.latency, args.jitter, args.error_rate, args.speed, args.loop)
+    web.run_app(make_app(standin), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
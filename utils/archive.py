@@ -0,0 +1,205 @@
+import os
+import json
+import zipfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from models.ttypes import EventType
+
+__all__ = ["archives", "InvalidArchive"]
+
+# Archived tournaments are kept here, one file per tournament id
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archives")
+# Bumped whenever what an archive holds changes shape
+ARCHIVE_FORMAT = 1
+
+# Raw upstream pages an archive holds besides one bracket per weight
+MANIFEST = "manifest.json"
+HUB = "hub.html"
+BRACKET_VIEWER = "bracket_viewer.html"
+MAT_BOARD = "mat_board.html"
+
+# Set while crawling, so the pages being archived come from upstream rather than an older archive
+_bypassed: ContextVar[bool] = ContextVar("archive_bypassed", default=False)
+
+
+class InvalidArchive(ValueError):
+    pass
+
+
+def bracket_member(weight_id: int, pages: Optional[Iterable[int]] = None) -> str:
+    pages = ",".join(str(page) for page in pages or ())
+    return f"brackets/{weight_id}{'-' + pages if pages else ''}.html"
+
+
+class TournamentArchive:
+    """A finished tournament's pages, read member by member out of its zip
+
+    The zip's central directory is the index: any one weight's bracket is read and
+    inflated on its own. Pages parsed once are kept, since they never change.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime
+        self.zip = zipfile.ZipFile(path)
+        self.manifest = json.loads(self.zip.read(MANIFEST))
+        self.tournament_type = EventType.from_alias(self.manifest["tournament_type"])
+        self.parsed: Dict[str, Any] = {}
+
+    def page(self, name: str) -> Optional[str]:
+        try:
+            return self.zip.read(name).decode()
+        except KeyError:
+            return None
+
+    def parse(self, name: str, parse: Callable[[str], Any]) -> Any:
+        """`name` parsed with `parse`, once per worker"""
+        if name not in self.parsed:
+            self.parsed[name] = parse(self.page(name))
+        return self.parsed[name]
+
+    def close(self) -> None:
+        self.zip.close()
+
+
+class ArchiveWriter:
+    """Writes an archive next to its final path, moving it in place only once complete"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.partial = f"{path}.{os.getpid()}.partial"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.zip = zipfile.ZipFile(self.partial, "w", zipfile.ZIP_DEFLATED, compresslevel=9)
+        self.raw_bytes = 0
+
+    def add(self, name: str, text: str) -> None:
+        body = text.encode()
+        self.raw_bytes += len(body)
+        self.zip.writestr(name, body)
+
+    def commit(self, manifest: dict) -> dict:
+        manifest = {"format": ARCHIVE_FORMAT, **manifest, "raw_bytes": self.raw_bytes}
+        self.zip.writestr(MANIFEST, json.dumps(manifest, indent=2))
+        self.zip.close()
+        manifest["archive_bytes"] = os.path.getsize(self.partial)
+        os.replace(self.partial, self.path)
+        return manifest
+
+    def abort(self) -> None:
+        self.zip.close()
+        os.remove(self.partial)
+
+
+def _validate(path: str) -> dict:
+    try:
+        return _check(path)
+    except (zipfile.BadZipFile, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise InvalidArchive(f"Archive is unreadable: {e}")
+
+
+def _check(path: str) -> dict:
+    if not zipfile.is_zipfile(path):
+        raise InvalidArchive("Not an archive")
+    with zipfile.ZipFile(path) as archive:
+        broken = archive.testzip()
+        if broken is not None:
+            raise InvalidArchive(f"Archive member {broken} is corrupt")
+        names = set(archive.namelist())
+        missing = {MANIFEST, HUB, BRACKET_VIEWER, MAT_BOARD} - names
+        if missing:
+            raise InvalidArchive(f"Archive is missing {', '.join(sorted(missing))}")
+        manifest = json.loads(archive.read(MANIFEST))
+    if manifest.get("format") != ARCHIVE_FORMAT:
+        raise InvalidArchive(f"Unsupported archive format {manifest.get('format')}, expected {ARCHIVE_FORMAT}")
+    if not isinstance(manifest.get("tournament_id"), int):
+        raise InvalidArchive("Archive manifest has no tournament id")
+    try:
+        EventType.from_alias(manifest.get("tournament_type"))
+    except ValueError as e:
+        raise InvalidArchive(str(e))
+    for weight in manifest.get("weights", []):
+        if weight.get("member") not in names:
+            raise InvalidArchive(f"Archive is missing the bracket of weight {weight.get('weight_id')}")
+    return manifest
+
+
+class _Archives:
+    def __init__(self, directory: Optional[str] = ARCHIVE_DIR):
+        self.directory = directory
+        self.opened: Dict[int, TournamentArchive] = {}
+
+    def path(self, tournament_id: int) -> str:
+        return os.path.join(self.directory, f"{tournament_id}.zip")
+
+    def get(self, tournament_id: int, tournament_type: Optional[EventType] = None) -> Optional[TournamentArchive]:
+        """The tournament's archive if there is one, reopened if it was replaced since"""
+        if not self.directory or _bypassed.get():
+            return None
+        try:
+            mtime = os.stat(self.path(tournament_id)).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        archive = self.opened.get(tournament_id)
+        if archive is not None and archive.mtime != mtime:
+            self.opened.pop(tournament_id).close()
+            archive = None
+        if archive is None and mtime is not None:
+            archive = self.opened[tournament_id] = TournamentArchive(self.path(tournament_id))
+        if archive is not None and tournament_type is not None and archive.tournament_type != tournament_type:
+            return None
+        return archive
+
+    def discard(self, tournament_id: int) -> None:
+        """Close the tournament's archive and drop what was parsed out of it"""
+        archive = self.opened.pop(tournament_id, None)
+        if archive is not None:
+            archive.close()
+
+    @contextmanager
+    def bypassed(self) -> Iterator[None]:
+        """Ignore archives, including in tasks started inside the block"""
+        token = _bypassed.set(True)
+        try:
+            yield
+        finally:
+            _bypassed.reset(token)
+
+    def writer(self, tournament_id: int) -> ArchiveWriter:
+        return ArchiveWriter(self.path(tournament_id))
+
+    def import_file(self, source: str) -> dict:
+        """Check an archive made on another node and put it in place, returning its manifest"""
+        manifest = _validate(source)
+        destination = self.path(manifest["tournament_id"])
+        partial = f"{destination}.{os.getpid()}.partial"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(source, "rb") as f, open(partial, "wb") as out:
+            while chunk := f.read(1024 * 1024):
+                out.write(chunk)
+        os.replace(partial, destination)
+        return manifest
+
+    def import_bytes(self, body: bytes) -> dict:
+        os.makedirs(self.directory, exist_ok=True)
+        upload = os.path.join(self.directory, f"upload.{os.getpid()}.partial")
+        with open(upload, "wb") as f:
+            f.write(body)
+        try:
+            return self.import_file(upload)
+        finally:
+            os.remove(upload)
+
+    def manifests(self) -> List[dict]:
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in sorted(os.listdir(self.directory)):
+            tournament_id, extension = os.path.splitext(name)
+            if extension == ".zip" and tournament_id.isdigit():
+                archive = self.get(int(tournament_id))
+                if archive is not None:
+                    found.append({**archive.manifest, "archive_bytes": os.path.getsize(archive.path)})
+        return found
+
+archives = _Archives()
@@ -0,0 +1,234 @@
+import os
+import time
+import fcntl
+import asyncio
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from .cache import content_digest
+from .upstream import UpstreamUnavailable
+
+__all__ = ["bracket_versions"]
+
+# Bracket versions are logged here per tournament so every worker numbers them alike, empty to keep them in memory
+BRACKET_VERSIONS_DIR = os.getenv("BRACKET_VERSIONS_DIR", "data/bracket_versions")
+# Seconds a bracket's version is trusted to answer ?since= without asking upstream
+BRACKET_VERSION_TTL = float(os.getenv("BRACKET_VERSION_TTL", 15))
+# Seconds between refreshes of every bracket while someone follows a tournament's updates
+BRACKET_POLL_INTERVAL = float(os.getenv("BRACKET_POLL_INTERVAL", 30))
+# Seconds a follower's stream may stay quiet before it is sent a heartbeat line
+BRACKET_HEARTBEAT_INTERVAL = float(os.getenv("BRACKET_HEARTBEAT_INTERVAL", 15))
+
+# Weight id and the pages it was fetched with, () for upstream's default pages
+BracketKey = Tuple[int, Tuple[int, ...]]
+
+
+def bracket_key(weight_id: int, pages: Optional[Iterable[int]] = None) -> BracketKey:
+    return int(weight_id), tuple(pages or ())
+
+
+def _heartbeat() -> dict:
+    return {"heartbeat": datetime.now(timezone.utc).isoformat()}
+
+
+class BracketVersion:
+    def __init__(self, version: int, digest: str, changed_at: float):
+        self.version = version
+        self.digest = digest
+        self.changed_at = changed_at
+        # When upstream last confirmed this version, monotonic; zero if only known from the log
+        self.checked_at = 0.0
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.checked_at < BRACKET_VERSION_TTL
+
+    def event(self, key: BracketKey) -> dict:
+        weight_id, pages = key
+        return {
+            "weight_id": weight_id,
+            "pages": list(pages) or None,
+            "version": self.version,
+            "updated_at": datetime.fromtimestamp(self.changed_at, timezone.utc).isoformat(),
+        }
+
+
+class TournamentBrackets:
+    """Content versions of one tournament's brackets, and whoever is following them
+
+    A version goes up by one each time a bracket comes back from upstream with
+    different content. Changes are appended to a log shared by every worker, read
+    under the same lock, so a change another worker saw first keeps its number.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.versions: Dict[BracketKey, BracketVersion] = {}
+        self.offset = 0
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.poller: Optional[asyncio.Task] = None
+        self.appending = asyncio.Lock()
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                self._catch_up(f)
+
+    def _read(self, f) -> List[Tuple[BracketKey, BracketVersion]]:
+        """Versions logged since the last read, by this worker or any other"""
+        f.seek(self.offset)
+        found = []
+        for line in f:
+            # A worker may have been stopped half way through a line
+            if not line.endswith(b"\n"):
+                break
+            self.offset += len(line)
+            weight_id, pages, version, digest, changed_at = line.decode().rstrip("\n").split("\t")
+            key = bracket_key(int(weight_id), (int(p) for p in pages.split(",") if p))
+            found.append((key, BracketVersion(int(version), digest, float(changed_at))))
+        return found
+
+    def _apply(self, found: List[Tuple[BracketKey, BracketVersion]]) -> None:
+        for key, version in found:
+            known = self.versions.get(key)
+            if known is None or version.version > known.version:
+                self._publish(key, version)
+
+    def _catch_up(self, f) -> None:
+        self._apply(self._read(f))
+
+    def _publish(self, key: BracketKey, version: BracketVersion) -> None:
+        self.versions[key] = version
+        event = version.event(key)
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    def _append(self, key: BracketKey, digest: str) -> List[Tuple[BracketKey, BracketVersion]]:
+        """Read the log up to its end and log `digest` for `key` if it is news, all under the log's lock
+
+        Runs in a thread, so it leaves publishing what it found to the caller.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                found = self._read(f)
+                known = self.versions.get(key)
+                for logged_key, version in found:
+                    if logged_key == key and (known is None or version.version > known.version):
+                        known = version
+                if known is None or known.digest != digest:
+                    known = BracketVersion((known.version if known else 0) + 1, digest, time.time())
+                    weight_id, pages = key
+                    line = f"{weight_id}\t{','.join(map(str, pages))}\t{known.version}\t{digest}\t{known.changed_at}\n"
+                    f.write(line.encode())
+                    f.flush()
+                    self.offset = f.tell()
+                    found.append((key, known))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return found
+
+    async def _record(self, key: BracketKey, digest: str) -> BracketVersion:
+        known = self.versions.get(key)
+        if not self.path:
+            self._publish(key, BracketVersion((known.version if known else 0) + 1, digest, time.time()))
+            return self.versions[key]
+        # One append at a time per worker, so each reads the versions the last one published
+        async with self.appending:
+            self._apply(await asyncio.to_thread(self._append, key, digest))
+        return self.versions[key]
+
+    async def observe(self, key: BracketKey, html: str) -> BracketVersion:
+        """Note what upstream just returned for `key`, telling followers if it changed"""
+        digest = content_digest(html.encode())
+        known = self.versions.get(key)
+        if known is None or known.digest != digest:
+            known = await self._record(key, digest)
+        known.checked_at = time.monotonic()
+        return known
+
+    def events(self, weight_ids: Optional[Set[int]] = None) -> List[dict]:
+        """Every bracket's current version, as the events that led to it"""
+        return [
+            version.event(key) for key, version in sorted(self.versions.items())
+            if weight_ids is None or key[0] in weight_ids
+        ]
+
+    def fail(self, error: Exception) -> None:
+        for queue in self.subscribers:
+            queue.put_nowait(error)
+
+
+class _BracketVersions:
+    def __init__(self, directory: Optional[str] = BRACKET_VERSIONS_DIR):
+        self.directory = directory
+        self.tournaments: Dict[int, TournamentBrackets] = {}
+
+    def get(self, tournament_id: int) -> TournamentBrackets:
+        brackets = self.tournaments.get(tournament_id)
+        if brackets is None:
+            path = os.path.join(self.directory, f"{tournament_id}.log") if self.directory else None
+            brackets = self.tournaments[tournament_id] = TournamentBrackets(path)
+        return brackets
+
+    def discard(self, tournament_id: int) -> None:
+        """Forget the tournament in this worker; its versions are read back from the log when needed"""
+        brackets = self.tournaments.pop(tournament_id, None)
+        if brackets is not None and brackets.poller is not None:
+            brackets.poller.cancel()
+
+    async def observe(self, tournament_id: int, weight_id: int, pages: Optional[Iterable[int]], html: str) -> BracketVersion:
+        return await self.get(tournament_id).observe(bracket_key(weight_id, pages), html)
+
+    def known(self, tournament_id: int, weight_id: int, pages: Optional[Iterable[int]] = None) -> Optional[BracketVersion]:
+        return self.get(tournament_id).versions.get(bracket_key(weight_id, pages))
+
+    async def _poll(self, brackets: TournamentBrackets, refresh: Callable[[], Awaitable[None]]) -> None:
+        while True:
+            try:
+                await refresh()
+            except UpstreamUnavailable:
+                # Followers only miss a round; the next one picks the changes up
+                pass
+            except Exception as e:
+                brackets.fail(e)
+                return
+            await asyncio.sleep(BRACKET_POLL_INTERVAL)
+
+    async def follow(
+        self,
+        tournament_id: int,
+        refresh: Callable[[], Awaitable[None]],
+        weight_ids: Optional[Set[int]] = None,
+    ) -> AsyncIterator[dict]:
+        """A heartbeat, every bracket's version, then an event each time one changes
+
+        The heartbeat comes first so the follower is answered before anything is known,
+        and again whenever nothing changed for BRACKET_HEARTBEAT_INTERVAL seconds. While
+        anyone follows a tournament, a single poller per worker fetches its brackets with
+        `refresh` every BRACKET_POLL_INTERVAL seconds; it stops when the last follower leaves.
+        """
+        brackets = self.get(tournament_id)
+        queue: asyncio.Queue = asyncio.Queue()
+        brackets.subscribers.add(queue)
+        if brackets.poller is None or brackets.poller.done():
+            brackets.poller = asyncio.ensure_future(self._poll(brackets, refresh))
+        try:
+            yield _heartbeat()
+            for event in brackets.events(weight_ids):
+                yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), BRACKET_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield _heartbeat()
+                    continue
+                if isinstance(event, Exception):
+                    raise event
+                if weight_ids is None or event["weight_id"] in weight_ids:
+                    yield event
+        finally:
+            brackets.subscribers.discard(queue)
+            if not brackets.subscribers and brackets.poller is not None:
+                brackets.poller.cancel()
+                brackets.poller = None
+
+bracket_versions = _BracketVersions()
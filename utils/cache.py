@@ -0,0 +1,71 @@
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from .metrics import metrics
+
+__all__ = ["LRUCache", "content_digest"]
+
+_MISSING = object()
+
+_lookups = metrics.counter("cache_lookups_total", "Cache lookups by cache and result")
+
+def content_digest(body: bytes) -> str:
+    """Short, stable hash identifying one version of a payload"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+class LRUCache:
+    """A small bounded mapping that evicts the least recently used entry first
+
+    Entries optionally expire after `ttl` seconds. Expired entries are kept until they
+    are evicted so callers can still fall back to them with `get_stale()`.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None, name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Named caches report their hit ratio
+        self.name = name
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def _is_fresh(self, stored_at: float) -> bool:
+        return self.ttl is None or time.monotonic() - stored_at < self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or not self._is_fresh(entry[0]):
+            if self.name:
+                _lookups.inc(cache=self.name, result="miss")
+            return default
+        if self.name:
+            _lookups.inc(cache=self.name, result="hit")
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value for `key` even if its ttl has passed"""
+        entry = self._entries.get(key)
+        return default if entry is None else entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def items(self) -> list:
+        """Every (key, value) held, expired or not, least recently used first"""
+        return [(key, value) for key, (_, value) in self._entries.items()]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+__all__ = ["recorder", "request_key", "load_cassettes", "save_recording", "Recording"]
+
+# When set, every upstream response is saved here for the stand-in server to replay
+UPSTREAM_RECORD_DIR = os.getenv("UPSTREAM_RECORD_DIR")
+
+# Query parameters that change on every request without changing the answer
+_VOLATILE_PARAMS = ("TIM",)
+
+RequestKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def request_key(path: str, params: Optional[dict]) -> RequestKey:
+    """Identifies an upstream request regardless of its cache busting timestamp"""
+    return path.lstrip("/"), tuple(sorted((k, str(v)) for k, v in (params or {}).items() if k not in _VOLATILE_PARAMS))
+
+
+class Recording:
+    def __init__(self, path: str, params: Dict[str, str], status: int, content_type: str, recorded_at: float, body: str):
+        self.path = path
+        self.params = params
+        self.status = status
+        self.content_type = content_type
+        self.recorded_at = recorded_at
+        self.body = body
+
+    @property
+    def key(self) -> RequestKey:
+        return request_key(self.path, self.params)
+
+    def as_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "params": self.params,
+            "status": self.status,
+            "content_type": self.content_type,
+            "recorded_at": self.recorded_at,
+            "body": self.body,
+        }
+
+
+class _Recorder:
+    """Saves upstream responses as cassettes, one JSON file per response
+
+    Files are grouped by endpoint and named by request and time, so repeated
+    recordings of the same request (a mat board over an event) replay in order.
+    """
+
+    def __init__(self, directory: Optional[str] = UPSTREAM_RECORD_DIR):
+        self.directory = directory
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def record(self, path: str, params: Optional[dict], status: int, content_type: str, body: bytes, encoding: str) -> None:
+        key = request_key(path, params)
+        recording = Recording(
+            path=key[0],
+            params=dict(key[1]),
+            status=status,
+            content_type=content_type,
+            recorded_at=time.time(),
+            body=body.decode(encoding, errors="replace"),
+        )
+        save_recording(self.directory, recording)
+
+
+def save_recording(directory: str, recording: Recording) -> str:
+    """Write `recording` as a cassette under `directory`, returning its path"""
+    key = recording.key
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+    directory = os.path.join(directory, key[0].rsplit("/", 1)[-1])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{digest}-{int(recording.recorded_at * 1000)}-{os.getpid()}.json")
+    with open(path, "w") as f:
+        json.dump(recording.as_dict(), f)
+    return path
+
+
+def load_cassettes(directory: str) -> Dict[RequestKey, List[Recording]]:
+    """Every recording under `directory`, per request in the order they were recorded"""
+    recordings: Dict[RequestKey, List[Recording]] = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(root, name), "r") as f:
+                    data = json.load(f)
+                recording = Recording(**data)
+            except (OSError, ValueError, TypeError):
+                continue
+            recordings.setdefault(recording.key, []).append(recording)
+    for entries in recordings.values():
+        entries.sort(key=lambda r: r.recorded_at)
+    return recordings
+
+recorder = _Recorder()
@@ -0,0 +1,112 @@
+import os
+import gzip
+from typing import Callable, Dict, Optional
+from .cache import LRUCache, content_digest
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+__all__ = ["compressor", "add_vary"]
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_CACHE_SIZE = int(os.getenv("COMPRESS_CACHE_SIZE", 256))
+
+# Listed in order of preference when the client weights several encodings equally
+_ENCODERS: Dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    _ENCODERS["br"] = lambda body: brotli.compress(body, quality=5)
+_ENCODERS["gzip"] = lambda body: gzip.compress(body, compresslevel=6)
+
+_SKIPPED_STATUSES = (204, 206)
+
+
+def add_vary(headers, value: str) -> None:
+    """Add `value` to the Vary header without clobbering what is already there"""
+    current = [v.strip() for v in headers.get("vary", "").split(",") if v.strip()]
+    if value.lower() not in (v.lower() for v in current):
+        current.append(value)
+    headers["vary"] = ", ".join(current)
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[coding.lower()] = q
+    return weights
+
+
+class _Compressor:
+    def __init__(self):
+        # (content digest, encoding) -> compressed body, so each body version is compressed once
+        self.variants = LRUCache(max_entries=COMPRESS_CACHE_SIZE, name="compressed")
+
+    def negotiate(self, accept_encoding: str) -> Optional[str]:
+        weights = _parse_accept_encoding(accept_encoding)
+        wildcard = weights.get("*", 0.0)
+        best, best_q = None, 0.0
+        for encoding in _ENCODERS:
+            q = weights.get(encoding, wildcard)
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def compress(self, body: bytes, encoding: str, digest: Optional[str] = None) -> bytes:
+        key = (digest or content_digest(body), encoding)
+        compressed = self.variants.get(key)
+        if compressed is None:
+            compressed = _ENCODERS[encoding](body)
+            self.variants.set(key, compressed)
+        return compressed
+
+    def apply(self, request, response, size: Optional[int] = None) -> None:
+        """Compress `response` in place if the client accepts it and it is worth it
+
+        A 304 is given `size`, the length of the body it stands in for, so its ETag
+        gets the same encoding suffix the 200 would have carried.
+        """
+        if response.status == 304:
+            # Keep the validation response consistent with the 200 it stands in for
+            add_vary(response.headers, "Accept-Encoding")
+            etag = response.headers.get("etag")
+            if etag and size is not None and size >= COMPRESS_MIN_SIZE:
+                encoding = self.negotiate(request.headers.get("accept-encoding", ""))
+                if encoding is not None:
+                    response.headers["etag"] = f'"{etag.strip(chr(34))}-{encoding}"'
+            return
+
+        body = getattr(response, "body", None)
+        if (
+            not body
+            or len(body) < COMPRESS_MIN_SIZE
+            or response.status in _SKIPPED_STATUSES
+            or "content-encoding" in response.headers
+        ):
+            return
+
+        add_vary(response.headers, "Accept-Encoding")
+        encoding = self.negotiate(request.headers.get("accept-encoding", ""))
+        if encoding is None:
+            return
+
+        # A strong ETag already carries the body's digest, no need to hash it twice
+        etag = response.headers.get("etag")
+        digest = etag.strip('"') if etag else None
+        response.body = self.compress(body, encoding, digest)
+        response.headers["content-encoding"] = encoding
+        if etag:
+            # Each content-coding is its own representation and needs its own strong ETag
+            response.headers["etag"] = f'"{digest}-{encoding}"'
+
+compressor = _Compressor()
@@ -0,0 +1,69 @@
+import os
+import time
+from typing import Optional
+from email.utils import formatdate
+from .cache import LRUCache, content_digest
+
+__all__ = ["resource_versions"]
+
+RESOURCE_VERSIONS_SIZE = int(os.getenv("RESOURCE_VERSIONS_SIZE", 4096))
+
+
+def _etag_matches(if_none_match: str, digest: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        # Tags handed out for a compressed variant carry a "-<encoding>" suffix
+        if tag.strip('"').split("-")[0] == digest:
+            return True
+    return False
+
+
+class _ResourceVersions:
+    def __init__(self):
+        # (path, query, content type) -> (digest, first time that digest was served)
+        self.versions = LRUCache(max_entries=RESOURCE_VERSIONS_SIZE)
+
+    def _last_modified(self, key: tuple, digest: str) -> float:
+        known = self.versions.get(key)
+        if known and known[0] == digest:
+            return known[1]
+        # Last-Modified only has whole seconds, so two versions within one second share it;
+        # the ETag tells them apart, and a stamp is never moved into the future to avoid that
+        now = time.time()
+        self.versions.set(key, (digest, now))
+        return now
+
+    def apply(self, request, response, max_age: Optional[int] = None) -> bool:
+        """Tag `response` with validators and turn it into a 304 if the client is up to date
+
+        Only the ETag is validated against. Last-Modified is kept per worker and to
+        the second, so If-Modified-Since alone can't tell a client is up to date.
+
+        Returns:
+            bool: True if the response was replaced by a 304 Not Modified
+        """
+        if response.status != 200 or not response.body:
+            return False
+
+        digest = content_digest(response.body)
+        key = (request.path, request.query_string, response.content_type)
+        last_modified = self._last_modified(key, digest)
+
+        response.headers["etag"] = f'"{digest}"'
+        response.headers["last-modified"] = formatdate(last_modified, usegmt=True)
+        if max_age is not None:
+            response.headers["cache-control"] = f"public, max-age={max_age}, must-revalidate"
+
+        if_none_match = request.headers.get("if-none-match")
+        not_modified = if_none_match is not None and _etag_matches(if_none_match, digest)
+
+        if not_modified:
+            response.status = 304
+            response.body = b""
+        return not_modified
+
+resource_versions = _ResourceVersions()
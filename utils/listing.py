@@ -0,0 +1,95 @@
+import json
+import base64
+import binascii
+from bisect import bisect_right
+from datetime import date, datetime
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar, Union
+
+__all__ = ["parse_list", "parse_date", "select_fields", "paginate", "SortKey", "InvalidQueryParameter"]
+
+T = TypeVar("T")
+# Where an item sorts in a paged listing; only strings and integers, so it survives a round trip through a cursor
+SortKey = Tuple[Union[str, int], ...]
+
+MAX_PAGE_SIZE = 500
+
+_DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%m-%d-%Y")
+
+
+class InvalidQueryParameter(ValueError):
+    pass
+
+
+def parse_list(value: Optional[str]) -> Optional[List[str]]:
+    """Split a comma separated query parameter, returning None when it wasn't given"""
+    if value is None:
+        return None
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def parse_date(value: Optional[str], name: str) -> Optional[date]:
+    """Parse a date query parameter given as YYYY-MM-DD or in US MM/DD/YYYY style"""
+    if not value:
+        return None
+    value = value.strip()
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise InvalidQueryParameter(f"Invalid {name}, expected YYYY-MM-DD")
+
+
+def select_fields(data: dict, fields: Optional[Sequence[str]]) -> dict:
+    """Keep only the requested top level attributes of a serialized object"""
+    if not fields:
+        return data
+    return {field: data[field] for field in fields if field in data}
+
+
+def _encode_cursor(key: SortKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key), separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> SortKey:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidQueryParameter("Invalid cursor")
+    if not isinstance(key, list) or not all(isinstance(part, (str, int)) for part in key):
+        raise InvalidQueryParameter("Invalid cursor")
+    return tuple(key)
+
+
+def paginate(
+    items: List[T], key: Callable[[T], SortKey], cursor: Optional[str], limit: Optional[str]
+) -> Tuple[List[T], Optional[str]]:
+    """Return the page of `items` following `cursor` and the cursor of the next page
+
+    Paged listings are ordered by `key`, and a cursor holds the sort key of the last
+    item of the previous page rather than an offset. The next page starts at the
+    first item sorting after it, whether or not that item is still listed, so a page
+    doesn't shift when items around it disappear between requests.
+    """
+    if limit is None and cursor is None:
+        return items, None
+    try:
+        size = min(int(limit), MAX_PAGE_SIZE) if limit is not None else MAX_PAGE_SIZE
+    except ValueError:
+        raise InvalidQueryParameter("Invalid limit")
+    if size < 1:
+        raise InvalidQueryParameter("Invalid limit")
+
+    items = sorted(items, key=key)
+    start = 0
+    if cursor:
+        after = _decode_cursor(cursor)
+        try:
+            start = bisect_right(items, after, key=key)
+        except TypeError:
+            # Decoded fine but was made for a different listing
+            raise InvalidQueryParameter("Invalid cursor")
+
+    page = items[start:start + size]
+    has_more = start + size < len(items)
+    return page, _encode_cursor(key(page[-1])) if page and has_more else None
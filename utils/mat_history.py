@@ -0,0 +1,318 @@
+import os
+import mmap
+import time
+import fcntl
+import asyncio
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from models.ttypes import Match
+
+__all__ = ["mat_history"]
+
+# Transition logs are appended here per tournament, empty to keep them in memory only
+MAT_HISTORY_DIR = os.getenv("MAT_HISTORY_DIR", "data/mat_history")
+# Seconds of recent completions that bouts per hour is worked out over
+MAT_STATS_WINDOW = float(os.getenv("MAT_STATS_WINDOW", 3600))
+# Consecutive boards a bout has to be missing from before it counts as done
+MAT_DONE_CONFIRMATIONS = max(1, int(os.getenv("MAT_DONE_CONFIRMATIONS", 2)))
+# Weight of the latest gap between bouts in a mat's rolling cycle time
+_CYCLE_SMOOTHING = 0.3
+# A board losing more than this share of the open bouts at once is taken for a broken page, not progress
+_SUSPICIOUS_SHRINK = 0.5
+_SUSPICIOUS_SHRINK_MIN_BOUTS = 4
+
+# Statuses in the order a bout goes through them, done being off the board
+_STATUSES = ("in_hole", "on_deck", "in_progress", "done")
+_DONE = _STATUSES.index("done")
+_IN_PROGRESS = _STATUSES.index("in_progress")
+
+# Column name, array typecode; one file per column so each maps straight onto an array
+_COLUMNS = (("timestamp", "d"), ("mat", "H"), ("bout", "I"), ("status", "B"))
+
+Transition = Tuple[float, int, int, int]
+
+
+class _Log:
+    """Append-only (timestamp, mat, bout, status) transitions of one tournament, a column per file
+
+    Appends from every worker go through an exclusive lock so the columns stay aligned,
+    and reads map the files instead of loading them.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        # Only used when there is nowhere to write to
+        self.columns = {name: array(typecode) for name, typecode in _COLUMNS}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.col")
+
+    async def append(self, transitions: List[Transition]) -> None:
+        columns = {name: array(typecode) for name, typecode in _COLUMNS}
+        for transition in transitions:
+            for (name, _), value in zip(_COLUMNS, transition):
+                columns[name].append(value)
+        if not self.directory:
+            for name, values in columns.items():
+                self.columns[name].extend(values)
+            return
+        # Waiting on another worker's lock mustn't stall this worker's event loop
+        await asyncio.to_thread(self._write, columns)
+
+    def _write(self, columns: Dict[str, array]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                for name, values in columns.items():
+                    with open(self._path(name), "ab") as f:
+                        values.tofile(f)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextmanager
+    def read(self) -> Iterator[Dict[str, memoryview]]:
+        """Every column as a typed view, cut to the rows all columns have"""
+        if not self.directory:
+            yield {name: memoryview(values) for name, values in self.columns.items()}
+            return
+        files, maps, views, rows_views = [], [], {}, {}
+        try:
+            for name, typecode in _COLUMNS:
+                try:
+                    f = open(self._path(name), "rb")
+                except FileNotFoundError:
+                    views = {n: memoryview(array(t)) for n, t in _COLUMNS}
+                    break
+                files.append(f)
+                size = os.fstat(f.fileno()).st_size
+                size -= size % array(typecode).itemsize
+                if not size:
+                    views[name] = memoryview(array(typecode))
+                    continue
+                maps.append(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ))
+                views[name] = memoryview(maps[-1]).cast(typecode)
+            # A worker may have been stopped half way through an append
+            rows = min(len(view) for view in views.values())
+            rows_views = {name: view[:rows] for name, view in views.items()}
+            yield rows_views
+        finally:
+            # Mapped files can only be closed once nothing looks into them
+            for view in list(rows_views.values()) + list(views.values()):
+                view.release()
+            for mapped in maps:
+                mapped.close()
+            for f in files:
+                f.close()
+
+
+class _Mat:
+    def __init__(self):
+        self.completed: Deque[float] = deque()
+        self.completed_total = 0
+        self.duration_total = 0.0
+        self.durations = 0
+        self.wait_total = 0.0
+        self.waits = 0
+        self.last_start: Optional[float] = None
+        self.cycle: Optional[float] = None
+        # Bouts on the board, in the order they are up
+        self.queue: List[int] = []
+
+    def bouts_per_hour(self, now: float, observed_for: float) -> Optional[float]:
+        while self.completed and self.completed[0] < now - MAT_STATS_WINDOW:
+            self.completed.popleft()
+        window = min(MAT_STATS_WINDOW, observed_for)
+        return len(self.completed) * 3600 / window if window > 0 else None
+
+
+class MatStats:
+    """Per mat throughput of one tournament, kept up to date transition by transition
+
+    Nothing is rescanned to answer: completions in the window, running totals of bout
+    durations and queue waits, and a smoothed cycle time per mat are all updated as
+    each transition is applied.
+    """
+
+    def __init__(self, log: _Log):
+        self.log = log
+        self.statuses: Dict[Tuple[int, int], int] = {}
+        self.queued_at: Dict[Tuple[int, int], float] = {}
+        self.started_at: Dict[Tuple[int, int], float] = {}
+        # Open bouts missing from the latest boards: when they first went missing, and from how many boards
+        self.missing: Dict[Tuple[int, int], Tuple[float, int]] = {}
+        self.shrunk_boards = 0
+        self.mats: Dict[int, _Mat] = {}
+        self.first_seen: Optional[float] = None
+        self.last_seen: Optional[float] = None
+        self.transitions = 0
+
+    def _apply(self, timestamp: float, mat_number: int, bout: int, status: int) -> bool:
+        key = (mat_number, bout)
+        # Bouts only move forward; anything else is a duplicate from another worker or a stale board
+        if self.statuses.get(key, -1) >= status:
+            return False
+        if self.first_seen is None:
+            self.first_seen = timestamp
+        self.last_seen = max(self.last_seen or timestamp, timestamp)
+        self.statuses[key] = status
+        self.transitions += 1
+        mat = self.mats.setdefault(mat_number, _Mat())
+        self.queued_at.setdefault(key, timestamp)
+
+        # Only bouts seen starting after we started watching have a known start
+        observed = timestamp > self.first_seen
+        if status == _IN_PROGRESS:
+            if observed:
+                self.started_at[key] = timestamp
+                if self.first_seen < self.queued_at[key] < timestamp:
+                    mat.wait_total += timestamp - self.queued_at[key]
+                    mat.waits += 1
+                if mat.last_start is not None and mat.last_start > self.first_seen:
+                    gap = timestamp - mat.last_start
+                    mat.cycle = gap if mat.cycle is None else _CYCLE_SMOOTHING * gap + (1 - _CYCLE_SMOOTHING) * mat.cycle
+            mat.last_start = timestamp
+        elif status == _DONE:
+            mat.completed.append(timestamp)
+            mat.completed_total += 1
+            started = self.started_at.pop(key, None)
+            if started is not None:
+                mat.duration_total += timestamp - started
+                mat.durations += 1
+            self.queued_at.pop(key, None)
+            if bout in mat.queue:
+                mat.queue.remove(bout)
+        if status != _DONE and bout not in mat.queue:
+            mat.queue.append(bout)
+        return True
+
+    def replay(self) -> None:
+        with self.log.read() as columns:
+            for row in zip(*(columns[name] for name, _ in _COLUMNS)):
+                self._apply(*row)
+        for mat_number, mat in self.mats.items():
+            mat.queue.sort(key=lambda bout: (-self.statuses[mat_number, bout], bout))
+
+    async def observe(self, matches: List[Match], timestamp: float) -> None:
+        """Record the transitions between the last board and `matches`
+
+        A bout missing from the board is only taken as done once it has stayed missing
+        for MAT_DONE_CONFIRMATIONS boards in a row, dated when it first went missing.
+        Empty boards are more likely a login page or a failed parse than progress and
+        are skipped, as are boards that suddenly lose most of the open bouts until they
+        have looked that way for MAT_DONE_CONFIRMATIONS boards in a row.
+        """
+        # Rows whose mat or bout couldn't be read can't be followed from board to board
+        board = {(m.mat, m.bout): _STATUSES.index(m.status) for m in matches if m.mat and m.bout}
+        if not board:
+            return
+        open_bouts = [key for key, status in self.statuses.items() if status != _DONE]
+        vanished = [key for key in open_bouts if key not in board]
+        if len(open_bouts) >= _SUSPICIOUS_SHRINK_MIN_BOUTS and len(vanished) > len(open_bouts) * _SUSPICIOUS_SHRINK:
+            self.shrunk_boards += 1
+            if self.shrunk_boards < MAT_DONE_CONFIRMATIONS:
+                return
+        else:
+            self.shrunk_boards = 0
+
+        transitions = [
+            (timestamp, mat, bout, status)
+            for (mat, bout), status in board.items()
+            if self.statuses.get((mat, bout), -1) < status
+        ]
+        for key in list(self.missing):
+            if key in board:
+                del self.missing[key]
+        for key in vanished:
+            missing_since, boards = self.missing.get(key, (timestamp, 0))
+            if boards + 1 >= MAT_DONE_CONFIRMATIONS:
+                del self.missing[key]
+                transitions.append((missing_since, *key, _DONE))
+            else:
+                self.missing[key] = (missing_since, boards + 1)
+        applied = [t for t in transitions if self._apply(*t)]
+        if applied:
+            await self.log.append(applied)
+        # The board's own order is the best guess at what goes up next
+        queues: Dict[int, List[int]] = {}
+        for (mat, bout), status in board.items():
+            # A finished bout showing up again is a stale board, not one still to wrestle
+            if self.statuses.get((mat, bout)) != _DONE:
+                queues.setdefault(mat, []).append(bout)
+        for mat_number, queue in queues.items():
+            self.mats.setdefault(mat_number, _Mat()).queue = queue
+        for mat_number, mat in self.mats.items():
+            if mat_number not in queues:
+                mat.queue = [bout for bout in mat.queue if (mat_number, bout) in self.missing]
+
+    def _cycle(self, mat: _Mat) -> Optional[float]:
+        if mat.cycle is not None:
+            return mat.cycle
+        if mat.durations:
+            return mat.duration_total / mat.durations
+        cycles = [m.cycle for m in self.mats.values() if m.cycle is not None]
+        return sum(cycles) / len(cycles) if cycles else None
+
+    def as_dict(self, now: float) -> dict:
+        observed_for = now - self.first_seen if self.first_seen is not None else 0.0
+        mats = []
+        for mat_number in sorted(self.mats):
+            mat = self.mats[mat_number]
+            cycle = self._cycle(mat)
+            upcoming = []
+            base = mat.last_start if mat.queue and self.statuses.get((mat_number, mat.queue[0])) == _IN_PROGRESS else now
+            for position, bout in enumerate(mat.queue):
+                status = self.statuses[mat_number, bout]
+                if status == _IN_PROGRESS:
+                    start = self.started_at.get((mat_number, bout))
+                elif cycle is None:
+                    start = None
+                else:
+                    start = max(now, base + position * cycle)
+                upcoming.append({"bout": bout, "status": _STATUSES[status], "estimated_start": _iso(start)})
+            mats.append({
+                "mat": mat_number,
+                "bouts_completed": mat.completed_total,
+                "bouts_per_hour": mat.bouts_per_hour(now, observed_for),
+                "average_bout_seconds": mat.duration_total / mat.durations if mat.durations else None,
+                "average_wait_seconds": mat.wait_total / mat.waits if mat.waits else None,
+                "cycle_seconds": cycle,
+                "upcoming": upcoming,
+            })
+        return {
+            "as_of": _iso(now),
+            "observed_since": _iso(self.first_seen),
+            "transitions": self.transitions,
+            "mats": mats,
+        }
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp is not None else None
+
+
+class _MatHistory:
+    def __init__(self, directory: Optional[str] = MAT_HISTORY_DIR):
+        self.directory = directory
+        self.tournaments: Dict[int, MatStats] = {}
+
+    def get(self, tournament_id: int) -> MatStats:
+        """The tournament's stats, rebuilt from its log the first time this worker needs them"""
+        stats = self.tournaments.get(tournament_id)
+        if stats is None:
+            directory = os.path.join(self.directory, str(tournament_id)) if self.directory else None
+            stats = self.tournaments[tournament_id] = MatStats(_Log(directory))
+            stats.replay()
+        return stats
+
+    def discard(self, tournament_id: int) -> None:
+        """Forget the tournament in this worker; its log stays for the next time it is needed"""
+        self.tournaments.pop(tournament_id, None)
+
+    async def record(self, tournament_id: int, matches: List[Match], timestamp: Optional[float] = None) -> None:
+        await self.get(tournament_id).observe(matches, time.time() if timestamp is None else timestamp)
+
+mat_history = _MatHistory()
@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from models.ttypes import Match, Wrestler
+from .mat_history import mat_history
+
+__all__ = ["match_indexes"]
+
+# How long a mat board snapshot is served before it is fetched again
+MATCH_SNAPSHOT_TTL = float(os.getenv("MATCH_SNAPSHOT_TTL", 5))
+
+MatchKey = Tuple[Hashable, ...]
+
+
+def _match_key(match: Match) -> MatchKey:
+    if match.mat and match.bout:
+        return match.mat, match.bout
+    # Mat or bout text that couldn't be read comes back as 0; the wrestlers tell such rows apart
+    return (match.mat, match.bout, *(w.id if w else None for w in (match.wrestler1, match.wrestler2)))
+
+
+def _wrestlers(match: Match) -> List[Wrestler]:
+    return [w for w in (match.wrestler1, match.wrestler2) if w]
+
+
+# Attributes the board is indexed on, each mapped to the values a bout is filed under
+_INDEXED_FIELDS: Dict[str, Callable[[Match], Iterable[Hashable]]] = {
+    "wrestler": lambda m: [w.id for w in _wrestlers(m) if w.id],
+    "team": lambda m: dict.fromkeys(w.team.id for w in _wrestlers(m) if w.team and w.team.id),
+    "mat": lambda m: [m.mat],
+    "status": lambda m: [m.status],
+    "weight_class": lambda m: [m.weight_class],
+}
+
+
+class MatchIndex:
+    """The latest mat board of one tournament, indexed by wrestler, team, mat, status and weight
+
+    Snapshots are applied incrementally: only bouts that appeared, changed or
+    disappeared since the previous snapshot touch the inverted indexes.
+    """
+
+    def __init__(self):
+        self.matches: Dict[MatchKey, Match] = {}
+        self.positions: Dict[MatchKey, int] = {}
+        self.indexes: Dict[str, Dict[Hashable, Dict[MatchKey, Match]]] = {
+            field: {} for field in _INDEXED_FIELDS
+        }
+        self.updated_at: float = 0.0
+        self.lock = asyncio.Lock()
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.updated_at < MATCH_SNAPSHOT_TTL
+
+    def _add(self, key: MatchKey, match: Match) -> None:
+        self.matches[key] = match
+        for field, values_of in _INDEXED_FIELDS.items():
+            index = self.indexes[field]
+            for value in values_of(match):
+                index.setdefault(value, {})[key] = match
+
+    def _remove(self, key: MatchKey) -> None:
+        match = self.matches.pop(key)
+        for field, values_of in _INDEXED_FIELDS.items():
+            index = self.indexes[field]
+            for value in values_of(match):
+                entries = index.get(value)
+                if entries is None:
+                    continue
+                entries.pop(key, None)
+                if not entries:
+                    del index[value]
+
+    def update(self, matches: List[Match]) -> None:
+        snapshot: Dict[MatchKey, Match] = {}
+        for match in matches:
+            key = base = _match_key(match)
+            # Rows alike in every way still each get listed
+            repeat = 0
+            while key in snapshot:
+                repeat += 1
+                key = (*base, repeat)
+            snapshot[key] = match
+        for key in [k for k in self.matches if k not in snapshot]:
+            self._remove(key)
+        for key, match in snapshot.items():
+            previous = self.matches.get(key)
+            if previous == match:
+                continue
+            if previous is not None:
+                self._remove(key)
+            self._add(key, match)
+        # Keep the board in upstream order for listings
+        self.positions = {key: i for i, key in enumerate(snapshot)}
+        self.matches = {key: self.matches[key] for key in snapshot}
+        self.updated_at = time.monotonic()
+
+    def all(self) -> List[Match]:
+        return list(self.matches.values())
+
+    def filter(self, **criteria: Optional[Iterable[Hashable]]) -> List[Match]:
+        """Bouts matching every given field, and any of the values given for a field
+
+        Fields left as None are not filtered on. Results keep the board's order.
+        """
+        selected: Optional[Set[MatchKey]] = None
+        for field, values in criteria.items():
+            if values is None:
+                continue
+            index = self.indexes[field]
+            keys = set().union(*(index.get(value, {}).keys() for value in values))
+            selected = keys if selected is None else selected & keys
+        if selected is None:
+            return self.all()
+        return [self.matches[key] for key in sorted(selected, key=self.positions.__getitem__)]
+
+    def for_wrestler(self, wrestler_id: str) -> List[Match]:
+        return self.filter(wrestler=[wrestler_id])
+
+    def for_team(self, team_id: str) -> List[Match]:
+        return self.filter(team=[team_id])
+
+
+class _MatchIndexes:
+    def __init__(self):
+        self.indexes: Dict[int, MatchIndex] = {}
+
+    def discard(self, tournament_id: int) -> None:
+        self.indexes.pop(tournament_id, None)
+
+    def get(self, tournament_id: int) -> MatchIndex:
+        if tournament_id not in self.indexes:
+            self.indexes[tournament_id] = MatchIndex()
+        return self.indexes[tournament_id]
+
+    async def current(
+        self, tournament_id: int, fetch: Callable[[], Awaitable[List[Match]]]
+    ) -> MatchIndex:
+        """Return the tournament's index, refreshing it with `fetch` if the snapshot is stale
+
+        Concurrent callers share a single refresh instead of each going upstream.
+        """
+        index = self.get(tournament_id)
+        if index.is_fresh:
+            return index
+        async with index.lock:
+            if not index.is_fresh:
+                matches = await fetch()
+                index.update(matches)
+                await mat_history.record(tournament_id, matches)
+        return index
+
+match_indexes = _MatchIndexes()
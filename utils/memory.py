@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import asyncio
+import inspect
+from contextlib import contextmanager
+from array import array
+from enum import Enum
+from collections import deque
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Union
+from aiohttp import ClientSession
+from .metrics import metrics
+
+__all__ = ["memory", "approximate_size", "SESSION_BYTES", "LIVE_WINDOW"]
+
+# Bytes of per tournament state a worker may hold before the coldest finished tournaments are dropped, 0 for no limit
+MEMORY_BUDGET_BYTES = int(float(os.getenv("MEMORY_BUDGET_MB", 256)) * 1024 * 1024)
+# Seconds between measuring what every tournament holds and enforcing the budget
+MEMORY_CHECK_INTERVAL = float(os.getenv("MEMORY_CHECK_INTERVAL", 30))
+# Seconds since a tournament's mat board last moved that it still counts as live
+LIVE_WINDOW = float(os.getenv("MEMORY_LIVE_WINDOW", 1800))
+# Heap of a session, its connector and a kept-alive connection, as measured with tracemalloc
+SESSION_BYTES = 24 * 1024
+# Seconds a request whose end was never seen, e.g. on a dropped connection, still keeps its tournament in memory
+_REQUEST_GRACE = 300
+
+# Shared by everything, or not ours to walk into; a reference to one costs a tournament nothing
+_NOT_OWNED = (
+    type, ModuleType, FunctionType, BuiltinFunctionType, MethodType, Enum,
+    asyncio.AbstractEventLoop, asyncio.Future, ClientSession,
+)
+_LEAVES = (str, bytes, bytearray, int, float, complex, bool, array, memoryview, type(None))
+
+_evictions = metrics.counter("memory_evictions_total", "Tournaments dropped from memory to stay within budget")
+
+
+def approximate_size(value: Any) -> int:
+    """Bytes held by `value` and everything it references, counting shared objects once"""
+    seen = set()
+    stack = [value]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _NOT_OWNED):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, _LEAVES):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        else:
+            attributes = getattr(current, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+            for cls in type(current).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if hasattr(current, slot):
+                        stack.append(getattr(current, slot))
+    return total
+
+
+class _Holder:
+    def __init__(
+        self,
+        tournaments: Callable[[], Dict[int, Any]],
+        discard: Callable[[int], Union[None, Awaitable[None]]],
+        size: Callable[[Any], int],
+    ):
+        self.tournaments = tournaments
+        self.discard = discard
+        self.size = size
+
+
+class _MemoryAccountant:
+    """Approximate bytes each tournament holds across every per tournament structure
+
+    Structures register how to list what they hold per tournament and how to let go
+    of a tournament. Every MEMORY_CHECK_INTERVAL seconds all of it is measured, and
+    while the total is over budget the finished tournaments least recently asked about
+    are dropped from all of them at once. Live tournaments, and tournaments a request
+    is still being answered for, are never dropped.
+    """
+
+    def __init__(self, budget: int = MEMORY_BUDGET_BYTES):
+        self.budget = budget
+        self.holders: Dict[str, _Holder] = {}
+        self.live_checks: List[Callable[[int], bool]] = []
+        self.last_used: Dict[int, float] = {}
+        self.in_flight: Dict[int, Dict[object, float]] = {}
+        self.usage: Dict[int, Dict[str, int]] = {}
+        self.measured_at: Optional[str] = None
+        self.evicted = 0
+
+    def track(
+        self,
+        name: str,
+        tournaments: Callable[[], Dict[int, Any]],
+        discard: Callable[[int], Union[None, Awaitable[None]]],
+        size: Callable[[Any], int] = approximate_size,
+    ) -> None:
+        """Account for what `tournaments()` holds per tournament id, dropped with `discard`"""
+        self.holders[name] = _Holder(tournaments, discard, size)
+
+    def protect(self, is_live: Callable[[int], bool]) -> None:
+        """Never evict tournaments `is_live` says are still going on"""
+        self.live_checks.append(is_live)
+
+    def touch(self, tournament_id: int) -> None:
+        self.last_used[tournament_id] = time.monotonic()
+
+    def begin(self, tournament_id: int) -> object:
+        """Note a request for the tournament started, returning what to `end` it with"""
+        token = object()
+        self.in_flight.setdefault(tournament_id, {})[token] = time.monotonic()
+        self.touch(tournament_id)
+        return token
+
+    def end(self, tournament_id: int, token: object) -> None:
+        requests = self.in_flight.get(tournament_id)
+        if requests is not None:
+            requests.pop(token, None)
+            if not requests:
+                del self.in_flight[tournament_id]
+        self.touch(tournament_id)
+
+    @contextmanager
+    def in_use(self, tournament_id: int) -> Iterator[None]:
+        """Keep the tournament for the whole block, e.g. while a response streams"""
+        token = self.begin(tournament_id)
+        try:
+            yield
+        finally:
+            self.end(tournament_id, token)
+
+    def is_busy(self, tournament_id: int) -> bool:
+        requests = self.in_flight.get(tournament_id)
+        if not requests:
+            return False
+        cutoff = time.monotonic() - _REQUEST_GRACE
+        for token in [token for token, started in requests.items() if started < cutoff]:
+            del requests[token]
+        return bool(requests)
+
+    def is_live(self, tournament_id: int) -> bool:
+        return any(check(tournament_id) for check in self.live_checks)
+
+    def measure(self) -> Dict[int, Dict[str, int]]:
+        usage: Dict[int, Dict[str, int]] = {}
+        for name, holder in self.holders.items():
+            for tournament_id, held in list(holder.tournaments().items()):
+                usage.setdefault(tournament_id, {})[name] = holder.size(held)
+        self.usage = usage
+        self.measured_at = datetime.now(timezone.utc).isoformat()
+        # Nothing held any more, nothing to remember it by
+        for tournament_id in set(self.last_used) - set(usage):
+            del self.last_used[tournament_id]
+        return usage
+
+    @property
+    def total(self) -> int:
+        return sum(sum(held.values()) for held in self.usage.values())
+
+    async def evict(self, tournament_id: int) -> None:
+        for holder in self.holders.values():
+            discarded = holder.discard(tournament_id)
+            if inspect.isawaitable(discarded):
+                await discarded
+        self.usage.pop(tournament_id, None)
+        self.last_used.pop(tournament_id, None)
+        self.evicted += 1
+        _evictions.inc()
+
+    async def enforce(self) -> List[int]:
+        """Measure, then drop the coldest finished tournaments until back within budget"""
+        self.measure()
+        if not self.budget:
+            return []
+        total = self.total
+        evicted = []
+        if total <= self.budget:
+            return evicted
+        candidates = sorted(
+            (
+                tournament_id for tournament_id in self.usage
+                if not self.is_live(tournament_id) and not self.is_busy(tournament_id)
+            ),
+            key=lambda tournament_id: self.last_used.get(tournament_id, 0.0),
+        )
+        for tournament_id in candidates:
+            if total <= self.budget:
+                break
+            total -= sum(self.usage[tournament_id].values())
+            await self.evict(tournament_id)
+            evicted.append(tournament_id)
+        return evicted
+
+    async def enforce_periodically(self, interval: float = MEMORY_CHECK_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.enforce()
+
+    def breakdown(self) -> dict:
+        now = time.monotonic()
+        tournaments = []
+        for tournament_id, held in self.usage.items():
+            last_used = self.last_used.get(tournament_id)
+            tournaments.append({
+                "tournament_id": tournament_id,
+                "bytes": sum(held.values()),
+                "live": self.is_live(tournament_id),
+                "requests_in_flight": len(self.in_flight.get(tournament_id, ())),
+                "idle_seconds": round(now - last_used, 1) if last_used is not None else None,
+                "held": held,
+            })
+        tournaments.sort(key=lambda t: -t["bytes"])
+        return {
+            "pid": os.getpid(),
+            "budget_bytes": self.budget or None,
+            "total_bytes": self.total,
+            "measured_at": self.measured_at,
+            "evicted": self.evicted,
+            "tournaments": tournaments,
+        }
+
+memory = _MemoryAccountant()
@@ -0,0 +1,243 @@
+import os
+import glob
+import json
+import time
+import asyncio
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from .tracing import current_trace
+
+__all__ = ["metrics", "stage"]
+
+# Each worker writes its metrics here so /metrics can answer for all of them
+METRICS_DIR = os.getenv("METRICS_DIR", "data/metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+# How often the event loop is checked for lag
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.5))
+_PREFIX = "opentw_"
+
+_DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = _DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> per bucket counts (the last one being +Inf), then sum
+        self.values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [0] * (len(self.buckets) + 2)
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Gauge:
+    """Read when metrics are collected, `read` returning a value per label set"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], Dict[Labels, float]]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+
+class _Metrics:
+    def __init__(self):
+        self.counters: Dict[str, Counter] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, Gauge] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        if name not in self.counters:
+            self.counters[name] = Counter(_PREFIX + name, help)
+        return self.counters[name]
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = _DURATION_BUCKETS) -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(_PREFIX + name, help, buckets)
+        return self.histograms[name]
+
+    def gauge(self, name: str, help: str, read: Callable[[], object]) -> Gauge:
+        """Register a gauge; `read` returns a number, or a {((label, value), ...): number} mapping"""
+
+        def values() -> Dict[Labels, float]:
+            value = read()
+            if isinstance(value, dict):
+                return {_labels(dict(labels)): v for labels, v in value.items()}
+            return {(): value}
+
+        self.gauges[name] = Gauge(_PREFIX + name, help, values)
+        return self.gauges[name]
+
+    def snapshot(self) -> dict:
+        """This worker's metrics in a JSON friendly form"""
+        worker = ("worker", str(os.getpid()))
+        return {
+            "counters": {
+                c.name: [c.help, [[list(k), v] for k, v in c.values.items()]]
+                for c in self.counters.values()
+            },
+            "histograms": {
+                h.name: [h.help, list(h.buckets), [[list(k), v] for k, v in h.values.items()]]
+                for h in self.histograms.values()
+            },
+            # Gauges aren't additive across workers, so each worker reports its own
+            "gauges": {
+                g.name: [g.help, [[list(k) + [worker], v] for k, v in g.read().items()]]
+                for g in self.gauges.values()
+            },
+        }
+
+    def flush(self, directory: str = METRICS_DIR) -> None:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+
+    def remove(self, directory: str = METRICS_DIR) -> None:
+        try:
+            os.remove(os.path.join(directory, f"{os.getpid()}.json"))
+        except OSError:
+            pass
+
+    async def flush_periodically(self, interval: float = METRICS_FLUSH_INTERVAL) -> None:
+        while True:
+            self.flush()
+            await asyncio.sleep(interval)
+
+    async def watch_loop_lag(self, interval: float = LOOP_LAG_INTERVAL) -> None:
+        """Measure how late the event loop wakes up a sleeping task"""
+        lag = self.histogram("event_loop_lag_seconds", "How late the event loop ran a task due to run")
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag.observe(max(0.0, time.perf_counter() - started - interval))
+
+    def collect(self, directory: str = METRICS_DIR) -> List[dict]:
+        """Snapshots of every live worker, this one's being current"""
+        own = os.path.join(directory, f"{os.getpid()}.json")
+        # Workers that stopped flushing are gone and no longer count
+        expires = time.time() - METRICS_FLUSH_INTERVAL * 3
+        snapshots = [self.snapshot()]
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            try:
+                if path == own or os.path.getmtime(path) < expires:
+                    continue
+                with open(path, "r") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self, snapshots: List[dict]) -> str:
+        """Merge worker snapshots into the Prometheus text exposition format"""
+        counters: Dict[str, Tuple[str, Dict[Labels, float]]] = {}
+        histograms: Dict[str, Tuple[str, list, Dict[Labels, List[float]]]] = {}
+        gauges: Dict[str, Tuple[str, Dict[Labels, float]]] = {}
+        for snapshot in snapshots:
+            for name, (help, values) in snapshot["counters"].items():
+                merged = counters.setdefault(name, (help, {}))[1]
+                for labels, value in values:
+                    key = tuple(map(tuple, labels))
+                    merged[key] = merged.get(key, 0) + value
+            for name, (help, buckets, values) in snapshot["histograms"].items():
+                merged = histograms.setdefault(name, (help, buckets, {}))[2]
+                for labels, value in values:
+                    key = tuple(map(tuple, labels))
+                    current = merged.setdefault(key, [0] * len(value))
+                    merged[key] = [a + b for a, b in zip(current, value)]
+            for name, (help, values) in snapshot["gauges"].items():
+                merged = gauges.setdefault(name, (help, {}))[1]
+                for labels, value in values:
+                    merged[tuple(map(tuple, labels))] = value
+
+        lines = []
+        for name, (help, values) in sorted(counters.items()):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+            lines += [f"{name}{_format_labels(k)} {_format_value(v)}" for k, v in sorted(values.items())]
+        for name, (help, values) in sorted(gauges.items()):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{_format_labels(k)} {_format_value(v)}" for k, v in sorted(values.items())]
+        for name, (help, buckets, values) in sorted(histograms.items()):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+            for labels, entry in sorted(values.items()):
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], entry[:-1]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {_format_value(cumulative)}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(entry[-1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {_format_value(cumulative)}")
+        return "\n".join(lines) + "\n"
+
+metrics = _Metrics()
+
+_stages = metrics.histogram("stage_seconds", "Time spent per stage of answering a request")
+
+
+@contextmanager
+def stage(name: str, **labels):
+    """Time the block as one stage of a request, e.g. `with stage("parse", parser="matches"):`
+
+    Besides the stage_seconds histogram, the time counts towards the request's
+    Server-Timing header and becomes a span when the request is traced.
+    """
+    trace = current_trace()
+    opened = trace.start_span() if trace else None
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _stages.observe(elapsed, stage=name, **labels)
+        if trace:
+            trace.record(name, elapsed)
+            trace.end_span(opened, name, labels, error)
@@ -0,0 +1,152 @@
+import os
+import gc
+import sys
+import pstats
+import asyncio
+import cProfile
+import threading
+import tracemalloc
+from io import StringIO
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+__all__ = ["profiler", "ProfilerBusy", "ADMIN_TOKEN", "PROFILE_MAX_SECONDS", "MEMORY_WATCHED_FILES"]
+
+# Admin endpoints only exist when a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+# Seconds between stack samples of the event loop thread
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+# Frames kept per allocation, enough to reach our code from inside BeautifulSoup
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", 25))
+
+# Files whose call sites memory diffs are attributed to by default
+MEMORY_WATCHED_FILES = ("parsers/tournaments.py", "models/ttypes.py", "utils/session_manager.py")
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is still running in the worker"""
+
+
+def _relative(filename: str) -> str:
+    return os.path.relpath(filename, _ROOT) if filename.startswith(_ROOT) else filename
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({_relative(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class _Profiler:
+    def __init__(self):
+        self.running = False
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    async def sample(self, seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL) -> str:
+        """Sample the event loop thread's stack for `seconds`, as collapsed stacks
+
+        The sampler runs on its own thread so the loop keeps serving while it is watched,
+        and time the loop spends idle shows up as its selector wait.
+        """
+        loop_thread = threading.get_ident()
+        stacks: Counter = Counter()
+        done = threading.Event()
+
+        def run() -> None:
+            while not done.wait(interval):
+                frame = sys._current_frames().get(loop_thread)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+
+        with self._exclusive():
+            sampler = threading.Thread(target=run, name="stack-sampler", daemon=True)
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                done.set()
+                sampler.join()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    async def trace_calls(self, seconds: float, limit: int = 50) -> str:
+        """Profile every call made by the worker for `seconds` with cProfile"""
+        profile = cProfile.Profile()
+        with self._exclusive():
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+        out = StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    @contextmanager
+    def _exclusive(self):
+        if self.running:
+            raise ProfilerBusy("A profile is already running in this worker")
+        self.running = True
+        try:
+            yield
+        finally:
+            self.running = False
+
+    def start_memory(self) -> None:
+        """Start tracing allocations, if needed, and take the baseline later diffs compare to"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        gc.collect()
+        self.baseline = tracemalloc.take_snapshot()
+
+    def stop_memory(self) -> None:
+        tracemalloc.stop()
+        self.baseline = None
+
+    def memory_diff(self, files: Tuple[str, ...] = MEMORY_WATCHED_FILES, limit: int = 20) -> dict:
+        """Memory held per call site in `files` now, compared to the baseline of start_memory
+
+        Each allocation is charged to the innermost frame in one of `files`, so memory
+        BeautifulSoup allocates on behalf of a parser counts against the parser's line.
+        """
+        # Parse trees are cyclic, only count what is still reachable
+        gc.collect()
+        current = tracemalloc.take_snapshot()
+        now = _by_call_site(current, files)
+        before = _by_call_site(self.baseline, files)
+        sites = []
+        for site in now.keys() | before.keys():
+            size, count = now.get(site, (0, 0))
+            size_before, count_before = before.get(site, (0, 0))
+            sites.append({
+                "site": site,
+                "size": size,
+                "size_diff": size - size_before,
+                "count": count,
+                "count_diff": count - count_before,
+            })
+        sites.sort(key=lambda s: abs(s["size_diff"]), reverse=True)
+        traced, peak = tracemalloc.get_traced_memory()
+        return {"pid": os.getpid(), "traced": traced, "peak": peak, "sites": sites[:limit]}
+
+
+def _by_call_site(snapshot: tracemalloc.Snapshot, files: Tuple[str, ...]) -> Dict[str, Tuple[int, int]]:
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(True, f"*{f}", all_frames=True) for f in files])
+    sites: Dict[str, List[int]] = {}
+    for trace in snapshot.traces:
+        # Frames run oldest to most recent
+        for frame in reversed(trace.traceback):
+            if frame.filename.endswith(files):
+                site = sites.setdefault(f"{_relative(frame.filename)}:{frame.lineno}", [0, 0])
+                site[0] += trace.size
+                site[1] += 1
+                break
+    return {site: (size, count) for site, (size, count) in sites.items()}
+
+profiler = _Profiler()
@@ -0,0 +1,140 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from enum import IntEnum
+from collections import deque
+from contextvars import ContextVar
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, List, Tuple
+
+__all__ = ["Priority", "current_priority", "priority", "scheduler"]
+
+# Upstream requests allowed in flight at once per worker
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", 20))
+_WAIT_SAMPLES = 500
+
+
+class Priority(IntEnum):
+    """Classes of upstream work, most urgent first"""
+    LIVE = 0        # a user is waiting on the answer
+    REFRESH = 1     # keeping live data warm ahead of users asking
+    BACKGROUND = 2  # backfills and crawls nobody is waiting on
+
+    @property
+    def pool_share(self) -> float:
+        """Fraction of the connection pool the class may occupy on its own"""
+        return {Priority.LIVE: 1.0, Priority.REFRESH: 0.75, Priority.BACKGROUND: 0.5}[self]
+
+    @property
+    def rate_reserve(self) -> float:
+        """Fraction of an endpoint's burst budget the class must leave untouched for higher classes"""
+        return {Priority.LIVE: 0.0, Priority.REFRESH: 0.25, Priority.BACKGROUND: 0.5}[self]
+
+
+_current_priority: ContextVar[Priority] = ContextVar("upstream_priority", default=Priority.LIVE)
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+@contextmanager
+def priority(level: Priority):
+    """Run the upstream requests made inside the block at `level`"""
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class _PriorityScheduler:
+    """Hands out upstream connection slots by priority class
+
+    Waiters are served most urgent class first, then in arrival order. Lower classes
+    are capped to a share of the pool so live requests always find a free slot soon.
+    """
+
+    def __init__(self, concurrency: int = UPSTREAM_CONCURRENCY):
+        self.concurrency = concurrency
+        self.in_flight: Dict[Priority, int] = {p: 0 for p in Priority}
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.waits: Dict[Priority, Deque[float]] = {p: deque(maxlen=_WAIT_SAMPLES) for p in Priority}
+        self._sequence = itertools.count()
+
+    def _can_start(self, level: Priority) -> bool:
+        return (
+            sum(self.in_flight.values()) < self.concurrency
+            and self.in_flight[level] < max(1, int(self.concurrency * level.pool_share))
+        )
+
+    def _wake_next(self) -> None:
+        skipped = []
+        while self.waiters:
+            entry = heapq.heappop(self.waiters)
+            level, _, future = entry
+            if future.done():
+                continue
+            if self._can_start(Priority(level)):
+                self.in_flight[Priority(level)] += 1
+                future.set_result(None)
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self.waiters, entry)
+
+    def _must_queue(self, level: Priority) -> bool:
+        while self.waiters and self.waiters[0][2].done():
+            heapq.heappop(self.waiters)
+        # Only waiters at least as urgent get to go first
+        return bool(self.waiters and self.waiters[0][0] <= level) or not self._can_start(level)
+
+    @asynccontextmanager
+    async def slot(self, level: Priority):
+        started = time.monotonic()
+        if not self._must_queue(level):
+            self.in_flight[level] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiters, (int(level), next(self._sequence), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                # The slot may have been handed over just before the cancellation landed
+                if future.done() and not future.cancelled():
+                    self.in_flight[level] -= 1
+                    self._wake_next()
+                raise
+        self.waits[level].append(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self.in_flight[level] -= 1
+            self._wake_next()
+
+    def stats(self) -> Dict[str, dict]:
+        queued = {p: 0 for p in Priority}
+        for level, _, future in self.waiters:
+            if not future.done():
+                queued[Priority(level)] += 1
+        return {
+            p.name.lower(): {
+                "in_flight": self.in_flight[p],
+                "queued": queued[p],
+                "wait_p50": _percentile(list(self.waits[p]), 0.50),
+                "wait_p95": _percentile(list(self.waits[p]), 0.95),
+                "wait_max": max(self.waits[p], default=0.0),
+            }
+            for p in Priority
+        }
+
+scheduler = _PriorityScheduler()
@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import heapq
+import asyncio
+import unicodedata
+from datetime import date
+from itertools import chain
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from models.ttypes import EventType, Tournament
+
+__all__ = ["search_index"]
+
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "data/tournaments.json")
+SEARCH_INDEX_PERSIST_INTERVAL = float(os.getenv("SEARCH_INDEX_PERSIST_INTERVAL", 300))
+# Fuzzy matches scoring below this are not considered a good enough answer
+SUGGEST_MIN_SCORE = float(os.getenv("SUGGEST_MIN_SCORE", 0.35))
+_MAX_PREFIX_LENGTH = 12
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _searchable_text(tournament: Tournament) -> str:
+    parts = [tournament.name, tournament.venue_city, tournament.venue_state]
+    for day in (tournament.start_date, tournament.end_date):
+        if day:
+            parts += [day.isoformat(), str(day.year), day.strftime("%B")]
+    return _normalize(" ".join(p for p in parts if p))
+
+
+def _as_date(value: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(value[:10]) if value else None
+
+
+def _tournament_from_dict(data: dict) -> Tournament:
+    return Tournament(
+        id=data["id"],
+        name=data["name"],
+        event_type=EventType.from_alias(data["event_type"]),
+        start_date=_as_date(data.get("start_date")),
+        end_date=_as_date(data.get("end_date")),
+        venue_name=data.get("venue_name"),
+        venue_city=data.get("venue_city"),
+        venue_state=data.get("venue_state"),
+        venue_zip=data.get("venue_zip"),
+        logo_url=data.get("logo_url"),
+        event_flyer_url=data.get("event_flyer_url"),
+        website_url=data.get("website_url"),
+    )
+
+
+class _TournamentSearchIndex:
+    """In-memory index of every tournament seen, for autocomplete without going upstream
+
+    Each tournament is filed under the prefixes of its words (for as-you-type matches)
+    and under the trigrams of its text (for typo tolerant matches).
+    """
+
+    def __init__(self):
+        self.tournaments: Dict[int, Tournament] = {}
+        self.prefixes: Dict[str, Set[int]] = {}
+        self.trigrams: Dict[str, Set[int]] = {}
+        self.texts: Dict[int, str] = {}
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.tournaments)
+
+    def _unindex(self, tournament_id: int) -> None:
+        text = self.texts.pop(tournament_id, None)
+        if text is None:
+            return
+        for key, index in self._keys(text):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(tournament_id)
+                if not ids:
+                    del index[key]
+
+    def _keys(self, text: str) -> Iterable[Tuple[str, Dict[str, Set[int]]]]:
+        for word in set(text.split()):
+            for length in range(1, min(len(word), _MAX_PREFIX_LENGTH) + 1):
+                yield word[:length], self.prefixes
+        for trigram in _trigrams(text):
+            yield trigram, self.trigrams
+
+    def add(self, tournaments: Iterable[Tournament]) -> None:
+        for tournament in tournaments:
+            text = _searchable_text(tournament)
+            self.tournaments[tournament.id] = tournament
+            if self.texts.get(tournament.id) == text:
+                continue
+            self._unindex(tournament.id)
+            self.texts[tournament.id] = text
+            for key, index in self._keys(text):
+                index.setdefault(key, set()).add(tournament.id)
+            self.dirty = True
+
+    def _prefix_matches(self, words: List[str]) -> Set[int]:
+        matched: Optional[Set[int]] = None
+        for word in words:
+            ids = self.prefixes.get(word[:_MAX_PREFIX_LENGTH], set())
+            if len(word) > _MAX_PREFIX_LENGTH:
+                ids = {i for i in ids if any(w.startswith(word) for w in self.texts[i].split())}
+            matched = set(ids) if matched is None else matched & ids
+            if not matched:
+                break
+        return matched or set()
+
+    def _fuzzy_matches(self, query: str) -> Dict[int, float]:
+        query_trigrams = _trigrams(query)
+        shared = Counter(chain.from_iterable(self.trigrams.get(t, ()) for t in query_trigrams))
+        # Containment of the query rather than plain Jaccard, since names are longer than queries
+        min_shared = SUGGEST_MIN_SCORE * len(query_trigrams)
+        return {
+            tournament_id: count / len(query_trigrams)
+            for tournament_id, count in shared.items()
+            if count >= min_shared
+        }
+
+    def suggest(self, query: str, limit: int = 10) -> List[Tournament]:
+        """Best matches for `query`, exact word prefixes first, then fuzzy matches"""
+        normalized = _normalize(query)
+        if not normalized:
+            return []
+        scores = dict.fromkeys(self._prefix_matches(normalized.split()), 2.0)
+        if len(scores) < limit:
+            for tournament_id, score in self._fuzzy_matches(normalized).items():
+                scores.setdefault(tournament_id, score)
+
+        def rank(tournament_id: int) -> tuple:
+            start = self.tournaments[tournament_id].start_date
+            return -scores[tournament_id], -(start.toordinal() if start else 0)
+
+        return [self.tournaments[i] for i in heapq.nsmallest(limit, scores, key=rank)]
+
+    @staticmethod
+    def _read(path: str) -> List[Tournament]:
+        try:
+            with open(path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return []
+        tournaments = []
+        for entry in entries:
+            try:
+                tournaments.append(_tournament_from_dict(entry))
+            except (KeyError, ValueError):
+                continue
+        return tournaments
+
+    def load(self, path: str = SEARCH_INDEX_PATH) -> None:
+        self.add(self._read(path))
+        self.dirty = False
+
+    def save(self, path: str = SEARCH_INDEX_PATH) -> None:
+        if not self.dirty:
+            return
+        # Other workers persist to the same file; keep what they found too
+        self.add(t for t in self._read(path) if t.id not in self.tournaments)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump([t.as_dict() for t in self.tournaments.values()], f)
+        os.replace(temp_path, path)
+        self.dirty = False
+
+    async def persist_periodically(self, interval: float = SEARCH_INDEX_PERSIST_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.save()
+
+search_index = _TournamentSearchIndex()
@@ -1,46 +1,83 @@
+import asyncio
 from typing import Dict
 from . import _get_timestamp
 from aiohttp import ClientSession
 from models.ttypes import EventType
 from contextlib import asynccontextmanager
+from .metrics import stage
+from .upstream import upstream, UpstreamFailed
 
 __all__ = ["session_manager"]
 
 class _SessionManager:
     def __init__(self):
+        # Only sessions whose handshake went through, so nobody uses one before it has its cookies
         self.sessions: Dict[int, ClientSession] = {}
-    
+        self.handshakes: Dict[int, asyncio.Future] = {}
+
     async def cleanup(self):
+        for handshake in self.handshakes.values():
+            handshake.cancel()
         for session in self.sessions.values():
             if not session.closed:
                 await session.close()
         self.sessions.clear()
-    
+
+    async def discard(self, tournament_id: int):
+        session = self.sessions.pop(tournament_id, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def _handshake(self, tournament_id: int, event_type: EventType) -> None:
+        session = ClientSession()
+        try:
+            with stage("session"):
+                await upstream.fetch_text(
+                    session,
+                    f"{event_type.tournament_type}/VerifyPassword.jsp",
+                    params={
+                        "TIM": _get_timestamp(),
+                        "twSessionId": "zyxwvutsrq",
+                        "tournamentId": tournament_id,
+                        "userType": "viewer",
+                        "userName": "",
+                        "password": "",
+                    },
+                    # The handshake sets the session's cookies, a replayed body does nothing
+                    allow_stale=False,
+                )
+        except BaseException:
+            await session.close()
+            raise
+        self.sessions[tournament_id] = session
+
+    async def _verified(self, tournament_id: int, event_type: EventType) -> ClientSession:
+        """The tournament's session, waiting on a single handshake however many ask at once"""
+        while tournament_id not in self.sessions:
+            handshake = self.handshakes.get(tournament_id)
+            if handshake is None:
+                handshake = self.handshakes[tournament_id] = asyncio.ensure_future(self._handshake(tournament_id, event_type))
+                handshake.add_done_callback(
+                    lambda task: self.handshakes.pop(tournament_id, None) and (task.cancelled() or task.exception())
+                )
+            # A waiter going away doesn't call the handshake off for the others
+            await asyncio.shield(handshake)
+        return self.sessions[tournament_id]
+
     @asynccontextmanager
     async def get_session(self, tournament_id: int = None, event_type: EventType = EventType.PREDEFINED):
+        if tournament_id is None:
+            async with ClientSession() as session:
+                yield session
+            return
+        session = await self._verified(tournament_id, event_type)
         try:
-            if tournament_id is None:
-                async with ClientSession() as session:
-                    yield session
-            else:
-                if tournament_id not in self.sessions:
-                    self.sessions[tournament_id] = ClientSession()
-                    await self.sessions[tournament_id].get(
-                        f"https://www.trackwrestling.com/{event_type.tournament_type}/VerifyPassword.jsp",
-                        params={
-                            "TIM": _get_timestamp(),
-                            "twSessionId": "zyxwvutsrq",
-                            "tournamentId": tournament_id,
-                            "userType": "viewer",
-                            "userName": "",
-                            "password": "",
-                        }
-                    )
-                yield self.sessions[tournament_id]
-        except Exception as e:
-            if tournament_id in self.sessions:
-                await self.sessions[tournament_id].close()
-                del self.sessions[tournament_id]
-            raise e
-
-session_manager = _SessionManager()
\ No newline at end of file
+            yield session
+        except UpstreamFailed:
+            # Only upstream actually failing casts doubt on the session; rate limiting,
+            # an open circuit or a parse error say nothing about it
+            if self.sessions.get(tournament_id) is session:
+                await self.discard(tournament_id)
+            raise
+
+session_manager = _SessionManager()
@@ -0,0 +1,208 @@
+import os
+import time
+import asyncio
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from models.ttypes import BracketResults, Weight
+from .bracket_versions import bracket_versions
+from .scheduler import Priority, priority
+
+__all__ = ["standings"]
+
+# How long standings are served before the brackets are fetched again
+STANDINGS_TTL = float(os.getenv("STANDINGS_TTL", 30))
+# Points for 1st, 2nd, ... place; places past the end score nothing
+PLACEMENT_POINTS = tuple(float(p) for p in os.getenv("STANDINGS_PLACEMENT_POINTS", "16,12,10,9,7,6,4,3").split(","))
+# Points for winning a bout in the championship and consolation brackets, placement matches excluded
+CHAMPIONSHIP_ADVANCEMENT = 2.0
+CONSOLATION_ADVANCEMENT = 1.0
+# Bonus on top of advancement, by the way the bout was won; the first word found counts, so "tech fall" before "fall"
+_BONUS_POINTS = (("tech", 1.5), ("fall", 2.0), ("forfeit", 2.0), ("default", 2.0), ("disqualification", 2.0), ("major", 1.0))
+
+
+def _bonus(win_type: str) -> float:
+    return next((points for word, points in _BONUS_POINTS if word in win_type), 0.0)
+
+
+class _Contribution:
+    """What one weight's bracket is worth to one team"""
+
+    def __init__(self):
+        self.points = 0.0
+        self.placers: List[dict] = []
+
+
+def score_weight(weight: Weight, results: BracketResults) -> Dict[str, _Contribution]:
+    """Team points earned in one bracket: advancement, bonus and placement points"""
+    teams: Dict[str, _Contribution] = {}
+    for bout in results.bouts:
+        team = teams.setdefault(bout.winner_team, _Contribution())
+        if bout.place is None:
+            team.points += CONSOLATION_ADVANCEMENT if bout.consolation else CHAMPIONSHIP_ADVANCEMENT
+        team.points += _bonus(bout.win_type)
+    for placement in results.placements:
+        team = teams.setdefault(placement.team, _Contribution())
+        if placement.place <= len(PLACEMENT_POINTS):
+            team.points += PLACEMENT_POINTS[placement.place - 1]
+        team.placers.append({"place": placement.place, "wrestler": placement.wrestler, "weight": weight.weight_name})
+    return teams
+
+
+class _Team:
+    def __init__(self):
+        self.points = 0.0
+        self.placers: Dict[int, List[dict]] = {}
+
+
+class TournamentStandings:
+    """Team scores of one tournament, kept as the sum of each weight's contribution
+
+    A refresh only downloads brackets not confirmed unchanged moments ago by some
+    other fetch, and only rescores weights whose bracket moved to a new version:
+    the old contribution is taken off the teams it went to and the new one added.
+    """
+
+    def __init__(self, tournament_id: int):
+        self.tournament_id = tournament_id
+        # Bracket version each contribution was scored from
+        self.versions: Dict[int, int] = {}
+        self.contributions: Dict[int, Dict[str, _Contribution]] = {}
+        self.teams: Dict[str, _Team] = {}
+        self.updated_at: float = 0.0
+        self.changed_at: Optional[float] = None
+        self.weights_rescored = 0
+        self.lock = asyncio.Lock()
+        self.refreshing: Optional[asyncio.Task] = None
+        self._rendered: Optional[dict] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.updated_at < STANDINGS_TTL
+
+    def _apply(self, weight_id: int, contribution: Dict[str, _Contribution], sign: int) -> None:
+        for name, earned in contribution.items():
+            team = self.teams.setdefault(name, _Team())
+            team.points += sign * earned.points
+            if sign > 0 and earned.placers:
+                team.placers[weight_id] = earned.placers
+            elif sign < 0:
+                team.placers.pop(weight_id, None)
+            if sign < 0 and not team.placers and abs(team.points) < 1e-9:
+                del self.teams[name]
+
+    async def update(self, weight: Weight, html: str, parse: Callable[[str, int], BracketResults]) -> bool:
+        """Rescore `weight` if its bracket moved to a new version, returning whether it did"""
+        version = (await bracket_versions.observe(self.tournament_id, weight.weight_id, None, html)).version
+        if self.versions.get(weight.weight_id) == version:
+            return False
+        contribution = score_weight(weight, parse(html, weight.weight_id))
+        self.remove(weight.weight_id)
+        self._apply(weight.weight_id, contribution, 1)
+        self.versions[weight.weight_id] = version
+        self.contributions[weight.weight_id] = contribution
+        self.weights_rescored += 1
+        return True
+
+    def remove(self, weight_id: int) -> None:
+        contribution = self.contributions.pop(weight_id, None)
+        self.versions.pop(weight_id, None)
+        if contribution is not None:
+            self._apply(weight_id, contribution, -1)
+            self._rendered = None
+            self.changed_at = time.time()
+
+    def _unchanged(self, weight_id: int) -> bool:
+        """Whether the bracket was confirmed moments ago to still be the version scored"""
+        known = bracket_versions.known(self.tournament_id, weight_id)
+        return known is not None and known.is_fresh and known.version == self.versions.get(weight_id)
+
+    async def refresh(
+        self,
+        weights: Callable[[], Awaitable[List[Weight]]],
+        fetch: Callable[[List[Weight]], AsyncIterator[Tuple[Weight, str]]],
+        parse: Callable[[str, int], BracketResults],
+    ) -> None:
+        listed = await weights()
+        changed = False
+        found = fetch([weight for weight in listed if not self._unchanged(weight.weight_id)])
+        async with aclosing(found):
+            async for weight, html in found:
+                changed = await self.update(weight, html, parse) or changed
+        # Weights dropped from the tournament take their points with them
+        for weight_id in set(self.contributions) - {weight.weight_id for weight in listed}:
+            self.remove(weight_id)
+        if changed:
+            self._rendered = None
+            self.changed_at = time.time()
+        self.updated_at = time.monotonic()
+
+    def as_dict(self) -> dict:
+        if self._rendered is None:
+            ranked = sorted(self.teams.items(), key=lambda item: (-round(item[1].points, 1), item[0]))
+            teams = []
+            for position, (name, team) in enumerate(ranked):
+                points = round(team.points, 1)
+                # Tied teams share the better place
+                rank = teams[-1]["rank"] if teams and teams[-1]["points"] == points else position + 1
+                placers = sorted((p for weight_id in sorted(team.placers) for p in team.placers[weight_id]), key=lambda p: p["place"])
+                teams.append({
+                    "rank": rank,
+                    "team": name,
+                    "points": points,
+                    "champions": sum(1 for p in placers if p["place"] == 1),
+                    "placers": placers,
+                })
+            self._rendered = {
+                "updated_at": datetime.fromtimestamp(self.changed_at, timezone.utc).isoformat() if self.changed_at else None,
+                "weights_scored": len(self.contributions),
+                "weights_rescored": self.weights_rescored,
+                "teams": teams,
+            }
+        return self._rendered
+
+
+class _Standings:
+    def __init__(self):
+        self.tournaments: Dict[int, TournamentStandings] = {}
+
+    def get(self, tournament_id: int) -> TournamentStandings:
+        if tournament_id not in self.tournaments:
+            self.tournaments[tournament_id] = TournamentStandings(tournament_id)
+        return self.tournaments[tournament_id]
+
+    def discard(self, tournament_id: int) -> None:
+        self.tournaments.pop(tournament_id, None)
+
+    async def _refresh(self, standings: TournamentStandings, weights, fetch, parse) -> None:
+        async with standings.lock:
+            if not standings.is_fresh:
+                await standings.refresh(weights, fetch, parse)
+
+    async def current(
+        self,
+        tournament_id: int,
+        weights: Callable[[], Awaitable[List[Weight]]],
+        fetch: Callable[[List[Weight]], AsyncIterator[Tuple[Weight, str]]],
+        parse: Callable[[str, int], BracketResults],
+    ) -> TournamentStandings:
+        """Return the tournament's standings, refreshing them if stale
+
+        `weights` lists the tournament's weights and `fetch` downloads the brackets of
+        the ones given. Only the first request waits for every bracket; after that stale
+        standings are answered from memory while a single background refresh, at
+        refresh priority, brings them up to date.
+        """
+        standings = self.get(tournament_id)
+        if standings.is_fresh:
+            return standings
+        if not standings.updated_at:
+            await self._refresh(standings, weights, fetch, parse)
+        elif standings.refreshing is None or standings.refreshing.done():
+            with priority(Priority.REFRESH):
+                standings.refreshing = asyncio.ensure_future(self._refresh(standings, weights, fetch, parse))
+            # A failed refresh keeps the last standings and is retried by the next request
+            standings.refreshing.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return standings
+
+standings = _Standings()
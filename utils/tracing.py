@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import random
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+__all__ = ["RequestTrace", "begin_trace", "current_trace"]
+
+# Whether responses carry a Server-Timing header with the request's stage durations
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+# When set, finished traces are appended here as OTLP/JSON lines, one per request
+TRACE_FILE = os.getenv("TRACE_FILE")
+# Fraction of requests traced when TRACE_FILE is set
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "opentw-api")
+
+# Span kinds and status codes as numbered by the OTLP protobuf enums
+_KIND_INTERNAL, _KIND_SERVER = 1, 2
+_STATUS_OK, _STATUS_ERROR = 1, 2
+
+# Innermost open span of the running task, parent of the next one opened
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+
+def _attributes(attributes: Dict[str, object]) -> List[dict]:
+    values = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            values.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            values.append({"key": key, "value": {"intValue": str(value)}})
+        else:
+            values.append({"key": key, "value": {"stringValue": str(value)}})
+    return values
+
+
+class RequestTrace:
+    """Stage durations of one request, and its spans when the request is sampled
+
+    Stages are summed by name for the Server-Timing header. Spans are only kept
+    when tracing is on, so an untraced request pays for the sums alone.
+    """
+
+    def __init__(self, name: str, sampled: bool):
+        self.name = name
+        self.started = time.perf_counter()
+        self.start_ns = time.time_ns()
+        self.timings: Dict[str, float] = {}
+        self.trace_id = f"{random.getrandbits(128):032x}" if sampled else None
+        self.root_id = f"{random.getrandbits(64):016x}" if sampled else None
+        self.spans: List[dict] = []
+
+    @property
+    def sampled(self) -> bool:
+        return self.trace_id is not None
+
+    def start_span(self) -> Optional[tuple]:
+        """Open a child of the innermost open span, returning what end_span needs"""
+        if not self.sampled:
+            return None
+        span_id = f"{random.getrandbits(64):016x}"
+        parent_id = _current_span.get() or self.root_id
+        token = _current_span.set(span_id)
+        return span_id, parent_id, token, time.time_ns()
+
+    def end_span(self, opened: Optional[tuple], name: str, attributes: Dict[str, object], error: bool) -> None:
+        if opened is None:
+            return
+        span_id, parent_id, token, start_ns = opened
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Opened in another context (a generator resumed elsewhere), nothing to restore
+            pass
+        self.spans.append(self._span(span_id, parent_id, name, start_ns, time.time_ns(), _KIND_INTERNAL, attributes, error))
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def _span(
+        self, span_id: str, parent_id: Optional[str], name: str, start_ns: int, end_ns: int,
+        kind: int, attributes: Dict[str, object], error: bool,
+    ) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": span_id,
+            "name": name,
+            "kind": kind,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": _attributes(attributes),
+            "status": {"code": _STATUS_ERROR if error else _STATUS_OK},
+        }
+        if parent_id:
+            span["parentSpanId"] = parent_id
+        return span
+
+    def server_timing(self) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.timings.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def finish(self, attributes: Dict[str, object], error: bool) -> None:
+        """Close the request's root span and write the whole trace out"""
+        if not self.sampled or not TRACE_FILE:
+            return
+        root = self._span(self.root_id, None, self.name, self.start_ns, time.time_ns(), _KIND_SERVER, attributes, error)
+        # The shape an OpenTelemetry collector's otlpjsonfile receiver reads, one export request per line
+        export = {
+            "resourceSpans": [{
+                "resource": {"attributes": _attributes({"service.name": TRACE_SERVICE_NAME, "process.pid": os.getpid()})},
+                "scopeSpans": [{"scope": {"name": "opentw"}, "spans": [root] + self.spans}],
+            }]
+        }
+        line = (json.dumps(export, separators=(",", ":")) + "\n").encode()
+        # A single append keeps lines from different workers from interleaving
+        fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def begin_trace(name: str) -> Optional[RequestTrace]:
+    """Start collecting the current request's stages, if anything will use them"""
+    sampled = bool(TRACE_FILE) and random.random() < TRACE_SAMPLE_RATE
+    trace = RequestTrace(name, sampled) if SERVER_TIMING or sampled else None
+    # Always set, requests on a keep-alive connection share the connection task's context
+    _current_trace.set(trace)
+    return trace
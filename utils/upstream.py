@@ -0,0 +1,448 @@
+import os
+import time
+import codecs
+import random
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+from aiohttp import ClientError, ClientSession, ClientTimeout
+from .cache import LRUCache
+from .cassettes import recorder, request_key
+from .metrics import metrics, stage
+from .scheduler import Priority, current_priority, scheduler
+
+__all__ = ["upstream", "UpstreamUnavailable", "UpstreamBusy", "CircuitOpen", "UpstreamFailed", "BASE_URL"]
+
+# Point at a stand-in server (python -m tools.standin) to run without TrackWrestling
+BASE_URL = os.getenv("UPSTREAM_BASE_URL", "https://www.trackwrestling.com").rstrip("/")
+
+# Seconds a request may wait for its endpoint's rate budget before giving up
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", 5))
+# Refresh and background work isn't holding up a user, so it can wait much longer
+UPSTREAM_BACKGROUND_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_BACKGROUND_QUEUE_TIMEOUT", 120))
+STALE_CACHE_SIZE = int(os.getenv("STALE_CACHE_SIZE", 128))
+# Seconds a single attempt may take before it counts as failed
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", 10))
+# Attempts after the first for a failed request, spaced by jittered exponential backoff
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", 2))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", 0.25))
+# Consecutive failures that open an endpoint's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+# Send a second attempt once the first runs past the endpoint's observed p95 latency
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "false").lower() in ("1", "true", "yes")
+# Bytes read off the socket at a time when a body is streamed to its parser
+UPSTREAM_STREAM_CHUNK_SIZE = int(os.getenv("UPSTREAM_STREAM_CHUNK_SIZE", 64 * 1024))
+_LATENCY_SAMPLES = 200
+_MIN_HEDGE_SAMPLES = 20
+
+# endpoint -> (requests per second, burst)
+_DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "Login.jsp": (2, 5),
+    "VerifyPassword.jsp": (2, 5),
+    "TournamentHub.jsp": (5, 10),
+    "MB_MatAssignmentDisplay.jsp": (10, 20),
+    "BracketViewer.jsp": (5, 10),
+    "AjaxFunctions.jsp": (10, 20),
+}
+_FALLBACK_RATE_LIMIT = (5, 10)
+
+_requests = metrics.counter("upstream_requests_total", "Upstream requests by endpoint and outcome")
+_attempt_seconds = metrics.histogram("upstream_attempt_seconds", "Duration of single upstream attempts")
+_wait_seconds = metrics.histogram("upstream_wait_seconds", "Time spent queued for a connection slot and rate budget")
+_response_bytes = metrics.histogram(
+    "upstream_response_bytes", "Size of upstream response bodies", buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+)
+
+
+def _rate_limits() -> Dict[str, Tuple[float, int]]:
+    """Defaults overridden by UPSTREAM_RATE_LIMITS, e.g. "Login.jsp=1:3,AjaxFunctions.jsp=20:40" """
+    limits = dict(_DEFAULT_RATE_LIMITS)
+    for entry in os.getenv("UPSTREAM_RATE_LIMITS", "").split(","):
+        if "=" not in entry:
+            continue
+        endpoint, limit = entry.split("=", 1)
+        rate, _, burst = limit.partition(":")
+        limits[endpoint.strip()] = (float(rate), int(burst or max(1, float(rate))))
+    return limits
+
+
+class UpstreamUnavailable(Exception):
+    """Base for upstream requests that could not be answered, not even from a stale copy"""
+
+    message = "Upstream {endpoint} is unavailable, try again shortly"
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(self.message.format(endpoint=endpoint))
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class UpstreamBusy(UpstreamUnavailable):
+    """Raised when an endpoint's rate budget stays exhausted for the whole queue timeout"""
+
+    message = "Upstream {endpoint} is busy, try again shortly"
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """Raised without contacting upstream while an endpoint's circuit breaker is open"""
+
+
+class UpstreamFailed(UpstreamUnavailable):
+    """Raised when every attempt at a request failed"""
+
+
+def _outcome(error: UpstreamUnavailable) -> str:
+    if isinstance(error, UpstreamBusy):
+        return "busy"
+    if isinstance(error, CircuitOpen):
+        return "circuit_open"
+    return "failed"
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _wait_time(self, reserve: float = 0.0) -> float:
+        return max(0.0, (1 + reserve - self.tokens) / self.rate)
+
+    def try_acquire(self, reserve: float = 0.0) -> bool:
+        """Take a token only if one is free right now, leaving `reserve` tokens untouched"""
+        self._refill()
+        if self.tokens < 1 + reserve:
+            return False
+        self.tokens -= 1
+        return True
+
+    def reserve(self, level: Priority) -> float:
+        """Tokens `level` must leave for higher classes, never so many that it can't take one at all"""
+        return min(self.burst * level.rate_reserve, self.burst - 1.0)
+
+    async def acquire(self, endpoint: str, timeout: float, reserve: float = 0.0) -> None:
+        """Wait for a token, giving up once `timeout` seconds can't be kept
+
+        Callers with a `reserve` only take a token while that many remain afterwards,
+        so they back off first whenever the budget runs low.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire(reserve):
+            wait = self._wait_time(reserve)
+            if time.monotonic() + wait > deadline:
+                raise UpstreamBusy(endpoint, wait)
+            await asyncio.sleep(wait)
+
+class _CircuitBreaker:
+    """Opens after consecutive failures, then lets a single trial request through per reset period"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.retry_after == 0 and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """Let another trial through after one ended without reaching upstream or hearing back
+
+        A trial that was cancelled, ran out of rate budget or broke unexpectedly says
+        nothing about upstream, so the circuit stays as it was rather than reopening.
+        """
+        self.trial_in_flight = False
+
+
+class _ServerError(Exception):
+    pass
+
+
+class _Upstream:
+    def __init__(self):
+        self.limits = _rate_limits()
+        self.buckets: Dict[str, _TokenBucket] = {}
+        self.breakers: Dict[str, _CircuitBreaker] = {}
+        self.latencies: Dict[str, Deque[float]] = {}
+        # Last good body per request, served when the rate budget runs out
+        self.stale = LRUCache(max_entries=STALE_CACHE_SIZE, name="upstream_stale")
+
+    def bucket(self, endpoint: str) -> _TokenBucket:
+        if endpoint not in self.buckets:
+            self.buckets[endpoint] = _TokenBucket(*self.limits.get(endpoint, _FALLBACK_RATE_LIMIT))
+        return self.buckets[endpoint]
+
+    def breaker(self, endpoint: str) -> _CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = _CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        return self.breakers[endpoint]
+
+    def p95(self, endpoint: str) -> Optional[float]:
+        samples = self.latencies.get(endpoint)
+        if not samples or len(samples) < _MIN_HEDGE_SAMPLES:
+            return None
+        return sorted(samples)[int(len(samples) * 0.95) - 1]
+
+    def stats(self) -> dict:
+        endpoints = {}
+        for endpoint, bucket in self.buckets.items():
+            bucket._refill()
+            breaker = self.breaker(endpoint)
+            endpoints[endpoint] = {
+                "tokens": round(bucket.tokens, 2),
+                "circuit": "closed" if breaker.opened_at is None else "open",
+                "p95": self.p95(endpoint),
+            }
+        return {"priorities": scheduler.stats(), "endpoints": endpoints}
+
+    async def _get(self, session: ClientSession, endpoint: str, path: str, params: Optional[dict]) -> Tuple[int, str]:
+        started = time.monotonic()
+        async with session.get(
+            f"{BASE_URL}/{path}", params=params, timeout=ClientTimeout(total=UPSTREAM_TIMEOUT)
+        ) as response:
+            if response.status >= 500:
+                raise _ServerError(f"{endpoint} answered {response.status}")
+            body = await response.read()
+            if recorder.enabled:
+                recorder.record(path, params, response.status, response.content_type, body, response.get_encoding())
+        elapsed = time.monotonic() - started
+        self.latencies.setdefault(endpoint, deque(maxlen=_LATENCY_SAMPLES)).append(elapsed)
+        _attempt_seconds.observe(elapsed, endpoint=endpoint)
+        _response_bytes.observe(len(body), endpoint=endpoint)
+        with stage("decode", endpoint=endpoint):
+            return response.status, body.decode(response.get_encoding())
+
+    async def _attempt(self, session: ClientSession, endpoint: str, path: str, params: Optional[dict]) -> Tuple[int, str]:
+        hedge_after = self.p95(endpoint) if UPSTREAM_HEDGE else None
+        if hedge_after is None:
+            return await self._get(session, endpoint, path, params)
+
+        bucket = self.bucket(endpoint)
+        first = asyncio.ensure_future(self._get(session, endpoint, path, params))
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        # Hedges only spend spare rate budget, never queue for it
+        if done or not bucket.try_acquire(bucket.reserve(current_priority())):
+            return await first
+
+        pending = {first, asyncio.ensure_future(self._get(session, endpoint, path, params))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _queue_timeout(self, level: Priority) -> float:
+        return UPSTREAM_QUEUE_TIMEOUT if level == Priority.LIVE else UPSTREAM_BACKGROUND_QUEUE_TIMEOUT
+
+    async def _fetch(self, session: ClientSession, endpoint: str, path: str, params: Optional[dict]) -> Tuple[int, str]:
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpen(endpoint, breaker.retry_after)
+        # Only the half open trial leaves the breaker waiting on this request's outcome
+        trial = breaker.trial_in_flight
+        try:
+            return await self._fetch_allowed(session, endpoint, path, params, breaker)
+        finally:
+            if trial and breaker.trial_in_flight:
+                breaker.release_trial()
+
+    async def _fetch_allowed(
+        self, session: ClientSession, endpoint: str, path: str, params: Optional[dict], breaker: _CircuitBreaker
+    ) -> Tuple[int, str]:
+        level = current_priority()
+        bucket = self.bucket(endpoint)
+        for attempt in range(UPSTREAM_RETRIES + 1):
+            queued_at = time.perf_counter()
+            # Waiting for rate budget happens before taking a slot, so nobody sleeps on one
+            await bucket.acquire(endpoint, self._queue_timeout(level), reserve=bucket.reserve(level))
+            async with scheduler.slot(level):
+                _wait_seconds.observe(time.perf_counter() - queued_at, endpoint=endpoint, priority=level.name.lower())
+                try:
+                    answer = await self._attempt(session, endpoint, path, params)
+                except (ClientError, asyncio.TimeoutError, _ServerError) as e:
+                    error = e
+                else:
+                    breaker.record_success()
+                    return answer
+
+            breaker.record_failure()
+            _requests.inc(endpoint=endpoint, outcome="error")
+            if attempt == UPSTREAM_RETRIES or not breaker.allow():
+                raise UpstreamFailed(endpoint, breaker.retry_after) from error
+            # Full jitter keeps retries from many requests from arriving in lockstep
+            await asyncio.sleep(random.uniform(0, UPSTREAM_BACKOFF * 2 ** attempt))
+
+    async def fetch_text(
+        self,
+        session: ClientSession,
+        path: str,
+        params: Optional[dict] = None,
+        allow_stale: bool = True,
+    ) -> str:
+        """GET `path` on TrackWrestling and return the body
+
+        Requests spend the endpoint's rate budget, failed attempts are retried with
+        jittered backoff, and an endpoint that keeps failing has its circuit opened.
+        Whenever no fresh answer can be had, the last successful body seen for the
+        same request is returned instead.
+
+        Args:
+            session (ClientSession): Session to issue the request with
+            path (str): Path relative to BASE_URL, e.g. "predefinedtournaments/TournamentHub.jsp"
+            params (dict, optional): Query parameters. Defaults to None.
+            allow_stale (bool, optional): Whether an earlier response for the same request may be
+                returned instead. Defaults to True.
+
+        Raises:
+            UpstreamUnavailable: If there is no fresh answer and no earlier response can stand in
+        """
+        endpoint = path.rsplit("/", 1)[-1]
+        # TIM is a cache busting timestamp and doesn't identify the request
+        key = request_key(path, params)
+        try:
+            with stage("upstream", endpoint=endpoint):
+                status, text = await self._fetch(session, endpoint, path, params)
+        except UpstreamUnavailable as e:
+            stale = self.stale.get(key) if allow_stale else None
+            if stale is None:
+                _requests.inc(endpoint=endpoint, outcome=_outcome(e))
+                raise
+            _requests.inc(endpoint=endpoint, outcome="stale")
+            return stale
+
+        _requests.inc(endpoint=endpoint, outcome="ok")
+        # An error page or a refusal is no answer to fall back on later
+        if allow_stale and 200 <= status < 300:
+            self.stale.set(key, text)
+        return text
+
+    async def stream_text(
+        self,
+        session: ClientSession,
+        path: str,
+        params: Optional[dict] = None,
+        chunk_size: int = UPSTREAM_STREAM_CHUNK_SIZE,
+    ) -> AsyncIterator[str]:
+        """GET `path` on TrackWrestling and yield the body as it is decoded, chunk by chunk
+
+        Goes through the same rate budget, priority scheduling and circuit breaker as
+        fetch_text, so the body can be parsed while the rest of it is still arriving.
+        A failed attempt is only retried while nothing has been yielded yet, and no
+        stale copy is kept since the whole body is never held at once. A scheduler
+        slot is only held until the response headers arrive, so a slow consumer
+        doesn't keep other requests waiting. Consume it inside contextlib.aclosing so
+        an abandoned stream frees its connection.
+
+        Raises:
+            UpstreamUnavailable: If the request could not be answered
+        """
+        endpoint = path.rsplit("/", 1)[-1]
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            _requests.inc(endpoint=endpoint, outcome="circuit_open")
+            raise CircuitOpen(endpoint, breaker.retry_after)
+        trial = breaker.trial_in_flight
+        try:
+            level = current_priority()
+            bucket = self.bucket(endpoint)
+            for attempt in range(UPSTREAM_RETRIES + 1):
+                yielded = False
+                queued_at = time.perf_counter()
+                size = 0
+                # Recording is a development aid, holding the whole body is fine then
+                recorded = [] if recorder.enabled else None
+                try:
+                    try:
+                        await bucket.acquire(endpoint, self._queue_timeout(level), reserve=bucket.reserve(level))
+                    except UpstreamBusy:
+                        _requests.inc(endpoint=endpoint, outcome="busy")
+                        raise
+                    # The slot covers sending the request and waiting for its headers; the body is
+                    # read as fast as the consumer parses it, and a slow one mustn't hold up other requests
+                    async with scheduler.slot(level):
+                        _wait_seconds.observe(time.perf_counter() - queued_at, endpoint=endpoint, priority=level.name.lower())
+                        # The consumer parses between reads, so only time out on a stalled socket
+                        response = await session.get(
+                            f"{BASE_URL}/{path}",
+                            params=params,
+                            timeout=ClientTimeout(sock_connect=UPSTREAM_TIMEOUT, sock_read=UPSTREAM_TIMEOUT),
+                        )
+                    async with response:
+                        if response.status >= 500:
+                            raise _ServerError(f"{endpoint} answered {response.status}")
+                        # Multi-byte characters may straddle chunks, so decode incrementally
+                        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")("replace")
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            size += len(chunk)
+                            if recorded is not None:
+                                recorded.append(chunk)
+                            text = decoder.decode(chunk)
+                            if text:
+                                yielded = True
+                                yield text
+                        text = decoder.decode(b"", final=True)
+                        if text:
+                            yield text
+                except (ClientError, asyncio.TimeoutError, _ServerError) as e:
+                    error = e
+                else:
+                    # Not a latency sample for hedging, the time includes the consumer's parsing
+                    breaker.record_success()
+                    _requests.inc(endpoint=endpoint, outcome="ok")
+                    _response_bytes.observe(size, endpoint=endpoint)
+                    if recorded is not None:
+                        recorder.record(
+                            path, params, response.status, response.content_type, b"".join(recorded),
+                            response.charset or "utf-8",
+                        )
+                    return
+
+                breaker.record_failure()
+                _requests.inc(endpoint=endpoint, outcome="error")
+                if yielded or attempt == UPSTREAM_RETRIES or not breaker.allow():
+                    _requests.inc(endpoint=endpoint, outcome="failed")
+                    raise UpstreamFailed(endpoint, breaker.retry_after) from error
+                await asyncio.sleep(random.uniform(0, UPSTREAM_BACKOFF * 2 ** attempt))
+        finally:
+            # Includes a consumer abandoning the stream, which closes the generator here
+            if trial and breaker.trial_in_flight:
+                breaker.release_trial()
+
+upstream = _Upstream()